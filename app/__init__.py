@@ -1,9 +1,16 @@
-from flask import Flask
+from flask import Flask, g
 from flask_login import LoginManager
 from config import config
 from app.models import db, User
 from app.utils.firebase_client import init_firebase
+from app.utils.firestore_cache import init_firestore_cache
 from app.utils.email_helper import mail
+from app.utils.fleet_index import init_fleet_index
+from app.utils.vehicle_search import init_vehicle_search
+from app.utils.fleet_stream import init_fleet_stream
+from app.utils.range_model import init_range_model
+from app.utils.geofence import init_geofence_monitor
+from app.utils.anomaly_detector import init_anomaly_detector
 
 login_manager = LoginManager()
 
@@ -23,6 +30,12 @@ def create_app(config_name='development'):
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Vui lòng đăng nhập để truy cập trang này.'
     login_manager.login_message_category = 'warning'
+    init_fleet_index(app)
+    init_vehicle_search(app)
+    init_fleet_stream(app)
+    init_range_model(app)
+    init_geofence_monitor(app)
+    init_anomaly_detector(app)
     
     @login_manager.user_loader
     def load_user(user_id):
@@ -31,6 +44,9 @@ def create_app(config_name='development'):
     # Disable template caching for development
     @app.after_request
     def add_header(response):
+        if g.get('keep_cache_control'):
+            # View tự đặt Cache-Control (vd: feed vùng nguy hiểm dùng ETag/304)
+            return response
         response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
         response.headers['Pragma'] = 'no-cache'
         response.headers['Expires'] = '-1'
@@ -45,6 +61,7 @@ def create_app(config_name='development'):
     from app.controllers.admin_controller import admin_bp
     from app.controllers.emergency_controller import emergency_bp
     from app.controllers.notification_controller import notification_bp
+    from app.controllers.iot_controller import iot_bp
     
     app.register_blueprint(main_bp)
     app.register_blueprint(auth_bp)
@@ -54,12 +71,31 @@ def create_app(config_name='development'):
     app.register_blueprint(admin_bp)
     app.register_blueprint(emergency_bp)
     app.register_blueprint(notification_bp)
+    app.register_blueprint(iot_bp)
+    
+    # CLI commands
+    from app.utils.vehicle_stats import register_cli as register_vehicle_stats_cli
+    register_vehicle_stats_cli(app)
+    from app.utils.telemetry_state import register_cli as register_telemetry_state_cli
+    register_telemetry_state_cli(app)
+    from app.utils.telemetry_store import register_cli as register_telemetry_store_cli
+    register_telemetry_store_cli(app)
+    from app.utils.columnar_archive import register_cli as register_archive_cli
+    register_archive_cli(app)
+    from app.utils.trace_codec import register_cli as register_trace_cli
+    register_trace_cli(app)
+    from app.utils.maintenance_planner import register_cli as register_maintenance_cli
+    register_maintenance_cli(app)
     
     # Create tables
     with app.app_context():
         # Initialize Firebase (optional)
         init_firebase(app)
+        init_firestore_cache(app)
         db.create_all()
+        # Add columns/indexes introduced after the tables were created
+        from app.utils.schema import upgrade_schema
+        upgrade_schema(db)
     
     # Start background scheduler for auto-release expired bookings
     from app.utils.scheduler import start_scheduler
@@ -3,9 +3,14 @@ from flask_login import login_required, current_user
 from app.models import db, User, Vehicle, Booking, Trip, Payment, Maintenance, EmergencyAlert, IoTLog, HazardZone
 from datetime import datetime, timedelta
 from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import joinedload
 from functools import wraps
 from app.utils.repositories import VehicleRepository
 from app.utils.hazard_checker import calculate_polygon_bounds, get_severity_color, get_hazard_type_icon
+from app.utils.hazard_index import hazard_index, get_effective_zones
+from app.utils.fleet_index import fleet_index, fleet_index_enabled, vehicle_to_dict
+from app.utils.regions import REGIONS, DEFAULT_REGION, in_region, region_name
+from app.utils.telemetry_state import latest_by_vehicle
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -41,7 +46,7 @@ def dashboard():
         'active_trips': Trip.query.filter_by(status='in_progress').count(),
         'pending_maintenances': Maintenance.query.filter_by(status='scheduled').count(),
         'open_alerts': EmergencyAlert.query.filter_by(status='open').count(),
-        'hazard_zones': HazardZone.query.filter_by(is_active=True).count()
+        'hazard_zones': len(get_effective_zones())
     }
     
     # Revenue chart data (last 7 days)
@@ -237,16 +242,21 @@ def manage_vehicles():
     """Quản lý phương tiện"""
     page = request.args.get('page', 1, type=int)
     status = request.args.get('status', 'all')
+    region = request.args.get('region', 'all')
     per_page = 20
     
-    query = Vehicle.query
+    # Thống kê tích lũy đi kèm trong cùng một query (không đếm Trip theo từng xe)
+    query = Vehicle.query.options(joinedload(Vehicle.stats))
     if status != 'all':
         query = query.filter_by(status=status)
+    query = in_region(query, Vehicle, None if region == 'all' else region)
     
     vehicles = query.order_by(Vehicle.created_at.desc())\
         .paginate(page=page, per_page=per_page, error_out=False)
     
-    return render_template('admin/vehicles.html', vehicles=vehicles, status=status)
+    regions = [(code, region_name(code)) for code in REGIONS] + [(DEFAULT_REGION, region_name(DEFAULT_REGION))]
+    return render_template('admin/vehicles.html', vehicles=vehicles, status=status,
+                           region=region, regions=regions)
 
 
 @admin_bp.route('/vehicles/add', methods=['GET', 'POST'])
@@ -394,6 +404,32 @@ def schedule_maintenance():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/maintenance/<int:maintenance_id>/complete', methods=['POST'])
+@login_required
+@admin_required
+def complete_maintenance(maintenance_id):
+    """Hoàn tất bảo trì (bảo dưỡng định kỳ đặt lại bộ đếm km của xe)"""
+    from app.utils.maintenance_planner import complete_maintenance as mark_completed
+    from app.utils.fleet_index import fleet_index
+    maintenance = Maintenance.query.get_or_404(maintenance_id)
+    
+    if maintenance.status == 'completed':
+        return jsonify({'error': 'Bảo trì đã hoàn tất'}), 400
+    
+    try:
+        mark_completed(maintenance)
+        db.session.commit()
+        fleet_index.refresh_ids([maintenance.vehicle_id])
+        return jsonify({
+            'success': True,
+            'maintenance_code': maintenance.maintenance_code,
+            'vehicle_status': maintenance.vehicle.status
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @admin_bp.route('/alerts')
 @login_required
 @admin_required
@@ -492,27 +528,114 @@ def iot_monitor():
     """Real-time IoT monitoring dashboard"""
     from flask import current_app
     # Only get motorbikes and cars
-    vehicles = Vehicle.query.filter(Vehicle.vehicle_type.in_(['motorbike', 'car'])).all()
+    if fleet_index_enabled():
+        fleet_index.ensure_loaded()
+        vehicles = fleet_index.select(types=['motorbike', 'car'])
+    else:
+        vehicles = [vehicle_to_dict(v) for v in
+                    Vehicle.query.filter(Vehicle.vehicle_type.in_(['motorbike', 'car'])).all()]
+    
+    # Latest telemetry: one read of the state table (one row per vehicle)
+    telemetry = latest_by_vehicle(stale_seconds=current_app.config.get('IOT_TELEMETRY_STALE_SECONDS', 300))
     
     # Prepare vehicle data for real-time display
-    vehicle_data = [{
-        'id': v.id,
-        'brand': v.brand,
-        'model': v.model,
-        'license_plate': v.license_plate,
-        'vehicle_type': v.vehicle_type,
-        'status': v.status,
-        'latitude': float(v.latitude) if v.latitude else 10.8231,
-        'longitude': float(v.longitude) if v.longitude else 106.6297,
-        'battery_level': v.battery_level or 100,
-        'fuel_level': v.fuel_level or 100
-    } for v in vehicles]
+    vehicle_data = []
+    for v in vehicles:
+        state = telemetry.get(v['id']) or {}
+        battery = state.get('battery_level')
+        fuel = state.get('fuel_level')
+        vehicle_data.append({
+            'id': v['id'],
+            'brand': v['brand'],
+            'model': v['model'],
+            'license_plate': v['license_plate'],
+            'vehicle_type': v['vehicle_type'],
+            'status': v['status'],
+            'latitude': float(v['latitude']) if v['latitude'] else 10.8231,
+            'longitude': float(v['longitude']) if v['longitude'] else 106.6297,
+            'battery_level': (battery if battery is not None else v['battery_level']) or 100,
+            'fuel_level': (fuel if fuel is not None else v['fuel_level']) or 100,
+            'speed': state.get('speed'),
+            'engine_status': state.get('engine_status'),
+            'temperature': state.get('temperature'),
+            'last_seen': state['timestamp'].isoformat() + 'Z' if state else None,
+            'online': state.get('online', False)
+        })
     
     
     return render_template('admin/iot_monitor.html', 
                          vehicles=vehicle_data)
 
 
+@admin_bp.route('/api/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    """API: Thống kê cache (Firestore: độ trễ, cache hit / truy vấn trực tiếp; OSRM theo khu vực)"""
+    from flask import current_app
+    from app.utils.route_optimizer import osrm_route_cache
+    cache = current_app.extensions.get('firestore_cache')
+    return jsonify({
+        'success': True,
+        'firestore_vehicles': cache.stats() if cache else None,
+        'osrm_routes': osrm_route_cache.stats()
+    })
+
+
+def _parse_utc(value):
+    """ISO 8601 -> datetime UTC không timezone (như cột timestamp của telemetry)"""
+    ts = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+    if ts.tzinfo is not None:
+        ts = datetime.utcfromtimestamp(ts.timestamp())
+    return ts
+
+
+@admin_bp.route('/api/vehicles/<int:vehicle_id>/telemetry')
+@login_required
+@admin_required
+def vehicle_telemetry_history(vehicle_id):
+    """
+    API: Lịch sử telemetry của một xe, đọc từ bảng thô hoặc bảng tổng hợp
+    1 phút / 1 giờ (bảng thô nhất vẫn trả lời được yêu cầu)
+
+    Query params:
+        start, end: ISO 8601 (không có offset thì hiểu là UTC), mặc định 24 giờ gần nhất
+        max_points: Số điểm tối đa mong muốn (mặc định 500)
+        resolution: Độ rộng khoảng tối đa chấp nhận, giây (0 = mẫu thô)
+    """
+    from app.utils.telemetry_store import query_telemetry
+    Vehicle.query.get_or_404(vehicle_id)
+
+    try:
+        end = _parse_utc(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = _parse_utc(request.args['start']) if request.args.get('start') \
+            else end - timedelta(hours=24)
+        max_points = request.args.get('max_points', 500, type=int)
+        resolution = request.args.get('resolution', 0, type=int)
+    except ValueError:
+        return jsonify({'error': 'Invalid start/end'}), 400
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+
+    try:
+        result = query_telemetry([vehicle_id], start, end, resolution_seconds=resolution,
+                                 max_points=max_points or None)
+    except Exception as e:
+        print(f'[Error] Reading telemetry history: {e}')
+        return jsonify({'error': str(e)}), 500
+
+    points = [{key: value.isoformat() + 'Z' if isinstance(value, datetime) else value
+               for key, value in point.items()} for point in result['points']]
+    return jsonify({
+        'success': True,
+        'vehicle_id': vehicle_id,
+        'level': result['level'],
+        'bucket_seconds': result['bucket_seconds'],
+        'count': len(points),
+        'points': points
+    })
+
+
 @admin_bp.route('/heatmap')
 @login_required
 @admin_required
@@ -740,8 +863,8 @@ def hazard_zones():
     """Trang quản lý vùng nguy hiểm"""
     zones = HazardZone.query.order_by(HazardZone.created_at.desc()).all()
     
-    # Statistics
-    active_zones = HazardZone.query.filter_by(is_active=True).count()
+    # Statistics (only zones inside their time window)
+    active_zones = len(get_effective_zones())
     total_warnings = db.session.query(func.sum(HazardZone.warning_count)).scalar() or 0
     
     return render_template('admin/hazard_zones.html',
@@ -842,6 +965,7 @@ def create_hazard_zone():
         
         db.session.add(new_zone)
         db.session.commit()
+        hazard_index.invalidate()
         
         print(f"[SUCCESS] Created hazard zone: {new_zone.zone_code} - {new_zone.zone_name}")
         
@@ -877,6 +1001,7 @@ def delete_hazard_zone(zone_id):
         # Soft delete by marking as inactive
         zone.is_active = False
         db.session.commit()
+        hazard_index.invalidate()
         
         return jsonify({
             'success': True,
@@ -897,6 +1022,7 @@ def toggle_hazard_zone(zone_id):
         zone = HazardZone.query.get_or_404(zone_id)
         zone.is_active = not zone.is_active
         db.session.commit()
+        hazard_index.invalidate()
         
         status = "kích hoạt" if zone.is_active else "vô hiệu hóa"
         return jsonify({
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required, current_user
 from app.models import db, EmergencyAlert, Vehicle, Trip
 from datetime import datetime
+from app.utils.fleet_index import fleet_index, fleet_index_enabled
 
 emergency_bp = Blueprint('emergency', __name__, url_prefix='/emergency')
 
@@ -118,7 +119,11 @@ def my_alerts():
         is_admin = False
     
     # Get available motorbikes and cars for the emergency form (only these 2 types)
-    user_vehicles = Vehicle.query.filter(Vehicle.vehicle_type.in_(['motorbike', 'car'])).all()
+    if fleet_index_enabled():
+        fleet_index.ensure_loaded()
+        user_vehicles = fleet_index.select(types=['motorbike', 'car'])
+    else:
+        user_vehicles = Vehicle.query.filter(Vehicle.vehicle_type.in_(['motorbike', 'car'])).all()
     
     return render_template('emergency/my_alerts.html', alerts=alerts, is_admin=is_admin, user_vehicles=user_vehicles)
 
@@ -0,0 +1,64 @@
+"""IoT Controller - Nhận dữ liệu telemetry từ thiết bị trên xe"""
+import hmac
+from flask import Blueprint, jsonify, request, current_app
+from app.utils.telemetry_ingest import ingest_batch
+
+iot_bp = Blueprint('iot', __name__, url_prefix='/iot')
+
+
+def _device_authorized() -> bool:
+    """Thiết bị gửi khóa chung trong header X-Device-Key"""
+    expected = current_app.config.get('IOT_DEVICE_KEY', '')
+    provided = request.headers.get('X-Device-Key', '')
+    return bool(expected) and hmac.compare_digest(provided.encode(), expected.encode())
+
+
+@iot_bp.route('/api/telemetry', methods=['POST'])
+def ingest_telemetry():
+    """
+    API nhận một lô telemetry từ nhiều xe
+    ITS Feature: Fleet Management (vehicle telematics)
+
+    Headers:
+        X-Device-Key: Khóa thiết bị (IOT_DEVICE_KEY)
+
+    Body: {"records": [...]} hoặc một mảng record, mỗi record:
+        {
+            "vehicle_id": 12,                      (bắt buộc)
+            "timestamp": "2024-05-01T08:00:00Z",   (ISO 8601 hoặc epoch giây/ms, mặc định: lúc nhận)
+            "battery_level": 80, "fuel_level": 55, "tire_pressure": 32,
+            "speed": 25.5, "latitude": 10.77, "longitude": 106.70,
+            "engine_status": "on", "temperature": 41.2
+        }
+
+    Returns:
+        JSON: {'success', 'accepted', 'rejected', 'vehicles', 'errors': [[index, lỗi], ...], 'elapsed_ms'}
+
+    Raises:
+        400: Body không hợp lệ
+        401: Sai khóa thiết bị
+        413: Lô vượt quá IOT_INGEST_MAX_BATCH
+        503: Chưa cấu hình IOT_DEVICE_KEY
+        500: Lỗi ghi database
+    """
+    if not current_app.config.get('IOT_DEVICE_KEY'):
+        return jsonify({'error': 'Telemetry ingestion is not configured'}), 503
+    if not _device_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json(silent=True)
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({'error': 'Missing records'}), 400
+
+    max_batch = current_app.config.get('IOT_INGEST_MAX_BATCH', 5000)
+    if len(records) > max_batch:
+        return jsonify({'error': f'Tối đa {max_batch} records mỗi request'}), 413
+
+    try:
+        result = ingest_batch(records)
+    except Exception as e:
+        print(f'[Error] Ingesting telemetry: {e}')
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(dict(result, success=True))
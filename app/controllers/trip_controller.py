@@ -1,13 +1,20 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, Response, g
 from flask_login import login_required, current_user
 from app.models import db, Trip, Booking, Vehicle, Payment, User, HazardZone
 from app.utils.repositories import TripRepository, BookingRepository, PaymentRepository, VehicleRepository
 from app.utils.notification_helper import notify_payment_deduct, notify_trip_completed
 from app.utils.route_optimizer import optimize_route, predict_traffic
 from app.utils.email_helper import generate_otp, verify_otp, send_otp_email, send_unlock_notification
-from app.utils.hazard_checker import check_route_hazards, interpolate_route_points, get_hazard_type_icon, get_severity_icon
+from app.utils.hazard_checker import check_route_hazards, interpolate_route_points, get_hazard_type_icon, get_severity_icon, \
+    check_routes_hazards_batch, decode_polyline
+from app.utils.hazard_index import get_effective_zones
+from app.utils.hazard_feed import build_hazard_feed, feed_etag
+from app.utils.regions import regions_for_points
+from app.utils.trip_hazard_monitor import trip_hazard_monitor
+from app.utils.vehicle_stats import record_trip_completed
+from app.utils.trace_codec import build_trip_trace, trip_trace_points
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, case
 import math
 
 trip_bp = Blueprint('trip', __name__, url_prefix='/trips')
@@ -425,7 +432,21 @@ def end_trip(trip_id):
     
     try:
         db.session.add(payment)
+        # Thống kê tích lũy của xe - cùng transaction với chuyến đi
+        record_trip_completed(vehicle.id, trip.distance_km, trip.total_cost, trip.end_time)
         db.session.commit()
+        trip_hazard_monitor.end_trip(trip.id)
+        
+        # Lưu lộ trình GPS từ telemetry dạng nhị phân nén (delta + varint).
+        # Transaction riêng sau khi chuyến đi đã commit: lỗi đọc telemetry
+        # (trên PostgreSQL làm hỏng cả transaction) không chặn việc kết thúc
+        # chuyến; thiếu trace thì /api/trace tự dựng lại từ telemetry
+        try:
+            trip.route_trace = build_trip_trace(trip)
+            db.session.commit()
+        except Exception as trace_error:
+            db.session.rollback()
+            print(f'[Trip] Could not build route trace for trip {trip.id}: {trace_error}')
         
         # Send notifications
         try:
@@ -729,6 +750,52 @@ def rate_trip(trip_id):
 # HAZARD ZONE CHECK (ITS Feature)
 # ============================================
 
+@trip_bp.route('/api/hazard-zones')
+@login_required
+def hazard_zones_feed():
+    """
+    API: Vùng nguy hiểm cho bản đồ (GeoJSON), lọc theo viewport và zoom
+    ITS Feature: Traveler Information System
+
+    Query Parameters:
+        bbox (str): "min_lat,min_lng,max_lat,max_lng" (tùy chọn)
+        zoom (int): Mức zoom bản đồ, quyết định độ đơn giản hóa polygon (mặc định 14)
+        since_version (int): Version lần đồng bộ trước - chỉ trả về vùng thay đổi
+        epoch (str): Epoch lần đồng bộ trước (khác epoch server => trả về toàn bộ)
+
+    Client phải bỏ since_version khi viewport hoặc zoom thay đổi.
+    Hỗ trợ ETag / If-None-Match (304 Not Modified).
+    """
+    try:
+        bbox = None
+        bbox_param = request.args.get('bbox')
+        if bbox_param:
+            try:
+                bbox = tuple(float(v) for v in bbox_param.split(','))
+            except ValueError:
+                bbox = ()
+            if len(bbox) != 4:
+                return jsonify({'error': 'bbox phải có dạng min_lat,min_lng,max_lat,max_lng'}), 400
+
+        feed = build_hazard_feed(
+            bbox=bbox,
+            zoom=request.args.get('zoom', 14, type=int),
+            since_version=request.args.get('since_version', type=int),
+            epoch=request.args.get('epoch')
+        )
+
+        response = jsonify(feed)
+        response.set_etag(feed_etag(feed))
+        # Cho phép trình duyệt cache nhưng phải xác thực lại bằng ETag (304)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        g.keep_cache_control = True
+        return response.make_conditional(request)
+
+    except Exception as e:
+        print(f"[Error] Loading hazard zone feed: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @trip_bp.route('/api/check-route-hazards', methods=['POST'])
 @login_required
 def check_route_for_hazards():
@@ -756,28 +823,9 @@ def check_route_for_hazards():
         print(f"[HazardCheck] Original route: {len(route_tuples)} points")
         print(f"[HazardCheck] Interpolated route: {len(interpolated_route)} points")
         
-        # Get all active hazard zones
-        active_zones = HazardZone.query.filter_by(is_active=True).all()
-        
-        # Convert to dict format for checker
-        zones_data = []
-        for zone in active_zones:
-            zones_data.append({
-                'id': zone.id,
-                'zone_code': zone.zone_code,
-                'zone_name': zone.zone_name,
-                'hazard_type': zone.hazard_type,
-                'severity': zone.severity,
-                'description': zone.description,
-                'warning_message': zone.warning_message,
-                'polygon_coordinates': zone.polygon_coordinates,
-                'min_latitude': zone.min_latitude,
-                'max_latitude': zone.max_latitude,
-                'min_longitude': zone.min_longitude,
-                'max_longitude': zone.max_longitude,
-                'color': zone.color,
-                'is_active': zone.is_active
-            })
+        # Get zones that are active and inside their time window (cached index),
+        # only for the region(s) the route passes through
+        zones_data = get_effective_zones(regions=regions_for_points(route_tuples))
         
         # Check route against hazards
         detected_hazards = check_route_hazards(interpolated_route, zones_data)
@@ -811,6 +859,179 @@ def check_route_for_hazards():
         return jsonify({'error': str(e)}), 500
 
 
+@trip_bp.route('/api/check-route-hazards/batch', methods=['POST'])
+@login_required
+def check_routes_for_hazards_batch():
+    """
+    API: Kiểm tra nhiều routes cùng lúc với một snapshot vùng nguy hiểm
+    ITS Feature: Traveler Information System (so sánh nhiều lộ trình / analytics backfill)
+    
+    Body: {
+        "routes": [
+            {"id": "r1", "polyline": "<encoded>", "precision": 5},
+            {"id": "r2", "points": [[lat, lng], ...]},
+            [[lat, lng], ...]
+        ],
+        "interpolate": true,
+        "count_warnings": true
+    }
+    """
+    try:
+        data = request.get_json() or {}
+        routes_in = data.get('routes', [])
+        max_routes = current_app.config.get('HAZARD_BATCH_MAX_ROUTES', 200)
+        
+        if not isinstance(routes_in, list) or not routes_in:
+            return jsonify({'error': 'Missing routes'}), 400
+        if len(routes_in) > max_routes:
+            return jsonify({'error': f'Tối đa {max_routes} routes mỗi request'}), 400
+        
+        # Parse routes (encoded polyline or point arrays)
+        route_ids = []
+        routes = []
+        for idx, item in enumerate(routes_in):
+            try:
+                if isinstance(item, dict):
+                    route_ids.append(item.get('id', idx))
+                    if item.get('polyline'):
+                        routes.append(decode_polyline(item['polyline'], int(item.get('precision', 5))))
+                    else:
+                        routes.append([(float(p[0]), float(p[1])) for p in item.get('points', [])])
+                else:
+                    route_ids.append(idx)
+                    routes.append([(float(p[0]), float(p[1])) for p in item])
+            except (TypeError, ValueError, IndexError):
+                return jsonify({'error': f'Route {idx} không hợp lệ'}), 400
+        
+        # One zone snapshot for the whole batch (regions touched by any route)
+        zones_data = get_effective_zones(regions=regions_for_points(p for route in routes for p in route))
+        interpolate_km = 0.1 if data.get('interpolate', True) else None
+        hits = check_routes_hazards_batch(routes, zones_data, interpolate_km=interpolate_km)
+        
+        # Zone details are returned once, routes only reference zone ids
+        zones_out = {}
+        warning_counts = {}
+        results = []
+        for route_id, route_hits in zip(route_ids, hits):
+            for zone in route_hits:
+                if zone['id'] not in zones_out:
+                    zone_info = dict(zone)
+                    zone_info['type_icon'] = get_hazard_type_icon(zone['hazard_type'])
+                    zone_info['severity_icon'] = get_severity_icon(zone['severity'])
+                    zones_out[zone['id']] = zone_info
+                warning_counts[zone['id']] = warning_counts.get(zone['id'], 0) + 1
+            results.append({
+                'id': route_id,
+                'hazard_ids': [zone['id'] for zone in route_hits],
+                'count': len(route_hits),
+                'has_hazards': len(route_hits) > 0
+            })
+        
+        # Single UPDATE for all warning counters
+        if warning_counts and data.get('count_warnings', True):
+            HazardZone.query.filter(HazardZone.id.in_(list(warning_counts))).update({
+                'warning_count': HazardZone.warning_count + case(warning_counts, value=HazardZone.id, else_=0)
+            }, synchronize_session=False)
+            db.session.commit()
+        
+        print(f"[HazardCheck] Batch: {len(routes)} routes, {len(zones_out)} distinct hazards")
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'zones': zones_out,
+            'count': len(results)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Error] Batch checking route hazards: {e}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+
+@trip_bp.route('/<int:trip_id>/position', methods=['POST'])
+@login_required
+def report_trip_position(trip_id):
+    """
+    API: Cập nhật vị trí GPS trong chuyến đi và cảnh báo khi đi vào vùng nguy hiểm
+    ITS Feature: Live Traveler Information (incremental hazard monitoring)
+    """
+    trip = Trip.query.get_or_404(trip_id)
+    
+    if trip.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    if trip.status != 'in_progress':
+        return jsonify({'error': 'Chuyến đi không hợp lệ'}), 400
+    
+    data = request.get_json() or {}
+    try:
+        lat = float(data.get('latitude'))
+        lng = float(data.get('longitude'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Missing location parameters'}), 400
+    
+    result = trip_hazard_monitor.update_position(trip.id, trip.user_id, lat, lng)
+    
+    entered = [{
+        'id': zone['id'],
+        'zone_name': zone['zone_name'],
+        'hazard_type': zone['hazard_type'],
+        'severity': zone['severity'],
+        'warning_message': zone['warning_message'],
+        'type_icon': get_hazard_type_icon(zone['hazard_type']),
+        'severity_icon': get_severity_icon(zone['severity'])
+    } for zone in result['entered']]
+    
+    return jsonify({
+        'success': True,
+        'entered': entered,
+        'inside_zone_ids': result['inside'],
+        'in_hazard_zone': len(result['inside']) > 0
+    })
+
+
+@trip_bp.route('/<int:trip_id>/api/trace')
+@login_required
+def trip_trace(trip_id):
+    """
+    API: Lộ trình GPS của chuyến đi để phát lại (replay)
+    ITS Feature: Trip replay
+    
+    Query params:
+        format: json (mặc định) hoặc binary (blob gốc, giải mã bằng app.utils.trace_codec)
+    """
+    trip = Trip.query.get_or_404(trip_id)
+    
+    if trip.user_id != current_user.id and current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    try:
+        if request.args.get('format') == 'binary':
+            blob = trip.route_trace or build_trip_trace(trip) or b''
+            return Response(blob, mimetype='application/octet-stream')
+        
+        points = [{
+            'lat': point.latitude,
+            'lng': point.longitude,
+            'timestamp': point.timestamp.isoformat() + 'Z'
+        } for point in trip_trace_points(trip)]
+        
+        return jsonify({
+            'success': True,
+            'trip_id': trip.id,
+            'status': trip.status,
+            'stored': trip.route_trace is not None,
+            'count': len(points),
+            'points': points
+        })
+    except Exception as e:
+        print(f'[Error] Trip trace: {e}')
+        return jsonify({'error': str(e)}), 500
+
+
 @trip_bp.route('/api/alternative-routes', methods=['POST'])
 @login_required
 def get_alternative_routes():
@@ -832,8 +1053,8 @@ def get_alternative_routes():
         
         print(f"[AlternativeRoutes] Calculating routes from ({start_lat}, {start_lng}) to ({end_lat}, {end_lng})")
         
-        # Get all active hazard zones
-        active_zones = HazardZone.query.filter_by(is_active=True).all()
+        # Get zones that are active and inside their time window (cached index)
+        active_zones = get_effective_zones(regions=regions_for_points([(start_lat, start_lng), (end_lat, end_lng)]))
         print(f"[AlternativeRoutes] Found {len(active_zones)} active hazard zones")
         
         # Calculate alternative routes
@@ -1,13 +1,40 @@
-from flask import Blueprint, render_template, request, jsonify, current_app
+from flask import Blueprint, render_template, request, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.models import db, Vehicle, Booking, Trip, IoTLog
+from app.models import db, Vehicle, Booking, Trip
 from datetime import datetime
-import math
-from sqlalchemy import func, and_
+import heapq
+import secrets
+from sqlalchemy import and_, or_
+from flask_sqlalchemy.pagination import Pagination
 from app.utils.repositories import VehicleRepository
+from app.utils.hazard_raster import hazard_raster
+from app.utils.geo import bbox_around, covering_geohashes, prefix_upper_bound
+from app.utils.route_optimizer import haversine_distance
+from app.utils.regions import regions_for_bbox, in_region
+from app.utils.fleet_index import fleet_index, fleet_index_enabled, vehicle_to_dict
+from app.utils.vehicle_search import vehicle_search, vehicle_search_enabled
+from app.utils.fleet_stream import FleetSubscriber, stream_events
+from app.utils.vehicle_stats import get_vehicle_stats
+from app.utils.telemetry_state import get_latest, latest_by_vehicle
+from app.utils.range_model import range_model
 
 vehicle_bp = Blueprint('vehicle', __name__, url_prefix='/vehicles')
 
+
+class _IdPagination(Pagination):
+    """Phân trang trên danh sách id đã lọc sẵn: chỉ truy vấn id của trang hiện tại"""
+
+    def _query_items(self):
+        ids = self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]
+        if not ids:
+            return []
+        by_id = {v.id: v for v in Vehicle.query.filter(Vehicle.id.in_(ids)).all()}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+
 @vehicle_bp.route('/')
 @login_required
 def list_vehicles():
@@ -17,6 +44,16 @@ def list_vehicles():
     per_page = 20
     search_query = request.args.get('search', '').strip()
 
+    if search_query and vehicle_search_enabled():
+        # Tra cứu và lọc trong search index (n-gram) thay vì ilike quét toàn bảng;
+        # phân trang id trong bộ nhớ để truy vấn chỉ bind id của một trang
+        ids = sorted(vehicle_search.search_ids(
+            search_query, status='available',
+            vehicle_type=None if vehicle_type == 'all' else vehicle_type
+        ))
+        vehicles = _IdPagination(page=page, per_page=per_page, error_out=False, ids=ids)
+        return render_template('vehicles/list.html', vehicles=vehicles, vehicle_type=vehicle_type, search_query=search_query)
+
     query = Vehicle.query.filter_by(status='available')
 
     if vehicle_type != 'all':
@@ -63,6 +100,18 @@ def vehicle_map():
     return render_template('vehicles/map.html', search_query=search_query)
 
 
+def _energy_levels(vehicle, state=None):
+    """(pin, xăng) của xe; ưu tiên telemetry mới nhất nếu có"""
+    if isinstance(vehicle, dict):
+        battery, fuel = vehicle.get('battery_level'), vehicle.get('fuel_level')
+    else:
+        battery, fuel = vehicle.battery_level, vehicle.fuel_level
+    if state:
+        battery = state['battery_level'] if state['battery_level'] is not None else battery
+        fuel = state['fuel_level'] if state['fuel_level'] is not None else fuel
+    return battery, fuel
+
+
 @vehicle_bp.route('/api/nearby')
 @login_required
 def nearby_vehicles():
@@ -80,17 +129,24 @@ def nearby_vehicles():
         type (str): Loại xe ('all', 'motorbike', 'car', mặc định 'all')
         show_all (bool): Hiển thị tất cả xe (bao gồm không khả dụng, cho debug)
         search (str): Từ khóa tìm kiếm (brand, model, license_plate, vehicle_code)
+        limit / k (int): Chỉ trả về k xe gần nhất (tùy chọn, tối đa NEARBY_MAX_LIMIT)
+        cursor (str): next_cursor của trang trước để lấy k xe tiếp theo
+        trip_distance_km (float): Quãng đường dự định đi - chỉ trả về xe đủ pin/xăng
+        dest_lat, dest_lng (float): Điểm đến (thay cho trip_distance_km, ước tính theo đường chim bay x hệ số đường vòng)
+        sort (str): 'distance' (mặc định) hoặc 'range' (tầm hoạt động còn lại giảm dần, trong trang hiện tại)
 
     Returns:
         JSON: {
-            'vehicles': [danh sách xe với thông tin chi tiết],
+            'vehicles': [danh sách xe với thông tin chi tiết, kèm in_hazard_zone và estimated_range_km],
             'count': số lượng xe,
             'status_counts': thống kê theo trạng thái,
-            'available_count': số xe khả dụng
+            'available_count': số xe khả dụng,
+            'next_cursor': cursor trang tiếp theo (chỉ khi có limit, None nếu hết),
+            'required_range_km': tầm hoạt động tối thiểu đã lọc (None nếu không lọc)
         }
 
     Raises:
-        400: Thiếu tham số vị trí (lat, lng)
+        400: Thiếu tham số vị trí (lat, lng), cursor hoặc quãng đường không hợp lệ
     """
     # Lấy các tham số từ query string
     lat = request.args.get('lat', type=float)  # Vĩ độ người dùng
@@ -99,12 +155,40 @@ def nearby_vehicles():
     vehicle_type = request.args.get('type', 'all')  # Loại xe cần lọc
     show_all = request.args.get('show_all', 'false') == 'true'  # Chế độ debug
     search_query = request.args.get('search', '').strip()  # Từ khóa tìm kiếm
+    limit = request.args.get('limit', type=int) or request.args.get('k', type=int)  # Top-k
+    cursor_param = request.args.get('cursor')
+    trip_distance = request.args.get('trip_distance_km', type=float)  # Quãng đường dự định (km)
+    dest_lat = request.args.get('dest_lat', type=float)
+    dest_lng = request.args.get('dest_lng', type=float)
+    sort_by = request.args.get('sort', 'distance')
 
     # Validate tham số bắt buộc
     if not lat or not lng:
         return jsonify({'error': 'Missing location parameters'}), 400
 
+    if limit is not None:
+        limit = max(1, min(limit, current_app.config.get('NEARBY_MAX_LIMIT', 200)))
+    after = None
+    if cursor_param:
+        after = decode_nearby_cursor(cursor_param)
+        if after is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Tầm hoạt động tối thiểu: quãng đường chuyến đi x hệ số an toàn
+    if trip_distance is None and dest_lat is not None and dest_lng is not None:
+        trip_distance = calculate_distance(lat, lng, dest_lat, dest_lng) * \
+            current_app.config.get('RANGE_DETOUR_FACTOR', 1.3)
+    if trip_distance is not None and trip_distance < 0:
+        return jsonify({'error': 'Invalid trip distance'}), 400
+    required_range = None
+    if trip_distance is not None:
+        required_range = trip_distance * current_app.config.get('RANGE_SAFETY_FACTOR', 1.2)
+        # Chỉ lọc theo tầm hoạt động mới cần hệ số đã fit (fit chạy nền, không chặn request)
+        range_model.ensure_fitted()
+    range_rates = range_model.rates()
+
     vehicles = []
+    telemetry = {}  # vehicle_id -> telemetry mới nhất (nhánh SQL)
 
     # Kiểm tra xem có sử dụng Firebase hay không
     if current_app.config.get('FIREBASE_ENABLED', False):
@@ -119,6 +203,22 @@ def nearby_vehicles():
         else:
             # Lấy xe khả dụng từ Firebase repository
             vehicles = VehicleRepository.list_available(vehicle_type)
+    elif fleet_index_enabled() and (not search_query or vehicle_search_enabled()):
+        # Đọc từ fleet index trong bộ nhớ (không truy vấn ORM)
+        fleet_index.ensure_loaded()
+        statuses = None if show_all else ('available',)
+        types = None if vehicle_type == 'all' else (vehicle_type,)
+        allowed_ids = vehicle_search.search_ids(search_query) if search_query else None
+        if limit is not None:
+            # k xe gần nhất: mở rộng dần theo vòng ô lưới, không duyệt hết bán kính
+            hits = fleet_index.k_nearest(lat, lng, limit, radius, statuses=statuses, types=types,
+                                         after=after, allowed_ids=allowed_ids,
+                                         min_range_km=required_range, range_rates=range_rates)
+        else:
+            hits = fleet_index.nearby(lat, lng, radius, statuses=statuses, types=types,
+                                      allowed_ids=allowed_ids,
+                                      min_range_km=required_range, range_rates=range_rates)
+        vehicles = [fleet_index.to_dict(slot) for _, slot in hits]
     else:
         # Sử dụng SQL database (PostgreSQL/SQLite)
         if show_all:
@@ -132,9 +232,21 @@ def nearby_vehicles():
         if vehicle_type != 'all':
             query = query.filter_by(vehicle_type=vehicle_type)
 
+        # Lọc sơ bộ theo không gian (dùng index): các ô geohash phủ bán kính + bbox
+        min_lat, min_lng, max_lat, max_lng = bbox_around(lat, lng, radius)
+        query = query.filter(
+            or_(*[
+                and_(Vehicle.geo_cell >= prefix, Vehicle.geo_cell < prefix_upper_bound(prefix))
+                for prefix in covering_geohashes(min_lat, min_lng, max_lat, max_lng)
+            ]),
+            Vehicle.latitude.between(min_lat, max_lat),
+            Vehicle.longitude.between(min_lng, max_lng)
+        )
+        # Chỉ quét các khu vực (thành phố) mà bán kính tìm kiếm chạm tới
+        query = in_region(query, Vehicle, regions_for_bbox(min_lat, min_lng, max_lat, max_lng))
+
         # Áp dụng bộ lọc tìm kiếm nếu có từ khóa
         if search_query:
-            from sqlalchemy import or_
             # Tìm kiếm không phân biệt hoa thường trong các trường:
             # - brand (thương hiệu): Honda, Yamaha, etc.
             # - model (model): Wave, Civic, etc.
@@ -151,35 +263,72 @@ def nearby_vehicles():
 
         # Thực thi query để lấy danh sách xe
         vehicles = query.all()
+        # Pin/xăng lấy từ bảng telemetry mới nhất (một truy vấn theo khóa chính)
+        telemetry = latest_by_vehicle([v.id for v in vehicles])
     
     # Filter by distance
-    nearby = []
+    candidates = []
     for vehicle in vehicles:
         # Support both dict (Firestore) and SQLAlchemy object
+        v_id = vehicle.get('id') if isinstance(vehicle, dict) else vehicle.id
         v_lat = vehicle['latitude'] if isinstance(vehicle, dict) else vehicle.latitude
         v_lng = vehicle['longitude'] if isinstance(vehicle, dict) else vehicle.longitude
-        v_status = vehicle.get('status') if isinstance(vehicle, dict) else vehicle.status
+        
+        # Bỏ xe không đủ pin/xăng cho quãng đường dự định (xe không có dữ liệu cũng bị bỏ)
+        if required_range is not None:
+            v_battery, v_fuel = _energy_levels(vehicle, telemetry.get(v_id))
+            v_range = range_model.estimate_km(
+                vehicle.get('vehicle_type') if isinstance(vehicle, dict) else vehicle.vehicle_type,
+                v_battery, v_fuel
+            )
+            if v_range is None or v_range < required_range:
+                continue
         
         distance = calculate_distance(lat, lng, v_lat, v_lng)
-        if distance <= radius:
-            nearby.append({
-                'id': vehicle.get('id') if isinstance(vehicle, dict) else vehicle.id,
-                'code': vehicle.get('vehicle_code') if isinstance(vehicle, dict) else vehicle.vehicle_code,
-                'type': vehicle.get('vehicle_type') if isinstance(vehicle, dict) else vehicle.vehicle_type,
-                'brand': vehicle.get('brand') if isinstance(vehicle, dict) else vehicle.brand,
-                'model': vehicle.get('model') if isinstance(vehicle, dict) else vehicle.model,
-                'license_plate': vehicle.get('license_plate') if isinstance(vehicle, dict) else vehicle.license_plate,
-                'latitude': v_lat,
-                'longitude': v_lng,
-                'distance': round(distance, 2),
-                'status': v_status,  # Add status to response
-                'battery': vehicle.get('battery_level') if isinstance(vehicle, dict) else vehicle.battery_level,
-                'price_per_minute': vehicle.get('price_per_minute') if isinstance(vehicle, dict) else vehicle.price_per_minute,
-                'qr_code': vehicle.get('qr_code') if isinstance(vehicle, dict) else vehicle.qr_code
-            })
+        if distance <= radius and (after is None or (distance, v_id) > after):
+            candidates.append((distance, v_id, vehicle))
     
-    # Sort by distance
-    nearby.sort(key=lambda x: x['distance'])
+    # Sort by distance (top-k only when a limit is given)
+    if limit is not None:
+        candidates = heapq.nsmallest(limit, candidates, key=lambda c: (c[0], c[1]))
+    else:
+        candidates.sort(key=lambda c: (c[0], c[1]))
+    
+    nearby = []
+    for distance, v_id, vehicle in candidates:
+        v_lat = vehicle['latitude'] if isinstance(vehicle, dict) else vehicle.latitude
+        v_lng = vehicle['longitude'] if isinstance(vehicle, dict) else vehicle.longitude
+        v_status = vehicle.get('status') if isinstance(vehicle, dict) else vehicle.status
+        v_type = vehicle.get('vehicle_type') if isinstance(vehicle, dict) else vehicle.vehicle_type
+        v_battery, v_fuel = _energy_levels(vehicle, telemetry.get(v_id))
+        v_range = range_model.estimate_km(v_type, v_battery, v_fuel)
+        nearby.append({
+            'id': v_id,
+            'code': vehicle.get('vehicle_code') if isinstance(vehicle, dict) else vehicle.vehicle_code,
+            'type': v_type,
+            'brand': vehicle.get('brand') if isinstance(vehicle, dict) else vehicle.brand,
+            'model': vehicle.get('model') if isinstance(vehicle, dict) else vehicle.model,
+            'license_plate': vehicle.get('license_plate') if isinstance(vehicle, dict) else vehicle.license_plate,
+            'latitude': v_lat,
+            'longitude': v_lng,
+            'distance': round(distance, 2),
+            'in_hazard_zone': bool(hazard_raster.zone_ids_at(v_lat, v_lng)),
+            'status': v_status,  # Add status to response
+            'battery': v_battery,
+            'fuel': v_fuel,
+            'estimated_range_km': round(v_range, 1) if v_range is not None else None,
+            'price_per_minute': vehicle.get('price_per_minute') if isinstance(vehicle, dict) else vehicle.price_per_minute,
+            'qr_code': vehicle.get('qr_code') if isinstance(vehicle, dict) else vehicle.qr_code
+        })
+    
+    # Cursor for the next page: last (exact distance, id) returned
+    next_cursor = None
+    if limit is not None and len(candidates) == limit:
+        next_cursor = encode_nearby_cursor(candidates[-1][0], candidates[-1][1])
+    
+    # Xếp theo tầm hoạt động còn lại (cursor vẫn theo khoảng cách ở trên)
+    if sort_by == 'range':
+        nearby.sort(key=lambda v: (-(v['estimated_range_km'] or 0), v['distance'], v['id']))
     
     # Count by status
     status_counts = {}
@@ -191,31 +340,127 @@ def nearby_vehicles():
         'vehicles': nearby, 
         'count': len(nearby),
         'status_counts': status_counts,  # Debug info
-        'available_count': status_counts.get('available', 0)
+        'available_count': status_counts.get('available', 0),
+        'next_cursor': next_cursor,
+        'required_range_km': round(required_range, 2) if required_range is not None else None
     })
 
 
+@vehicle_bp.route('/api/search')
+@login_required
+def search_vehicles():
+    """
+    API gợi ý tìm kiếm xe (typeahead) cho ô tìm kiếm trên bản đồ
+
+    Query Parameters:
+        q (str): Từ khóa (mã xe, biển số, hãng, model)
+        type (str): Loại xe ('all', 'bike', 'motorbike', 'car')
+        limit (int): Số kết quả tối đa (mặc định 10, tối đa 50)
+
+    Returns:
+        JSON: {'results': [xe khớp, xếp hạng: trùng khớp > tiền tố > chuỗi con], 'count': n}
+    """
+    q = request.args.get('q', '').strip()
+    vehicle_type = request.args.get('type', 'all')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+
+    if not q:
+        return jsonify({'results': [], 'count': 0})
+
+    if vehicle_search_enabled():
+        matches = vehicle_search.suggest(q, limit=limit, vehicle_type=None if vehicle_type == 'all' else vehicle_type)
+    else:
+        query = Vehicle.query.filter(or_(
+            Vehicle.vehicle_code.ilike(f'%{q}%'),
+            Vehicle.license_plate.ilike(f'%{q}%'),
+            Vehicle.brand.ilike(f'%{q}%'),
+            Vehicle.model.ilike(f'%{q}%')
+        ))
+        if vehicle_type != 'all':
+            query = query.filter_by(vehicle_type=vehicle_type)
+        matches = [dict(vehicle_to_dict(v), matched_field=None) for v in query.limit(limit).all()]
+
+    results = [{
+        'id': v['id'],
+        'code': v['vehicle_code'],
+        'type': v['vehicle_type'],
+        'brand': v['brand'],
+        'model': v['model'],
+        'license_plate': v['license_plate'],
+        'status': v['status'],
+        'latitude': v['latitude'],
+        'longitude': v['longitude'],
+        'matched_field': v['matched_field']
+    } for v in matches]
+
+    return jsonify({'results': results, 'count': len(results)})
+
+
+@vehicle_bp.route('/api/stream')
+@login_required
+def stream_vehicles():
+    """
+    Server-Sent Events: đẩy thay đổi vị trí/trạng thái/pin của xe theo thời gian thực
+
+    Query Parameters:
+        bbox (str): "min_lat,min_lng,max_lat,max_lng" - chỉ nhận xe trong khung nhìn
+        type (str): Loại xe ('all', 'bike', 'motorbike', 'car'), có thể nhiều giá trị cách nhau dấu phẩy
+
+    Events:
+        snapshot: {'vehicles': [...]} - trạng thái ban đầu (và sau khi client bị tụt hậu)
+        vehicle: {...} - xe thay đổi (trong bộ lọc)
+        leave: {'id': ...} - xe ra khỏi bộ lọc hoặc bị xóa
+    """
+    if 'fleet_stream' not in current_app.extensions:
+        return jsonify({'error': 'Fleet stream is disabled'}), 503
+
+    bbox = None
+    bbox_param = request.args.get('bbox')
+    if bbox_param:
+        try:
+            bbox = tuple(float(v) for v in bbox_param.split(','))
+        except ValueError:
+            bbox = ()
+        if len(bbox) != 4:
+            return jsonify({'error': 'bbox phải có dạng min_lat,min_lng,max_lat,max_lng'}), 400
+
+    vehicle_type = request.args.get('type', 'all')
+    types = None if vehicle_type == 'all' else [t for t in vehicle_type.split(',') if t]
+
+    # Generator tự đăng ký subscriber khi bắt đầu chạy (và hủy trong finally)
+    subscriber = FleetSubscriber(
+        bbox=bbox,
+        types=types,
+        max_queue=current_app.config.get('FLEET_STREAM_MAX_QUEUE', 500)
+    )
+    heartbeat = current_app.config.get('FLEET_STREAM_HEARTBEAT_SECONDS', 15)
+
+    response = Response(
+        stream_with_context(stream_events(subscriber, heartbeat_seconds=heartbeat)),
+        mimetype='text/event-stream'
+    )
+    response.headers['X-Accel-Buffering'] = 'no'  # Tắt buffer của nginx
+    return response
+
+
 @vehicle_bp.route('/<int:vehicle_id>')
 @login_required
 def vehicle_detail(vehicle_id):
     """Chi tiết phương tiện"""
     vehicle = Vehicle.query.get_or_404(vehicle_id)
     
-    # Get recent IoT logs
-    recent_logs = IoTLog.query.filter_by(vehicle_id=vehicle_id)\
-        .order_by(IoTLog.timestamp.desc())\
-        .limit(10).all()
+    # Thống kê tích lũy (materialized) - một lần đọc theo khóa chính
+    stats = get_vehicle_stats(vehicle_id)
     
-    # Get vehicle usage stats
-    total_trips = Trip.query.filter_by(vehicle_id=vehicle_id, status='completed').count()
-    total_distance = db.session.query(func.sum(Trip.distance_km))\
-        .filter_by(vehicle_id=vehicle_id, status='completed').scalar() or 0
+    # Telemetry mới nhất - đọc bảng trạng thái, không quét iot_logs
+    telemetry = get_latest(vehicle_id, current_app.config.get('IOT_TELEMETRY_STALE_SECONDS', 300))
     
     return render_template('vehicles/detail.html', 
                          vehicle=vehicle, 
-                         recent_logs=recent_logs,
-                         total_trips=total_trips,
-                         total_distance=round(total_distance, 2))
+                         stats=stats,
+                         telemetry=telemetry,
+                         total_trips=stats['completed_trips'],
+                         total_distance=stats['total_distance_km'])
 
 
 @vehicle_bp.route('/<int:vehicle_id>/book', methods=['POST'])
@@ -238,16 +483,17 @@ def book_vehicle(vehicle_id):
         JSON: Thông tin đặt xe thành công hoặc lỗi
 
     Raises:
-        400: Xe không khả dụng, người dùng có chuyến đi đang diễn ra, hoặc số dư không đủ
+        400: Người dùng có chuyến đi đang diễn ra, hoặc số dư không đủ
         404: Không tìm thấy xe
+        409: Xe không khả dụng / vừa được người khác đặt (code: VEHICLE_UNAVAILABLE)
         500: Lỗi hệ thống khi lưu dữ liệu
     """
     # Lấy thông tin xe từ database, trả về 404 nếu không tìm thấy
     vehicle = Vehicle.query.get_or_404(vehicle_id)
 
-    # Kiểm tra xe có sẵn sàng để đặt không
+    # Kiểm tra nhanh xe có sẵn sàng để đặt không (kiểm tra chính thức ở UPDATE có điều kiện bên dưới)
     if vehicle.status != 'available':
-        return jsonify({'error': 'Xe không khả dụng'}), 400
+        return vehicle_unavailable_response(vehicle_id, vehicle.status)
 
     # Kiểm tra người dùng hiện tại có chuyến đi đang hoạt động không
     # Một người chỉ được đặt một xe tại một thời điểm
@@ -264,8 +510,8 @@ def book_vehicle(vehicle_id):
     if current_user.wallet_balance < estimated_cost:
         return jsonify({'error': f'Số dư không đủ. Cần tối thiểu {estimated_cost:,.0f} VND để đặt xe.'}), 400
 
-    # Tạo mã chuyến đi duy nhất dựa trên timestamp
-    trip_code = f"TRIP{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    # Tạo mã chuyến đi duy nhất dựa trên timestamp (+ hậu tố ngẫu nhiên cho các lượt đặt cùng giây)
+    trip_code = f"TRIP{datetime.now().strftime('%Y%m%d%H%M%S')}{secrets.token_hex(2).upper()}"
     now = datetime.now()
 
     # Tạo bản ghi chuyến đi mới với trạng thái 'pending'
@@ -283,13 +529,23 @@ def book_vehicle(vehicle_id):
         updated_at=now
     )
 
-    # Đánh dấu xe là đã được đặt trước (reserved)
-    vehicle.status = 'reserved'
-
     try:
+        # Đánh dấu xe là đã được đặt trước (reserved) bằng UPDATE có điều kiện:
+        # chỉ một request thắng khi nhiều người cùng đặt một xe, không cần khóa toàn cục
+        claimed = Vehicle.query.filter(
+            Vehicle.id == vehicle_id,
+            Vehicle.status == 'available'
+        ).update({'status': 'reserved', 'updated_at': datetime.utcnow()}, synchronize_session=False)
+
+        if claimed != 1:
+            db.session.rollback()
+            current = db.session.query(Vehicle.status).filter(Vehicle.id == vehicle_id).scalar()
+            return vehicle_unavailable_response(vehicle_id, current)
+
         # Lưu thay đổi vào database
         db.session.add(trip)
         db.session.commit()
+        fleet_index.refresh_ids([vehicle_id])
 
         # Đồng bộ với Firebase nếu tính năng được bật
         if current_app.config.get('FIREBASE_ENABLED', False):
@@ -329,6 +585,16 @@ def book_vehicle(vehicle_id):
         return jsonify({'error': str(e)}), 500
 
 
+def vehicle_unavailable_response(vehicle_id, status):
+    """Phản hồi 409 có cấu trúc khi xe không còn khả dụng để đặt"""
+    return jsonify({
+        'error': 'Xe không khả dụng',
+        'code': 'VEHICLE_UNAVAILABLE',
+        'vehicle_id': vehicle_id,
+        'status': status
+    }), 409
+
+
 @vehicle_bp.route('/<int:vehicle_id>/unlock', methods=['POST'])
 @login_required
 def unlock_vehicle(vehicle_id):
@@ -418,6 +684,20 @@ def lock_vehicle(vehicle_id):
         return jsonify({'error': str(e)}), 500
 
 
+def encode_nearby_cursor(distance, vehicle_id):
+    """Cursor phân trang nearby: 'khoảng cách (km, đầy đủ độ chính xác):id xe'"""
+    return f'{distance!r}:{vehicle_id}'
+
+
+def decode_nearby_cursor(cursor):
+    """Giải mã cursor thành (distance, vehicle_id), None nếu không hợp lệ"""
+    try:
+        distance, vehicle_id = cursor.split(':')
+        return float(distance), int(vehicle_id)
+    except (ValueError, AttributeError):
+        return None
+
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Tính khoảng cách giữa 2 điểm trên trái đất sử dụng công thức Haversine
@@ -437,27 +717,15 @@ def calculate_distance(lat1, lon1, lat2, lon2):
 
     Formula:
         a = sin²(Δlat/2) + cos(lat1) * cos(lat2) * sin²(Δlon/2)
-        c = 2 * atan2(√a, √(1-a))
+        c = 2 * asin(√a)
         distance = R * c
 
     Where:
         Δlat = lat2 - lat1
         Δlon = lon2 - lon1
         R = 6371 km (bán kính trái đất)
-    """
-    # Bán kính trái đất (km) - sử dụng giá trị trung bình
-    R = 6371
 
-    # Chuyển đổi độ sang radian
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-
-    # Áp dụng công thức Haversine
-    a = math.sin(dlat/2) * math.sin(dlat/2) + \
-        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-        math.sin(dlon/2) * math.sin(dlon/2)
-
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    distance = R * c
-
-    return distance
+    Dùng chung haversine_distance với fleet_index để khoảng cách (và cursor
+    phân trang) giống hệt nhau dù trang được tính từ index hay từ database.
+    """
+    return haversine_distance(lat1, lon1, lat2, lon2)
@@ -1,7 +1,10 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.geo import geohash_encode, VEHICLE_GEOHASH_PRECISION
+from app.utils.regions import region_for
 
 db = SQLAlchemy()
 
@@ -66,6 +69,8 @@ class Vehicle(db.Model):
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     address = db.Column(db.String(255))
+    geo_cell = db.Column(db.String(12), index=True)  # Geohash (precision 7), kept in sync with lat/lng
+    region = db.Column(db.String(20), index=True)  # Thành phố (app/utils/regions.py), theo lat/lng
     
     # Status
     status = db.Column(db.String(20), default='available')  # available, in_use, maintenance, offline
@@ -94,6 +99,7 @@ class Vehicle(db.Model):
     last_maintenance_date = db.Column(db.DateTime)
     next_maintenance_date = db.Column(db.DateTime)
     maintenance_interval_km = db.Column(db.Float, default=1000)
+    last_maintenance_odometer = db.Column(db.Float)  # km lúc bảo dưỡng gần nhất (app/utils/maintenance_planner.py)
     
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -104,11 +110,26 @@ class Vehicle(db.Model):
     trips = db.relationship('Trip', back_populates='vehicle', lazy='dynamic')
     maintenances = db.relationship('Maintenance', back_populates='vehicle', lazy='dynamic')
     iot_logs = db.relationship('IoTLog', back_populates='vehicle', lazy='dynamic')
+    stats = db.relationship('VehicleStats', back_populates='vehicle', uselist=False)
+    telemetry = db.relationship('VehicleTelemetryState', back_populates='vehicle', uselist=False)
+    
+    __table_args__ = (
+        db.Index('ix_vehicles_lat_lng', 'latitude', 'longitude'),
+    )
     
     def __repr__(self):
         return f'<Vehicle {self.vehicle_code}>'
 
 
+@event.listens_for(Vehicle, 'before_insert')
+@event.listens_for(Vehicle, 'before_update')
+def _sync_vehicle_geo_cell(mapper, connection, target):
+    """Keep geo_cell and region in sync with the vehicle location"""
+    if target.latitude is not None and target.longitude is not None:
+        target.geo_cell = geohash_encode(target.latitude, target.longitude, VEHICLE_GEOHASH_PRECISION)
+        target.region = region_for(target.latitude, target.longitude)
+
+
 class Booking(db.Model):
     """Model đặt xe"""
     __tablename__ = 'bookings'
@@ -152,6 +173,7 @@ class Trip(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), nullable=False)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'))
+    region = db.Column(db.String(20), index=True)  # Thành phố nơi bắt đầu chuyến đi
     
     # Location
     start_latitude = db.Column(db.Float)
@@ -170,6 +192,7 @@ class Trip(db.Model):
     # Trip Details
     distance_km = db.Column(db.Float)
     route_json = db.Column(db.Text)  # JSON data of route coordinates
+    route_trace = db.Column(db.LargeBinary)  # GPS trace từ telemetry, mã hóa delta/varint (app.utils.trace_codec)
     
     # Cost
     total_cost = db.Column(db.Float)
@@ -195,6 +218,18 @@ class Trip(db.Model):
         return f'<Trip {self.trip_code}>'
 
 
+@event.listens_for(Trip, 'before_insert')
+@event.listens_for(Trip, 'before_update')
+def _assign_trip_region(mapper, connection, target):
+    """Region from the start position, or the vehicle's region until the trip starts"""
+    if target.start_latitude is not None and target.start_longitude is not None:
+        target.region = region_for(target.start_latitude, target.start_longitude)
+    elif target.region is None and target.vehicle_id is not None:
+        target.region = connection.execute(
+            select(Vehicle.region).where(Vehicle.id == target.vehicle_id)
+        ).scalar()
+
+
 class Payment(db.Model):
     """Model thanh toán"""
     __tablename__ = 'payments'
@@ -308,7 +343,11 @@ class EmergencyAlert(db.Model):
 
 
 class IoTLog(db.Model):
-    """Model log dữ liệu IoT từ xe"""
+    """
+    Model log dữ liệu IoT từ xe. Dữ liệu mới được ghi vào các bảng phân
+    vùng theo ngày (iot_logs_pYYYYMMDD - xem app/utils/telemetry_store.py);
+    bảng này giữ dữ liệu cũ và vẫn được đọc như phân vùng cũ nhất.
+    """
     __tablename__ = 'iot_logs'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -339,10 +378,123 @@ class IoTLog(db.Model):
     # Relationships
     vehicle = db.relationship('Vehicle', back_populates='iot_logs')
     
+    __table_args__ = (
+        # One sample per vehicle and instant: redelivered telemetry is ignored
+        db.Index('uq_iot_logs_vehicle_timestamp', 'vehicle_id', 'timestamp', unique=True),
+    )
+    
     def __repr__(self):
         return f'<IoTLog Vehicle:{self.vehicle_id} at {self.timestamp}>'
 
 
+class TelemetryRollupMixin:
+    """
+    Cột chung của các bảng tổng hợp telemetry theo xe và khoảng thời gian
+    (1 phút / 1 giờ - xem app/utils/telemetry_store.py)
+    """
+    vehicle_id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Đầu khoảng thời gian (UTC)
+    
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    first_at = db.Column(db.DateTime)
+    last_at = db.Column(db.DateTime)
+    
+    # Sensor Data (trung bình / nhỏ nhất / lớn nhất / giá trị cuối trong khoảng)
+    battery_avg = db.Column(db.Float)
+    battery_min = db.Column(db.Float)
+    battery_last = db.Column(db.Float)
+    fuel_avg = db.Column(db.Float)
+    fuel_min = db.Column(db.Float)
+    fuel_last = db.Column(db.Float)
+    speed_avg = db.Column(db.Float)
+    speed_max = db.Column(db.Float)
+    temperature_max = db.Column(db.Float)
+    
+    # Location (vị trí cuối trong khoảng)
+    latitude_last = db.Column(db.Float)
+    longitude_last = db.Column(db.Float)
+    
+    geofence_violations = db.Column(db.Integer, nullable=False, default=0)
+
+
+class IoTRollup1m(TelemetryRollupMixin, db.Model):
+    """Telemetry tổng hợp theo phút"""
+    __tablename__ = 'iot_rollups_1m'
+    __table_args__ = (
+        db.Index('ix_iot_rollups_1m_bucket', 'bucket'),
+    )
+    
+    def __repr__(self):
+        return f'<IoTRollup1m Vehicle:{self.vehicle_id} at {self.bucket}>'
+
+
+class IoTRollup1h(TelemetryRollupMixin, db.Model):
+    """Telemetry tổng hợp theo giờ"""
+    __tablename__ = 'iot_rollups_1h'
+    __table_args__ = (
+        db.Index('ix_iot_rollups_1h_bucket', 'bucket'),
+    )
+    
+    def __repr__(self):
+        return f'<IoTRollup1h Vehicle:{self.vehicle_id} at {self.bucket}>'
+
+
+class VehicleStats(db.Model):
+    """
+    Thống kê tích lũy theo xe (materialized, cập nhật dần khi kết thúc
+    chuyến đi - xem app/utils/vehicle_stats.py)
+    """
+    __tablename__ = 'vehicle_stats'
+    
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), primary_key=True)
+    
+    # Trips
+    completed_trips = db.Column(db.Integer, nullable=False, default=0)
+    total_distance_km = db.Column(db.Float, nullable=False, default=0.0)
+    total_revenue = db.Column(db.Float, nullable=False, default=0.0)
+    last_trip_at = db.Column(db.DateTime)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    vehicle = db.relationship('Vehicle', back_populates='stats')
+    
+    def __repr__(self):
+        return f'<VehicleStats Vehicle:{self.vehicle_id} trips={self.completed_trips}>'
+
+
+class VehicleTelemetryState(db.Model):
+    """
+    Telemetry mới nhất của mỗi xe (một dòng/xe, upsert khi nhận telemetry -
+    xem app/utils/telemetry_state.py). Đọc bảng này thay vì quét iot_logs.
+    """
+    __tablename__ = 'vehicle_telemetry_state'
+    
+    vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'), primary_key=True)
+    
+    # Thời điểm của mẫu mới nhất (theo thiết bị, UTC)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    
+    # Sensor Data (giá trị gần nhất đã nhận của từng trường)
+    battery_level = db.Column(db.Float)
+    fuel_level = db.Column(db.Float)
+    tire_pressure = db.Column(db.Float)
+    speed = db.Column(db.Float)  # km/h
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    engine_status = db.Column(db.String(20))  # on, off
+    temperature = db.Column(db.Float)  # Celsius
+    geofence_violation = db.Column(db.Boolean, default=False)
+    
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    vehicle = db.relationship('Vehicle', back_populates='telemetry')
+    
+    def __repr__(self):
+        return f'<VehicleTelemetryState Vehicle:{self.vehicle_id} at {self.timestamp}>'
+
+
 class Notification(db.Model):
     """Model thông báo chung cho người dùng"""
     __tablename__ = 'notifications'
@@ -403,6 +555,7 @@ class HazardZone(db.Model):
     max_latitude = db.Column(db.Float, nullable=False, index=True)
     min_longitude = db.Column(db.Float, nullable=False, index=True)
     max_longitude = db.Column(db.Float, nullable=False, index=True)
+    region = db.Column(db.String(20), index=True)  # Thành phố chứa tâm vùng
     
     # Visual
     color = db.Column(db.String(20), default='#ff0000')  # Hex color for map display
@@ -427,6 +580,17 @@ class HazardZone(db.Model):
         return f'<HazardZone {self.zone_code}: {self.zone_name}>'
 
 
+@event.listens_for(HazardZone, 'before_insert')
+@event.listens_for(HazardZone, 'before_update')
+def _assign_hazard_zone_region(mapper, connection, target):
+    """Region of the zone's bounding box center"""
+    if None not in (target.min_latitude, target.max_latitude, target.min_longitude, target.max_longitude):
+        target.region = region_for(
+            (target.min_latitude + target.max_latitude) / 2,
+            (target.min_longitude + target.max_longitude) / 2
+        )
+
+
 class RouteHistory(db.Model):
     """
     Model lưu lịch sử routes đã plan (for Analytics)
@@ -446,6 +610,7 @@ class RouteHistory(db.Model):
     start_lng = db.Column(db.Float, nullable=False)
     end_lat = db.Column(db.Float, nullable=False)
     end_lng = db.Column(db.Float, nullable=False)
+    region = db.Column(db.String(20), index=True)  # Thành phố của điểm bắt đầu
     
     # Route metrics
     distance_km = db.Column(db.Float)
@@ -468,3 +633,10 @@ class RouteHistory(db.Model):
     
     def __repr__(self):
         return f'<RouteHistory {self.id}: {self.start_address} -> {self.end_address}>'
+
+
+@event.listens_for(RouteHistory, 'before_insert')
+@event.listens_for(RouteHistory, 'before_update')
+def _assign_route_history_region(mapper, connection, target):
+    """Region of the route start"""
+    target.region = region_for(target.start_lat, target.start_lng)
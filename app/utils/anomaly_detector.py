@@ -0,0 +1,296 @@
+"""
+Anomaly Detector - Online per-vehicle checks of incoming telemetry
+(battery drain spikes, over-temperature, sudden tire pressure loss,
+impossible GPS jumps) with O(1) rolling statistics per sample
+ITS Feature: Fleet Management (predictive maintenance / incident detection)
+"""
+import math
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from app.utils.route_optimizer import haversine_distance
+
+# kind -> (record, type, severity, description); record is 'maintenance' or 'alert'
+ANOMALY_KINDS = {
+    'battery_drain': ('maintenance', 'repair', None, 'Pin tụt bất thường: {value:.2f} %/phút'),
+    'over_temperature': ('alert', 'breakdown', 'high', 'Nhiệt độ xe quá cao: {value:.1f}°C'),
+    'pressure_loss': ('alert', 'breakdown', 'medium', 'Áp suất lốp giảm đột ngột: còn {value:.1f}'),
+    'gps_jump': ('maintenance', 'repair', None, 'Vị trí GPS nhảy bất thường: {value:.0f} km/h'),
+}
+CODE_PREFIXES = {'battery_drain': 'BAT', 'over_temperature': 'TMP', 'pressure_loss': 'TPR', 'gps_jump': 'GPS'}
+
+
+class Anomaly(NamedTuple):
+    vehicle_id: int
+    kind: str
+    timestamp: datetime  # UTC sample time
+    value: float
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class Ewma:
+    """Exponentially weighted mean and variance (O(1) per update)"""
+
+    __slots__ = ('alpha', 'mean', 'var', 'count')
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    def zscore(self, value: float) -> float:
+        """Deviation of `value` from the current mean in standard deviations"""
+        if self.count == 0:
+            return 0.0
+        std = math.sqrt(self.var)
+        diff = value - self.mean
+        if std < 1e-9:
+            return 0.0 if abs(diff) < 1e-9 else math.copysign(math.inf, diff)
+        return diff / std
+
+    def update(self, value: float) -> None:
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            increment = self.alpha * diff
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + diff * increment)
+        self.count += 1
+
+
+class _VehicleState:
+    __slots__ = ('timestamp', 'drain_from', 'drain_level', 'latitude', 'longitude',
+                 'drain', 'temperature', 'pressure')
+
+    def __init__(self, alpha: float):
+        self.timestamp = None
+        self.drain_from = None  # Start (time, battery level) of the current drain window
+        self.drain_level = None
+        self.latitude = None
+        self.longitude = None
+        self.drain = Ewma(alpha)  # %/minute
+        self.temperature = Ewma(alpha)
+        self.pressure = Ewma(alpha)
+
+
+class AnomalyDetector:
+    """
+    Keeps per-vehicle rolling statistics in memory (nothing is read from
+    the database) and checks each sample against them:
+
+    - battery_drain: discharge rate (%/min) more than `z_threshold` standard
+      deviations above its EWMA and at least `min_drain_per_minute`. The
+      rate is measured over windows of at least `drain_window_seconds` (or
+      a drop of `min_drain_step` %): levels are quantized to 0.1-1 %, so a
+      single step between samples a few seconds apart is no rate at all
+    - over_temperature: EWMA temperature at or above `max_temperature`
+      (smoothing ignores single bad readings)
+    - pressure_loss: tire pressure `z_threshold` deviations below its EWMA
+      and at least `min_pressure_drop` lower
+    - gps_jump: consecutive positions implying more than `max_speed_kmh`
+
+    Statistical checks start after `warmup_samples` samples (drain windows
+    for battery_drain) of a vehicle; gaps longer than `max_gap_seconds` reset the rate baseline. Each kind
+    is reported at most once per vehicle per `cooldown_seconds`.
+    """
+
+    def __init__(self, alpha: float = 0.1, z_threshold: float = 4.0, warmup_samples: int = 10,
+                 min_drain_per_minute: float = 1.0, drain_window_seconds: float = 300,
+                 min_drain_step: float = 5.0, max_temperature: float = 90.0,
+                 min_pressure_drop: float = 5.0, max_speed_kmh: float = 250.0,
+                 max_gap_seconds: float = 600, cooldown_seconds: float = 1800):
+        self.enabled = True
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup_samples = warmup_samples
+        self.min_drain_per_minute = min_drain_per_minute
+        self.drain_window_seconds = drain_window_seconds
+        self.min_drain_step = min_drain_step
+        self.max_temperature = max_temperature
+        self.min_pressure_drop = min_pressure_drop
+        self.max_speed_kmh = max_speed_kmh
+        self.max_gap_seconds = max_gap_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._states: Dict[int, _VehicleState] = {}
+        self._last_reported: Dict[tuple, datetime] = {}  # (vehicle_id, kind) -> sample time
+
+        # Metrics
+        self.samples_checked = 0
+        self.anomalies_found = {kind: 0 for kind in ANOMALY_KINDS}
+        self.records_created = 0
+
+    def configure(self, config) -> None:
+        self.enabled = config.get('ANOMALY_DETECTION_ENABLED', self.enabled)
+        self.alpha = config.get('ANOMALY_EWMA_ALPHA', self.alpha)
+        self.z_threshold = config.get('ANOMALY_Z_THRESHOLD', self.z_threshold)
+        self.warmup_samples = config.get('ANOMALY_WARMUP_SAMPLES', self.warmup_samples)
+        self.min_drain_per_minute = config.get('ANOMALY_MIN_DRAIN_PER_MINUTE', self.min_drain_per_minute)
+        self.drain_window_seconds = config.get('ANOMALY_DRAIN_WINDOW_SECONDS', self.drain_window_seconds)
+        self.min_drain_step = config.get('ANOMALY_MIN_DRAIN_STEP', self.min_drain_step)
+        self.max_temperature = config.get('ANOMALY_MAX_TEMPERATURE', self.max_temperature)
+        self.min_pressure_drop = config.get('ANOMALY_MIN_PRESSURE_DROP', self.min_pressure_drop)
+        self.max_speed_kmh = config.get('ANOMALY_MAX_SPEED_KMH', self.max_speed_kmh)
+        self.max_gap_seconds = config.get('ANOMALY_MAX_GAP_SECONDS', self.max_gap_seconds)
+        self.cooldown_seconds = config.get('ANOMALY_COOLDOWN_SECONDS', self.cooldown_seconds)
+
+    # ------------------------------------------------------------------
+    # Detection
+    # ------------------------------------------------------------------
+
+    def _check(self, state: _VehicleState, row: Dict, found: List[Anomaly]) -> None:
+        vid, ts = row['vehicle_id'], row['timestamp']
+        lat, lng = row['latitude'], row['longitude']
+
+        def report(kind, value):
+            found.append(Anomaly(vid, kind, ts, value, lat, lng))
+
+        gap = (ts - state.timestamp).total_seconds() if state.timestamp is not None else None
+        if gap is not None and gap > self.max_gap_seconds:
+            state.drain = Ewma(self.alpha)
+            gap = None
+
+        battery = row['battery_level']
+        if battery is not None:
+            if not gap or state.drain_from is None:
+                state.drain_from, state.drain_level = ts, battery
+            else:
+                elapsed = (ts - state.drain_from).total_seconds()
+                drop = state.drain_level - battery
+                if elapsed >= self.drain_window_seconds or drop >= self.min_drain_step:
+                    rate = drop / (elapsed / 60)
+                    if (state.drain.count >= self.warmup_samples and rate >= self.min_drain_per_minute
+                            and state.drain.zscore(rate) > self.z_threshold):
+                        report('battery_drain', rate)
+                    state.drain.update(rate)
+                    state.drain_from, state.drain_level = ts, battery
+
+        temperature = row['temperature']
+        if temperature is not None:
+            state.temperature.update(temperature)
+            if state.temperature.count >= self.warmup_samples and state.temperature.mean >= self.max_temperature:
+                report('over_temperature', state.temperature.mean)
+
+        pressure = row['tire_pressure']
+        if pressure is not None:
+            stats = state.pressure
+            if (stats.count >= self.warmup_samples and stats.mean - pressure >= self.min_pressure_drop
+                    and stats.zscore(pressure) < -self.z_threshold):
+                report('pressure_loss', pressure)
+            stats.update(pressure)
+
+        if lat is not None:
+            if gap and state.latitude is not None:
+                speed = haversine_distance(state.latitude, state.longitude, lat, lng) / (gap / 3600)
+                if speed > self.max_speed_kmh:
+                    report('gps_jump', speed)
+            state.latitude, state.longitude = lat, lng
+
+        state.timestamp = ts
+
+    def evaluate(self, rows: List[Dict]) -> List[Anomaly]:
+        """
+        Update the rolling statistics with a batch of validated samples and
+        return the anomalies due for a record (cooldown applied). Samples
+        older than a vehicle's newest seen sample are ignored.
+        """
+        if not self.enabled or not rows:
+            return []
+        found: List[Anomaly] = []
+        with self._lock:
+            for row in sorted(rows, key=lambda r: (r['vehicle_id'], r['timestamp'])):
+                state = self._states.get(row['vehicle_id'])
+                if state is None:
+                    state = self._states[row['vehicle_id']] = _VehicleState(self.alpha)
+                elif state.timestamp is not None and row['timestamp'] <= state.timestamp:
+                    continue
+                self._check(state, row, found)
+            self.samples_checked += len(rows)
+
+            due = []
+            for anomaly in found:
+                self.anomalies_found[anomaly.kind] += 1
+                key = (anomaly.vehicle_id, anomaly.kind)
+                last = self._last_reported.get(key)
+                if last is not None and (anomaly.timestamp - last).total_seconds() < self.cooldown_seconds:
+                    continue
+                self._last_reported[key] = anomaly.timestamp
+                due.append(anomaly)
+        return due
+
+    def forget(self, vehicle_ids) -> None:
+        """Drop rolling state after a rollback (vehicles warm up again)"""
+        with self._lock:
+            for vid in vehicle_ids:
+                self._states.pop(vid, None)
+
+    # ------------------------------------------------------------------
+    # Records
+    # ------------------------------------------------------------------
+
+    def create_records(self, anomalies: List[Anomaly]) -> int:
+        """
+        Maintenance / EmergencyAlert rows for the anomalies, committed in
+        their own transaction after the telemetry batch so that a failure
+        here never costs telemetry. Returns the number of rows created.
+        """
+        if not anomalies:
+            return 0
+        from app.models import db, Maintenance, EmergencyAlert
+
+        now = datetime.utcnow()
+        try:
+            for anomaly in anomalies:
+                record, record_type, severity, template = ANOMALY_KINDS[anomaly.kind]
+                code = f"{CODE_PREFIXES[anomaly.kind]}{anomaly.vehicle_id}-{anomaly.timestamp.strftime('%Y%m%d%H%M%S')}"
+                description = template.format(value=anomaly.value) + ' (phát hiện tự động từ telemetry)'
+                if record == 'maintenance':
+                    db.session.add(Maintenance(
+                        maintenance_code=f'MT{code}',
+                        vehicle_id=anomaly.vehicle_id,
+                        maintenance_type=record_type,
+                        description=description,
+                        scheduled_date=now,
+                        status='scheduled'
+                    ))
+                else:
+                    db.session.add(EmergencyAlert(
+                        alert_code=f'ANM{code}',
+                        vehicle_id=anomaly.vehicle_id,
+                        alert_type=record_type,
+                        severity=severity,
+                        description=description,
+                        latitude=anomaly.latitude,
+                        longitude=anomaly.longitude,
+                        status='open'
+                    ))
+                print(f'[Anomaly] Vehicle {anomaly.vehicle_id}: {anomaly.kind} ({anomaly.value:.2f})')
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f'[Anomaly] Could not store {len(anomalies)} anomalies: {e}')
+            return 0
+        self.records_created += len(anomalies)
+        return len(anomalies)
+
+    def stats(self) -> Dict:
+        return {
+            'enabled': self.enabled,
+            'tracked_vehicles': len(self._states),
+            'samples_checked': self.samples_checked,
+            'anomalies_found': dict(self.anomalies_found),
+            'records_created': self.records_created
+        }
+
+
+# Shared per-process detector
+anomaly_detector = AnomalyDetector()
+
+
+def init_anomaly_detector(app) -> None:
+    anomaly_detector.configure(app.config)
@@ -0,0 +1,443 @@
+"""
+Columnar Archive - Closed days of raw telemetry and completed trips
+exported to compact per-column files for analytics, with a memory-mapped
+reader
+ITS Feature: Big Data Analytics (offline analysis of fleet history)
+
+Layout (one directory per dataset and day, written atomically):
+
+    <ARCHIVE_DIR>/<dataset>/date=YYYY-MM-DD/_meta.json
+    <ARCHIVE_DIR>/<dataset>/date=YYYY-MM-DD/<column>.bin[.z]
+
+Each column is a flat little/big-endian array (typecodes of the stdlib
+`array` module). Nulls are NaN in float columns, strings are dictionary
+encoded into small integer codes. Uncompressed columns are memory-mapped
+by the reader (numpy.memmap when numpy is installed, memoryview
+otherwise); with ARCHIVE_COMPRESSION_LEVEL > 0 columns are zlib
+compressed and decompressed on read instead.
+"""
+import json
+import mmap
+import os
+import shutil
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FORMAT_VERSION = 1
+META_FILE = '_meta.json'
+NAN = float('nan')
+EPOCH = datetime(1970, 1, 1)
+
+# dataset -> [(column, typecode, dictionary encoded)]
+SCHEMAS = {
+    'iot': [
+        ('vehicle_id', 'i', False),
+        ('timestamp_ms', 'q', False),  # UTC
+        ('battery_level', 'f', False),
+        ('fuel_level', 'f', False),
+        ('tire_pressure', 'f', False),
+        ('speed', 'f', False),
+        ('latitude', 'd', False),
+        ('longitude', 'd', False),
+        ('engine_status', 'B', True),
+        ('temperature', 'f', False),
+        ('geofence_violation', 'B', False),
+    ],
+    'trips': [
+        ('id', 'q', False),
+        ('user_id', 'i', False),
+        ('vehicle_id', 'i', False),
+        ('region', 'B', True),
+        ('start_time_ms', 'q', False),  # Local time, as stored on trips
+        ('end_time_ms', 'q', False),
+        ('duration_minutes', 'f', False),
+        ('distance_km', 'f', False),
+        ('total_cost', 'd', False),
+        ('start_latitude', 'd', False),
+        ('start_longitude', 'd', False),
+        ('end_latitude', 'd', False),
+        ('end_longitude', 'd', False),
+    ],
+}
+TIME_BASIS = {'iot': 'utc', 'trips': 'local'}
+
+
+def _config(name: str, default):
+    from flask import current_app
+    return current_app.config.get(name, default)
+
+
+def _epoch_ms(ts: Optional[datetime]) -> int:
+    return int((ts - EPOCH).total_seconds() * 1000) if ts is not None else -1
+
+
+def _number(value) -> float:
+    return NAN if value is None else float(value)
+
+
+def partition_path(root: str, dataset: str, day: date) -> str:
+    return os.path.join(root, dataset, f'date={day.isoformat()}')
+
+
+def archived_days(root: str, dataset: str) -> List[date]:
+    """Days with a complete partition (those with a meta file), oldest first"""
+    base = os.path.join(root, dataset)
+    if not os.path.isdir(base):
+        return []
+    days = []
+    for name in os.listdir(base):
+        if name.startswith('date=') and os.path.exists(os.path.join(base, name, META_FILE)):
+            try:
+                days.append(date.fromisoformat(name[len('date='):]))
+            except ValueError:
+                continue
+    return sorted(days)
+
+
+def is_archived(root: str, dataset: str, day: date) -> bool:
+    return os.path.exists(os.path.join(partition_path(root, dataset, day), META_FILE))
+
+
+# ----------------------------------------------------------------------
+# Writer
+# ----------------------------------------------------------------------
+
+class PartitionWriter:
+    """Accumulates rows of one dataset/day in typed column arrays"""
+
+    def __init__(self, dataset: str):
+        self.dataset = dataset
+        self.schema = SCHEMAS[dataset]
+        self.columns: Dict[str, array] = {name: array(code) for name, code, _ in self.schema}
+        self.dictionaries: Dict[str, List] = {name: [None] for name, _, encoded in self.schema if encoded}
+        self._codes: Dict[str, Dict] = {name: {None: 0} for name in self.dictionaries}
+        self.rows = 0
+
+    def append(self, values: Dict) -> None:
+        for name, code, encoded in self.schema:
+            value = values.get(name)
+            if encoded:
+                codes = self._codes[name]
+                if value not in codes:
+                    codes[value] = len(codes)
+                    self.dictionaries[name].append(value)
+                value = codes[value]
+            elif code in ('f', 'd'):
+                value = _number(value)
+            elif code == 'B':
+                value = 1 if value else 0
+            self.columns[name].append(value)
+        self.rows += 1
+
+    def write(self, root: str, day: date, compression_level: int = 0, extra_meta: Optional[Dict] = None) -> str:
+        """
+        Write the partition atomically: files go to a temporary directory
+        that replaces the final one in a single rename.
+        """
+        final = partition_path(root, self.dataset, day)
+        tmp = final + '.tmp'
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        for name, code, _ in self.schema:
+            data = self.columns[name].tobytes()
+            filename = f'{name}.bin'
+            if compression_level:
+                data = zlib.compress(data, compression_level)
+                filename += '.z'
+            with open(os.path.join(tmp, filename), 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'dataset': self.dataset,
+            'date': day.isoformat(),
+            'rows': self.rows,
+            'byteorder': sys.byteorder,
+            'compression': 'zlib' if compression_level else None,
+            'time_basis': TIME_BASIS[self.dataset],
+            'columns': [{'name': name, 'typecode': code} for name, code, _ in self.schema],
+            'dictionaries': self.dictionaries,
+            'created_at': datetime.utcnow().isoformat() + 'Z'
+        }
+        meta.update(extra_meta or {})
+        with open(os.path.join(tmp, META_FILE), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.replace(tmp, final)
+        return final
+
+
+# ----------------------------------------------------------------------
+# Reader
+# ----------------------------------------------------------------------
+
+class ArchivePartition:
+    """
+    One archived day. column() returns a zero-copy view over the mapped
+    file (numpy array or typed memoryview); call close() (or use `with`)
+    to unmap.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta['byteorder'] != sys.byteorder:
+            raise ValueError(f'{path} was written on a {self.meta["byteorder"]}-endian machine')
+        self.rows = self.meta['rows']
+        self.day = date.fromisoformat(self.meta['date'])
+        self._typecodes = {c['name']: c['typecode'] for c in self.meta['columns']}
+        self._maps: List[mmap.mmap] = []
+        self._views: Dict[str, object] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def column_names(self) -> List[str]:
+        return list(self._typecodes)
+
+    def dictionary(self, name: str) -> List:
+        """Code -> value of a dictionary-encoded column"""
+        return self.meta['dictionaries'][name]
+
+    def column(self, name: str):
+        view = self._views.get(name)
+        if view is not None:
+            return view
+        code = self._typecodes[name]
+        if self.meta['compression'] == 'zlib':
+            with open(os.path.join(self.path, f'{name}.bin.z'), 'rb') as f:
+                data = zlib.decompress(f.read())
+            view = np.frombuffer(data, dtype=code) if np is not None else memoryview(data).cast(code)
+        elif self.rows == 0:
+            view = np.empty(0, dtype=code) if np is not None else memoryview(array(code))
+        else:
+            with open(os.path.join(self.path, f'{name}.bin'), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps.append(mapped)
+            view = np.frombuffer(mapped, dtype=code) if np is not None else memoryview(mapped).cast(code)
+        self._views[name] = view
+        return view
+
+    def decoded(self, name: str) -> List:
+        """Values of a dictionary-encoded column"""
+        dictionary = self.dictionary(name)
+        return [dictionary[code] for code in self.column(name)]
+
+    def rows_as_dicts(self, columns: Optional[Sequence[str]] = None) -> Iterator[Dict]:
+        """Row-by-row convenience view (slow path for small partitions)"""
+        names = list(columns or self.column_names)
+        encoded = {name for name in names if name in self.meta['dictionaries']}
+        values = [self.decoded(name) if name in encoded else self.column(name) for name in names]
+        for i in range(self.rows):
+            yield {name: column[i] for name, column in zip(names, values)}
+
+    def close(self) -> None:
+        self._views.clear()
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # A caller still holds a view; the map is released with it
+        self._maps = []
+
+
+def open_partition(root: str, dataset: str, day: date) -> ArchivePartition:
+    return ArchivePartition(partition_path(root, dataset, day))
+
+
+def scan(root: str, dataset: str, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[ArchivePartition]:
+    """
+    Archived partitions of a dataset with start <= day < end, oldest
+    first. Each is closed when the iteration moves past it.
+    """
+    for day in archived_days(root, dataset):
+        if (start is not None and day < start) or (end is not None and day >= end):
+            continue
+        with open_partition(root, dataset, day) as partition:
+            yield partition
+
+
+# ----------------------------------------------------------------------
+# Exporters (app context required)
+# ----------------------------------------------------------------------
+
+def archive_root() -> str:
+    return _config('ARCHIVE_DIR', 'archive')
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def _write_day(writer: PartitionWriter, day: date, force: bool) -> int:
+    """
+    Write an exported day. An archived day is only replaced by an export
+    with at least as many rows, unless `force`: its source rows may have
+    been dropped by retention since, and the archive is then the only copy.
+    """
+    root = archive_root()
+    if not force and is_archived(root, writer.dataset, day):
+        with open_partition(root, writer.dataset, day) as existing:
+            archived_rows = existing.rows
+        if writer.rows < archived_rows:
+            raise ValueError(f'{writer.dataset} {day.isoformat()} is archived with {archived_rows} rows but the '
+                             f'source now has {writer.rows}; not overwriting it')
+    writer.write(root, day, _config('ARCHIVE_COMPRESSION_LEVEL', 0))
+    return writer.rows
+
+
+def export_iot_day(day: date, force: bool = False) -> int:
+    """Archive the raw telemetry of one UTC day; returns the row count"""
+    from app.utils.telemetry_store import iter_raw
+
+    start, end = _day_bounds(day)
+    writer = PartitionWriter('iot')
+    for row in iter_raw(start, end):
+        row['timestamp_ms'] = _epoch_ms(row['timestamp'])
+        writer.append(row)
+    return _write_day(writer, day, force)
+
+
+def export_trips_day(day: date, force: bool = False) -> int:
+    """Archive the trips completed on one (local) day; returns the row count"""
+    from app.models import Trip
+
+    start, end = _day_bounds(day)
+    writer = PartitionWriter('trips')
+    query = Trip.query.filter(
+        Trip.status == 'completed',
+        Trip.end_time >= start,
+        Trip.end_time < end
+    ).order_by(Trip.id)
+    for trip in query.yield_per(1000):
+        writer.append({
+            'id': trip.id,
+            'user_id': trip.user_id,
+            'vehicle_id': trip.vehicle_id,
+            'region': trip.region,
+            'start_time_ms': _epoch_ms(trip.start_time),
+            'end_time_ms': _epoch_ms(trip.end_time),
+            'duration_minutes': trip.duration_minutes,
+            'distance_km': trip.distance_km,
+            'total_cost': trip.total_cost,
+            'start_latitude': trip.start_latitude,
+            'start_longitude': trip.start_longitude,
+            'end_latitude': trip.end_latitude,
+            'end_longitude': trip.end_longitude
+        })
+    return _write_day(writer, day, force)
+
+
+def _oldest_day(dataset: str) -> Optional[date]:
+    if dataset == 'iot':
+        from app.utils.telemetry_store import oldest_raw
+        oldest = oldest_raw()
+    else:
+        from app.models import db, Trip
+        oldest = db.session.query(db.func.min(Trip.end_time)).filter(Trip.status == 'completed').scalar()
+    return oldest.date() if oldest is not None else None
+
+
+EXPORTERS = {'iot': export_iot_day, 'trips': export_trips_day}
+
+
+def archived_until(dataset: str) -> Optional[datetime]:
+    """
+    Everything before this instant is archived: the end of the run of
+    consecutive archived days starting at the oldest one (a day exported
+    out of order with `--day` does not move it past a gap)
+    """
+    days = archived_days(archive_root(), dataset)
+    if not days:
+        return None
+    last = days[0]
+    for day in days[1:]:
+        if day != last + timedelta(days=1):
+            break
+        last = day
+    return _day_bounds(last)[1]
+
+
+def last_closed_day(dataset: str, now: Optional[datetime] = None) -> date:
+    """Newest day that ended at least ARCHIVE_CLOSE_DELAY_HOURS ago"""
+    delay = timedelta(hours=_config('ARCHIVE_CLOSE_DELAY_HOURS', 2))
+    reference = now or (datetime.utcnow() if TIME_BASIS[dataset] == 'utc' else datetime.now())
+    return (reference - delay).date() - timedelta(days=1)
+
+
+def export_closed_days(now: Optional[datetime] = None, max_days: Optional[int] = None,
+                       datasets: Optional[Sequence[str]] = None) -> Dict[str, int]:
+    """
+    Export, oldest first, the days that are closed (ended at least
+    ARCHIVE_CLOSE_DELAY_HOURS ago) and not archived yet.
+
+    Returns:
+        {dataset: days exported}
+    """
+    max_days = max_days or _config('ARCHIVE_MAX_DAYS_PER_RUN', 7)
+    root = archive_root()
+    exported = {}
+    for dataset in datasets or sorted(EXPORTERS):
+        exporter = EXPORTERS[dataset]
+        last_closed = last_closed_day(dataset, now)
+        archived = archived_until(dataset)
+        day = archived.date() if archived is not None else _oldest_day(dataset)
+        count = 0
+        while day is not None and day <= last_closed and count < max_days:
+            if not is_archived(root, dataset, day):  # Exported earlier with --day
+                rows = exporter(day)
+                print(f'[Archive] {dataset} {day.isoformat()}: {rows} rows')
+                count += 1
+            day += timedelta(days=1)
+        exported[dataset] = count
+    return exported
+
+
+def register_cli(app) -> None:
+    """`flask archive-export` command"""
+    import click
+
+    @app.cli.command('archive-export')
+    @click.option('--dataset', type=click.Choice(sorted(EXPORTERS)), help='Only this dataset')
+    @click.option('--day', 'day_text', help='(Re-)export one closed day (YYYY-MM-DD)')
+    @click.option('--force', is_flag=True,
+                  help='With --day: replace an archived day even if the source now has fewer rows')
+    def archive_export_command(dataset, day_text, force):
+        """Export closed days of telemetry and trips to the columnar archive"""
+        if day_text:
+            try:
+                day = date.fromisoformat(day_text)
+            except ValueError:
+                raise click.BadParameter('expected YYYY-MM-DD', param_hint='--day')
+            names = [dataset] if dataset else sorted(EXPORTERS)
+            open_names = [name for name in names if day > last_closed_day(name)]
+            if open_names:
+                raise click.BadParameter(f'{day_text} is not closed yet for {", ".join(open_names)}',
+                                         param_hint='--day')
+            for name in names:
+                try:
+                    click.echo(f'{name} {day_text}: {EXPORTERS[name](day, force=force)} rows')
+                except ValueError as e:
+                    raise click.ClickException(f'{e} (use --force to replace it)')
+            return
+        click.echo(f'Exported days: {export_closed_days(max_days=10000, datasets=[dataset] if dataset else None)}')
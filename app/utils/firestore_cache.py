@@ -0,0 +1,245 @@
+"""
+Firestore Snapshot Cache - Local materialized copy of a Firestore query
+kept current by a snapshot listener (used for available vehicles)
+"""
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
+
+
+class FirestoreQueryCache:
+    """
+    In-memory copy of a Firestore query result maintained by on_snapshot.
+
+    Reads never hit Firestore while the listener is alive, however long the
+    collection stays quiet. If the listener has not delivered its initial
+    snapshot, failed to start or has stopped, reads serve the copy until it
+    is older than max_staleness_seconds; the next read then restarts the
+    listener and reseeds the copy with a direct query. A failed reseed is
+    counted and the stale copy is served until the retry after
+    retry_seconds (it only raises when there is no copy at all).
+
+    The Firestore client is injected, so the emulator (FIRESTORE_EMULATOR_HOST)
+    or an in-memory fake with the same collection/where/stream/on_snapshot
+    API can stand in.
+    """
+
+    def __init__(self, collection: str, filters: Tuple[Tuple[str, str, object], ...] = (),
+                 max_staleness_seconds: float = 300, retry_seconds: float = 30):
+        self.collection = collection
+        self.filters = filters
+        self.max_staleness_seconds = max_staleness_seconds
+        self.retry_seconds = retry_seconds
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._watch = None
+        self._docs: Dict[str, Dict] = {}
+        self._ready = False    # Cache holds a full result set
+        self._synced = False   # Listener delivered its initial snapshot
+        self._error: Optional[str] = None          # Listener start failure
+        self._reseed_error: Optional[str] = None   # Last failed direct query
+        self._updated_at: Optional[float] = None   # Data age
+        self._snapshot_at: Optional[float] = None  # Listener health
+        self._retry_at = 0.0
+
+        # Metrics
+        self.hits = 0
+        self.fallbacks = 0
+        self.failed_reseeds = 0
+        self.stale_reads = 0
+        self.restarts = 0
+        self.snapshots = 0
+        self.max_staleness_seen = 0.0
+
+    def _query(self):
+        query = self._client.collection(self.collection)
+        for field, op, value in self.filters:
+            query = query.where(field, op, value)
+        return query
+
+    @staticmethod
+    def _doc_data(doc) -> Dict:
+        data = doc.to_dict() or {}
+        data['id'] = data.get('id') or doc.id
+        return data
+
+    # ------------------------------------------------------------------
+    # Listener
+    # ------------------------------------------------------------------
+
+    def start(self, client) -> None:
+        """Attach a snapshot listener using the given Firestore client"""
+        self.stop()
+        self._client = client
+        self._error = None
+        try:
+            self._watch = self._query().on_snapshot(self._on_snapshot)
+            print(f'[FirestoreCache] Listening to {self.collection} {self.filters}')
+        except Exception as e:
+            self._error = str(e)
+            print(f'[FirestoreCache] Could not start listener for {self.collection}: {e}')
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            try:
+                self._watch.unsubscribe()
+            except Exception:
+                pass
+        self._watch = None
+        with self._lock:
+            self._ready = False
+            self._synced = False
+
+    def _on_snapshot(self, docs, changes, read_time) -> None:
+        """Firestore callback (runs on the listener's background thread)"""
+        with self._lock:
+            if not self._synced:
+                # First delivery: full result set
+                self._docs = {doc.id: self._doc_data(doc) for doc in docs}
+                self._synced = True
+                self._ready = True
+            else:
+                for change in changes:
+                    doc = change.document
+                    if change.type.name == 'REMOVED':
+                        self._docs.pop(doc.id, None)
+                    else:  # ADDED / MODIFIED
+                        self._docs[doc.id] = self._doc_data(doc)
+            self._updated_at = self._snapshot_at = time.monotonic()
+            self.snapshots += 1
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def is_running(self) -> bool:
+        """Cache attached to a client (reads go through items())"""
+        return self._client is not None
+
+    def staleness_seconds(self) -> Optional[float]:
+        if self._updated_at is None:
+            return None
+        return time.monotonic() - self._updated_at
+
+    def listener_alive(self) -> bool:
+        """Listener attached, synced and not closed by an error"""
+        watch = self._watch
+        if watch is None or self._error is not None or not self._synced:
+            return False
+        # google-cloud-firestore's Watch turns inactive when its stream dies
+        return bool(getattr(watch, 'is_active', True))
+
+    def is_fresh(self) -> bool:
+        if not self._ready:
+            return False
+        if self.listener_alive():
+            return True
+        staleness = self.staleness_seconds()
+        return staleness is not None and staleness <= self.max_staleness_seconds
+
+    def _reseed(self) -> None:
+        """Direct query: replaces the cached copy"""
+        docs = {}
+        for doc in self._query().stream():
+            docs[doc.id] = self._doc_data(doc)
+        with self._lock:
+            self._docs = docs
+            self._updated_at = time.monotonic()
+            # The listener keeps applying its deltas on top of this copy
+            self._ready = True
+
+    def items(self, field: Optional[str] = None, value=None) -> List[Dict]:
+        """
+        Cached documents, optionally filtered by field == value.
+
+        Returns:
+            List of document dicts (copies)
+        """
+        if self._client is None:
+            return []
+
+        staleness = self.staleness_seconds()
+        if staleness is not None:
+            self.max_staleness_seen = max(self.max_staleness_seen, staleness)
+
+        if self.is_fresh():
+            self.hits += 1
+        elif time.monotonic() < self._retry_at and self._updated_at is not None:
+            self.stale_reads += 1
+        else:
+            self.fallbacks += 1
+            self._refresh()
+
+        with self._lock:
+            docs = list(self._docs.values())
+        return [dict(d) for d in docs if field is None or d.get(field) == value]
+
+    def _refresh(self) -> None:
+        """Restart a dead listener and reseed; on failure keep the old copy"""
+        if self._watch is None or not getattr(self._watch, 'is_active', True):
+            self.restarts += 1
+            self.start(self._client)
+        try:
+            self._reseed()
+            self._reseed_error = None
+            self._retry_at = 0.0
+        except Exception as e:
+            self.failed_reseeds += 1
+            self._reseed_error = str(e)
+            self._retry_at = time.monotonic() + self.retry_seconds
+            print(f'[FirestoreCache] Reseed of {self.collection} failed, serving the cached copy: {e}')
+            if self._updated_at is None:
+                raise  # Nothing to serve
+
+    def stats(self) -> Dict:
+        snapshot_age = None if self._snapshot_at is None else time.monotonic() - self._snapshot_at
+        return {
+            'collection': self.collection,
+            'listening': self._watch is not None,
+            'listener_alive': self.listener_alive(),
+            'last_snapshot_seconds': snapshot_age,
+            'ready': self._ready,
+            'error': self._error,
+            'reseed_error': self._reseed_error,
+            'documents': len(self._docs),
+            'staleness_seconds': self.staleness_seconds(),
+            'max_staleness_seen': self.max_staleness_seen,
+            'hits': self.hits,
+            'fallbacks': self.fallbacks,
+            'failed_reseeds': self.failed_reseeds,
+            'stale_reads': self.stale_reads,
+            'restarts': self.restarts,
+            'snapshots': self.snapshots
+        }
+
+
+# Available vehicles (VehicleRepository.list_available)
+available_vehicles_cache = FirestoreQueryCache('vehicles', filters=(('status', '==', 'available'),))
+
+
+def init_firestore_cache(app, client=None) -> None:
+    """
+    Start the snapshot listener for available vehicles (call from create_app
+    after init_firebase). `client` overrides the Firestore client, e.g. a fake.
+    """
+    if not app.config.get('FIREBASE_ENABLED', False):
+        return
+    if not app.config.get('FIRESTORE_CACHE_ENABLED', True):
+        print('[FirestoreCache] Disabled in config')
+        return
+
+    if client is None:
+        from app.utils.firebase_client import get_db
+        client = get_db()
+    if client is None:
+        return
+
+    available_vehicles_cache.max_staleness_seconds = app.config.get(
+        'FIRESTORE_CACHE_MAX_STALENESS_SECONDS', available_vehicles_cache.max_staleness_seconds
+    )
+    available_vehicles_cache.retry_seconds = app.config.get(
+        'FIRESTORE_CACHE_RETRY_SECONDS', available_vehicles_cache.retry_seconds
+    )
+    available_vehicles_cache.start(client)
+    app.extensions['firestore_cache'] = available_vehicles_cache
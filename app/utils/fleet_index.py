@@ -0,0 +1,593 @@
+"""
+Live Fleet Index - Compact in-memory vehicle positions/status with a grid index
+ITS Feature: Fleet Management (map, nearby search and IoT dashboards)
+"""
+import heapq
+import math
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+from typing import List, Dict, Tuple, Optional, Iterable
+
+from app.utils.geo import KM_PER_DEG_LAT, bbox_around
+from app.utils.route_optimizer import haversine_distance
+
+STATUSES = ['available', 'reserved', 'in_use', 'maintenance', 'offline']
+VEHICLE_TYPES = ['bike', 'motorbike', 'car']
+
+NAN = float('nan')
+
+
+def _code(values: List[str], value: Optional[str]) -> int:
+    """Small integer code for a status/type string (new values are appended)"""
+    if value is None:
+        return -1
+    try:
+        return values.index(value)
+    except ValueError:
+        values.append(value)
+        return len(values) - 1
+
+
+def vehicle_snapshot(vehicle) -> Tuple:
+    """
+    Capture the indexed fields of a Vehicle model (or Firestore dict).
+
+    Returns:
+        (id, lat, lng, status, type, battery, fuel, meta) where meta is
+        (code, brand, model, license_plate, price_per_minute, qr_code)
+    """
+    get = vehicle.get if isinstance(vehicle, dict) else lambda key: getattr(vehicle, key, None)
+    return (
+        get('id'),
+        get('latitude'),
+        get('longitude'),
+        get('status'),
+        get('vehicle_type'),
+        get('battery_level'),
+        get('fuel_level'),
+        (get('vehicle_code'), get('brand'), get('model'), get('license_plate'),
+         get('price_per_minute'), get('qr_code'))
+    )
+
+
+def vehicle_to_dict(vehicle) -> Dict:
+    """Vehicle model fields in the same dict format as FleetIndex.to_dict()"""
+    vehicle_id, lat, lng, status, vehicle_type, battery, fuel, meta = vehicle_snapshot(vehicle)
+    code, brand, model, plate, price, qr = meta
+    return {
+        'id': vehicle_id,
+        'vehicle_code': code,
+        'vehicle_type': vehicle_type,
+        'brand': brand,
+        'model': model,
+        'license_plate': plate,
+        'latitude': lat,
+        'longitude': lng,
+        'status': status,
+        'battery_level': battery,
+        'fuel_level': fuel,
+        'price_per_minute': price,
+        'qr_code': qr
+    }
+
+
+class FleetIndex:
+    """
+    Struct-of-arrays vehicle index.
+
+    Each vehicle occupies one slot in parallel typed arrays (id, lat, lng,
+    status, type, battery, fuel) plus a tuple of display fields. A uniform
+    lat/lng grid maps cells to slots so radius queries only visit nearby
+    cells. Writes come from committed ORM changes (see init_fleet_index);
+    each process keeps its own copy and periodically resyncs from the
+    database to pick up changes made by other workers.
+    """
+
+    def __init__(self, cell_deg: float = 0.01, resync_seconds: float = 30, full_reload_seconds: float = 600):
+        self.cell_deg = cell_deg
+        self.resync_seconds = resync_seconds
+        self.full_reload_seconds = full_reload_seconds
+
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._reset()
+        self._loaded = False
+        self._last_sync: Optional[datetime] = None
+        self._last_sync_at = 0.0
+        self._last_full_at = 0.0
+
+    def _reset(self) -> None:
+        self.ids = array('q')
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.status_codes = array('b')
+        self.type_codes = array('b')
+        self.battery = array('d')
+        self.fuel = array('d')
+        self.meta: List[Optional[Tuple]] = []
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._cells: Dict[Tuple[int, int], set] = {}
+
+    def _cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def add_listener(self, callback) -> None:
+        """
+        Register callback(kind, payload):
+        ('upsert', vehicle dict), ('remove', vehicle id) or ('reload', None)
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, kind: str, payload) -> None:
+        for callback in self._listeners:
+            try:
+                callback(kind, payload)
+            except Exception as e:
+                print(f'[FleetIndex] Listener error: {e}')
+
+    def upsert(self, snapshot: Tuple, notify: bool = True) -> None:
+        """Insert or update one vehicle from a vehicle_snapshot() tuple"""
+        vehicle_id, lat, lng, status, vehicle_type, battery, fuel, meta = snapshot
+        if vehicle_id is None or lat is None or lng is None:
+            return
+
+        with self._lock:
+            slot = self._slots.get(vehicle_id)
+            if slot is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    slot = len(self.ids)
+                    self.ids.append(0)
+                    self.lats.append(0.0)
+                    self.lngs.append(0.0)
+                    self.status_codes.append(-1)
+                    self.type_codes.append(-1)
+                    self.battery.append(NAN)
+                    self.fuel.append(NAN)
+                    self.meta.append(None)
+                self._slots[vehicle_id] = slot
+            else:
+                old_cell = self._cell_of(self.lats[slot], self.lngs[slot])
+                self._cells.get(old_cell, set()).discard(slot)
+
+            self.ids[slot] = vehicle_id
+            self.lats[slot] = float(lat)
+            self.lngs[slot] = float(lng)
+            self.status_codes[slot] = _code(STATUSES, status)
+            self.type_codes[slot] = _code(VEHICLE_TYPES, vehicle_type)
+            self.battery[slot] = NAN if battery is None else float(battery)
+            self.fuel[slot] = NAN if fuel is None else float(fuel)
+            self.meta[slot] = meta
+            self._cells.setdefault(self._cell_of(lat, lng), set()).add(slot)
+
+        if notify and self._listeners:
+            self._notify('upsert', self.to_dict(slot))
+
+    def remove(self, vehicle_id: int, notify: bool = True) -> None:
+        """Remove a vehicle from the index"""
+        with self._lock:
+            slot = self._slots.pop(vehicle_id, None)
+            if slot is None:
+                return
+            self._cells.get(self._cell_of(self.lats[slot], self.lngs[slot]), set()).discard(slot)
+            self.ids[slot] = 0
+            self.meta[slot] = None
+            self._free.append(slot)
+
+        if notify and self._listeners:
+            self._notify('remove', vehicle_id)
+
+    # ------------------------------------------------------------------
+    # Loading / resync
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _query_rows(since: Optional[datetime] = None, filter_clause=None):
+        from app.models import db, Vehicle, VehicleTelemetryState as State
+        # Battery/fuel come from the latest telemetry when the vehicle reports
+        query = db.session.query(
+            Vehicle.id, Vehicle.latitude, Vehicle.longitude, Vehicle.status,
+            Vehicle.vehicle_type,
+            db.func.coalesce(State.battery_level, Vehicle.battery_level),
+            db.func.coalesce(State.fuel_level, Vehicle.fuel_level),
+            Vehicle.vehicle_code, Vehicle.brand, Vehicle.model, Vehicle.license_plate,
+            Vehicle.price_per_minute, Vehicle.qr_code
+        ).outerjoin(State, State.vehicle_id == Vehicle.id)
+        if since is not None:
+            query = query.filter(Vehicle.updated_at >= since)
+        if filter_clause is not None:
+            query = query.filter(filter_clause)
+        for row in query.yield_per(1000):
+            yield (row[0], row[1], row[2], row[3], row[4], row[5], row[6], tuple(row[7:13]))
+
+    def load(self) -> None:
+        """Full reload from the database"""
+        from flask import current_app
+        self.cell_deg = current_app.config.get('FLEET_INDEX_CELL_DEG', self.cell_deg)
+        self.resync_seconds = current_app.config.get('FLEET_INDEX_RESYNC_SECONDS', self.resync_seconds)
+
+        started = datetime.utcnow()
+        with self._lock:
+            self._reset()
+            for snapshot in self._query_rows():
+                self.upsert(snapshot, notify=False)
+            self._loaded = True
+            self._last_sync = started
+            self._last_sync_at = self._last_full_at = time.monotonic()
+
+        print(f'[FleetIndex] Loaded {len(self._slots)} vehicles')
+        if self._listeners:
+            self._notify('reload', None)
+
+    def resync(self) -> int:
+        """Apply vehicles changed in the database since the last sync"""
+        started = datetime.utcnow()
+        # Small overlap covers clock skew between workers and in-flight commits
+        since = self._last_sync - timedelta(seconds=5) if self._last_sync else None
+        count = 0
+        for snapshot in self._query_rows(since):
+            self.upsert(snapshot)
+            count += 1
+        self._last_sync = started
+        self._last_sync_at = time.monotonic()
+        return count
+
+    def refresh_ids(self, vehicle_ids: Iterable[int]) -> None:
+        """
+        Re-read specific vehicles from the database (after bulk UPDATEs,
+        which bypass the ORM events that normally feed the index).
+        """
+        from app.models import Vehicle
+        vehicle_ids = list(vehicle_ids)
+        if not self._loaded or not vehicle_ids:
+            return
+        seen = set()
+        for start in range(0, len(vehicle_ids), 500):
+            chunk = vehicle_ids[start:start + 500]
+            for snapshot in self._query_rows(filter_clause=Vehicle.id.in_(chunk)):
+                self.upsert(snapshot)
+                seen.add(snapshot[0])
+        for vehicle_id in vehicle_ids:
+            if vehicle_id not in seen:
+                self.remove(vehicle_id)
+
+    def update_telemetry(
+        self,
+        vehicle_id: int,
+        lat: Optional[float] = None,
+        lng: Optional[float] = None,
+        battery: Optional[float] = None,
+        fuel: Optional[float] = None
+    ) -> bool:
+        """
+        Patch position/battery/fuel of an indexed vehicle without a database
+        read (telemetry ingestion). None keeps the current value.
+
+        Returns:
+            False if the vehicle is not in the index
+        """
+        with self._lock:
+            slot = self._slots.get(vehicle_id)
+            if slot is None:
+                return False
+            status = self.status_codes[slot]
+            vehicle_type = self.type_codes[slot]
+            old_battery = self.battery[slot]
+            old_fuel = self.fuel[slot]
+            snapshot = (
+                vehicle_id,
+                self.lats[slot] if lat is None else lat,
+                self.lngs[slot] if lng is None else lng,
+                STATUSES[status] if status >= 0 else None,
+                VEHICLE_TYPES[vehicle_type] if vehicle_type >= 0 else None,
+                battery if battery is not None else (None if old_battery != old_battery else old_battery),
+                fuel if fuel is not None else (None if old_fuel != old_fuel else old_fuel),
+                self.meta[slot]
+            )
+        self.upsert(snapshot)
+        return True
+
+    def ensure_loaded(self) -> None:
+        """Load on first use, resync periodically (call inside an app context)"""
+        now = time.monotonic()
+        if not self._loaded or now - self._last_full_at > self.full_reload_seconds:
+            self.load()
+        elif now - self._last_sync_at > self.resync_seconds:
+            self.resync()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def __len__(self):
+        return len(self._slots)
+
+    def slot_of(self, vehicle_id: int) -> Optional[int]:
+        return self._slots.get(vehicle_id)
+
+    def to_dict(self, slot: int) -> Dict:
+        """Vehicle fields of a slot (same keys as the Vehicle model)"""
+        code, brand, model, plate, price, qr = self.meta[slot] or (None,) * 6
+        status = self.status_codes[slot]
+        vehicle_type = self.type_codes[slot]
+        battery = self.battery[slot]
+        fuel = self.fuel[slot]
+        return {
+            'id': self.ids[slot],
+            'vehicle_code': code,
+            'vehicle_type': VEHICLE_TYPES[vehicle_type] if vehicle_type >= 0 else None,
+            'brand': brand,
+            'model': model,
+            'license_plate': plate,
+            'latitude': self.lats[slot],
+            'longitude': self.lngs[slot],
+            'status': STATUSES[status] if status >= 0 else None,
+            'battery_level': None if battery != battery else battery,
+            'fuel_level': None if fuel != fuel else fuel,
+            'price_per_minute': price,
+            'qr_code': qr
+        }
+
+    def get(self, vehicle_id: int) -> Optional[Dict]:
+        slot = self._slots.get(vehicle_id)
+        return self.to_dict(slot) if slot is not None else None
+
+    @staticmethod
+    def _filter_codes(statuses: Optional[Iterable[str]], types: Optional[Iterable[str]]):
+        # Unknown values simply match nothing (no new codes are allocated)
+        status_codes = None if statuses is None else {STATUSES.index(s) for s in statuses if s in STATUSES}
+        type_codes = None if types is None else {VEHICLE_TYPES.index(t) for t in types if t in VEHICLE_TYPES}
+        return status_codes, type_codes
+
+    @staticmethod
+    def _range_table(range_rates: Optional[Dict[str, Dict[str, float]]]) -> Optional[List[Tuple[float, float]]]:
+        """(fuel, battery) km-per-percent rates indexed by type code"""
+        if range_rates is None:
+            return None
+        return [
+            (range_rates.get(t, {}).get('fuel', NAN), range_rates.get(t, {}).get('battery', NAN))
+            for t in VEHICLE_TYPES
+        ]
+
+    def range_km(self, slot: int, range_table: List[Tuple[float, float]]) -> float:
+        """Estimated range of a slot (NaN without battery/fuel data or rate)"""
+        type_code = self.type_codes[slot]
+        if type_code < 0 or type_code >= len(range_table):
+            return NAN
+        fuel = self.fuel[slot]
+        if fuel == fuel:
+            return max(fuel, 0.0) * range_table[type_code][0]
+        battery = self.battery[slot]
+        if battery == battery:
+            return max(battery, 0.0) * range_table[type_code][1]
+        return NAN
+
+    def nearby(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: float,
+        statuses: Optional[Iterable[str]] = ('available',),
+        types: Optional[Iterable[str]] = None,
+        allowed_ids: Optional[set] = None,
+        min_range_km: Optional[float] = None,
+        range_rates: Optional[Dict[str, Dict[str, float]]] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        Vehicles within radius_km, sorted by distance.
+
+        Args:
+            lat, lng: Search center
+            radius_km: Search radius
+            statuses: Allowed statuses (None = any)
+            types: Allowed vehicle types (None = any)
+            allowed_ids: Restrict to these vehicle ids (e.g. search matches)
+            min_range_km: Only vehicles whose estimated range (battery/fuel
+                level x range_rates) reaches this; vehicles without
+                battery/fuel data are skipped
+            range_rates: {vehicle_type: {'fuel'|'battery': km per %}}
+
+        Returns:
+            List of (distance_km, slot); use to_dict(slot) for fields
+        """
+        status_codes, type_codes = self._filter_codes(statuses, types)
+        range_table = self._range_table(range_rates) if min_range_km is not None else None
+        min_lat, min_lng, max_lat, max_lng = bbox_around(lat, lng, radius_km)
+        i0, j0 = self._cell_of(min_lat, min_lng)
+        i1, j1 = self._cell_of(max_lat, max_lng)
+
+        results = []
+        with self._lock:
+            cells = self._cells
+            lats, lngs = self.lats, self.lngs
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    for slot in cells.get((i, j), ()):
+                        if status_codes is not None and self.status_codes[slot] not in status_codes:
+                            continue
+                        if type_codes is not None and self.type_codes[slot] not in type_codes:
+                            continue
+                        if allowed_ids is not None and self.ids[slot] not in allowed_ids:
+                            continue
+                        if range_table is not None and not self.range_km(slot, range_table) >= min_range_km:
+                            continue
+                        distance = haversine_distance(lat, lng, lats[slot], lngs[slot])
+                        if distance <= radius_km:
+                            results.append((distance, slot))
+        results.sort()
+        return results
+
+    def k_nearest(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        max_radius_km: float,
+        statuses: Optional[Iterable[str]] = ('available',),
+        types: Optional[Iterable[str]] = None,
+        after: Optional[Tuple[float, int]] = None,
+        allowed_ids: Optional[set] = None,
+        min_range_km: Optional[float] = None,
+        range_rates: Optional[Dict[str, Dict[str, float]]] = None
+    ) -> List[Tuple[float, int]]:
+        """
+        The k closest vehicles, visiting grid rings outward from the center.
+
+        Rings stop expanding once the k-th best distance is closer than any
+        point of the next ring, so the cost tracks k rather than the number
+        of vehicles in max_radius_km.
+
+        Args:
+            lat, lng: Search center
+            k: Number of vehicles to return
+            max_radius_km: Never return vehicles farther than this
+            statuses, types, allowed_ids, min_range_km, range_rates: Same filters as nearby()
+            after: Cursor (distance_km, vehicle_id); only vehicles ordered
+                strictly after it are returned (next page)
+
+        Returns:
+            List of (distance_km, slot) sorted by (distance, vehicle id)
+        """
+        if k <= 0:
+            return []
+        status_codes, type_codes = self._filter_codes(statuses, types)
+        range_table = self._range_table(range_rates) if min_range_km is not None else None
+
+        # Smallest km width of one cell anywhere in the search area
+        # (longitude shrinks with latitude, so take the farthest from the equator)
+        far_lat = min(90.0, abs(lat) + max_radius_km / KM_PER_DEG_LAT)
+        cell_km = self.cell_deg * KM_PER_DEG_LAT * min(1.0, max(math.cos(math.radians(far_lat)), 0.01))
+        max_ring = int(max_radius_km / cell_km) + 1
+        ci, cj = self._cell_of(lat, lng)
+
+        heap: List[Tuple[float, int, int]] = []  # max-heap via (-distance, -id, slot)
+        with self._lock:
+            cells = self._cells
+            lats, lngs, ids = self.lats, self.lngs, self.ids
+            for ring in range(max_ring + 1):
+                if len(heap) == k and -heap[0][0] <= (ring - 1) * cell_km:
+                    break  # No point in this ring or beyond can beat the current k-th
+                if ring == 0:
+                    ring_cells = [(ci, cj)]
+                else:
+                    ring_cells = [(ci + di, cj + dj)
+                                  for di in range(-ring, ring + 1)
+                                  for dj in (-ring, ring)]
+                    ring_cells += [(ci + di, cj + dj)
+                                   for di in (-ring, ring)
+                                   for dj in range(-ring + 1, ring)]
+                for cell in ring_cells:
+                    for slot in cells.get(cell, ()):
+                        if status_codes is not None and self.status_codes[slot] not in status_codes:
+                            continue
+                        if type_codes is not None and self.type_codes[slot] not in type_codes:
+                            continue
+                        if allowed_ids is not None and self.ids[slot] not in allowed_ids:
+                            continue
+                        if range_table is not None and not self.range_km(slot, range_table) >= min_range_km:
+                            continue
+                        distance = haversine_distance(lat, lng, lats[slot], lngs[slot])
+                        if distance > max_radius_km:
+                            continue
+                        key = (distance, ids[slot])
+                        if after is not None and key <= after:
+                            continue
+                        item = (-distance, -ids[slot], slot)
+                        if len(heap) < k:
+                            heapq.heappush(heap, item)
+                        elif item > heap[0]:
+                            heapq.heapreplace(heap, item)
+
+        return [(-neg_distance, slot) for neg_distance, _, slot in sorted(heap, reverse=True)]
+
+    def select(
+        self,
+        statuses: Optional[Iterable[str]] = None,
+        types: Optional[Iterable[str]] = None
+    ) -> List[Dict]:
+        """All vehicles matching status/type filters, ordered by id"""
+        status_codes, type_codes = self._filter_codes(statuses, types)
+        with self._lock:
+            slots = [
+                slot for vehicle_id, slot in sorted(self._slots.items())
+                if (status_codes is None or self.status_codes[slot] in status_codes)
+                and (type_codes is None or self.type_codes[slot] in type_codes)
+            ]
+            return [self.to_dict(slot) for slot in slots]
+
+
+# Shared per-process index
+fleet_index = FleetIndex()
+
+
+_orm_hooks_installed = False
+
+
+def _session_pending(session) -> Dict:
+    return session.info.setdefault('fleet_index_pending', {})
+
+
+def init_fleet_index(app) -> None:
+    """
+    Hook the fleet index into ORM events (call once from create_app).
+
+    Changes flushed by a session are buffered in session.info and applied
+    only after the transaction commits, so rolled-back writes never reach
+    the index.
+    """
+    global _orm_hooks_installed
+    if not app.config.get('FLEET_INDEX_ENABLED', True):
+        print('[FleetIndex] Disabled in config')
+        return
+
+    app.extensions['fleet_index'] = fleet_index
+    if _orm_hooks_installed:
+        return
+    _orm_hooks_installed = True
+
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from app.models import Vehicle
+
+    def on_vehicle_write(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            _session_pending(session)[target.id] = vehicle_snapshot(target)
+
+    def on_vehicle_delete(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            _session_pending(session)[target.id] = None
+
+    def on_commit(session):
+        pending = session.info.pop('fleet_index_pending', None)
+        if not pending or not fleet_index._loaded:
+            return
+        for vehicle_id, snapshot in pending.items():
+            if snapshot is None:
+                fleet_index.remove(vehicle_id)
+            else:
+                fleet_index.upsert(snapshot)
+
+    def on_rollback(session, previous_transaction):
+        session.info.pop('fleet_index_pending', None)
+
+    event.listen(Vehicle, 'after_insert', on_vehicle_write)
+    event.listen(Vehicle, 'after_update', on_vehicle_write)
+    event.listen(Vehicle, 'after_delete', on_vehicle_delete)
+    event.listen(Session, 'after_commit', on_commit)
+    event.listen(Session, 'after_soft_rollback', on_rollback)
+    print('[FleetIndex] ORM sync enabled')
+
+
+def fleet_index_enabled() -> bool:
+    from flask import current_app
+    return 'fleet_index' in current_app.extensions
@@ -0,0 +1,179 @@
+"""
+Fleet Stream Hub - Fan-out of live vehicle changes to SSE subscribers
+ITS Feature: Fleet Management (real-time map & IoT monitor updates)
+"""
+import json
+import queue
+import threading
+from typing import Dict, Optional, Tuple, Iterable
+
+from app.utils.fleet_index import fleet_index
+
+# Fields pushed to clients (a change in any other field is not streamed)
+STREAM_FIELDS = ('latitude', 'longitude', 'status', 'battery_level', 'fuel_level')
+
+
+def _delta_payload(vehicle: Dict) -> Dict:
+    return {
+        'id': vehicle['id'],
+        'vehicle_type': vehicle['vehicle_type'],
+        'latitude': vehicle['latitude'],
+        'longitude': vehicle['longitude'],
+        'status': vehicle['status'],
+        'battery_level': vehicle['battery_level'],
+        'fuel_level': vehicle['fuel_level']
+    }
+
+
+def format_sse(event: str, data: Dict) -> str:
+    """Encode one server-sent event"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+class FleetSubscriber:
+    """One SSE client: its filters, the vehicles it currently sees and a bounded queue"""
+
+    def __init__(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        types: Optional[Iterable[str]] = None,
+        max_queue: int = 500
+    ):
+        self.bbox = bbox
+        self.types = set(types) if types else None
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.visible = set()
+        self.dropped = 0
+
+    def matches(self, vehicle: Dict) -> bool:
+        if self.types is not None and vehicle['vehicle_type'] not in self.types:
+            return False
+        if self.bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = self.bbox
+            if not (min_lat <= vehicle['latitude'] <= max_lat and min_lng <= vehicle['longitude'] <= max_lng):
+                return False
+        return True
+
+    def offer(self, event: str, data: Dict) -> None:
+        """Queue an event; a slow client gets a single 'resync' instead of unbounded backlog"""
+        try:
+            self.queue.put_nowait((event, data))
+        except queue.Full:
+            self.dropped += 1
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.visible.clear()
+            self.queue.put_nowait(('resync', {'reason': 'client too slow'}))
+
+
+class FleetStreamHub:
+    """
+    Single change feed (fleet index listener) fanned out to many subscribers.
+
+    Only vehicles whose streamed fields actually changed are published, and
+    each subscriber only receives vehicles inside its bbox/type filter. A
+    vehicle leaving a subscriber's filter produces one 'leave' event.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._last: Dict[int, Tuple] = {}
+
+    def subscribe(self, subscriber: FleetSubscriber) -> FleetSubscriber:
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FleetSubscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def on_fleet_change(self, kind: str, payload) -> None:
+        """Fleet index listener"""
+        if kind == 'reload':
+            with self._lock:
+                self._last.clear()
+            return
+
+        if kind == 'remove':
+            with self._lock:
+                self._last.pop(payload, None)
+                subscribers = list(self._subscribers)
+            for sub in subscribers:
+                if payload in sub.visible:
+                    sub.visible.discard(payload)
+                    sub.offer('leave', {'id': payload})
+            return
+
+        state = tuple(payload[f] for f in STREAM_FIELDS)
+        with self._lock:
+            if self._last.get(payload['id']) == state:
+                return
+            self._last[payload['id']] = state
+            subscribers = list(self._subscribers)
+
+        if not subscribers:
+            return
+        data = _delta_payload(payload)
+        for sub in subscribers:
+            if sub.matches(payload):
+                sub.visible.add(payload['id'])
+                sub.offer('vehicle', data)
+            elif payload['id'] in sub.visible:
+                sub.visible.discard(payload['id'])
+                sub.offer('leave', {'id': payload['id']})
+
+
+# Shared per-process hub
+fleet_stream_hub = FleetStreamHub()
+
+
+def init_fleet_stream(app) -> None:
+    """Feed the hub from the fleet index (call from create_app)"""
+    if 'fleet_index' not in app.extensions:
+        return
+    if fleet_stream_hub.on_fleet_change not in fleet_index._listeners:
+        fleet_index.add_listener(fleet_stream_hub.on_fleet_change)
+    app.extensions['fleet_stream'] = fleet_stream_hub
+
+
+def stream_events(subscriber: FleetSubscriber, heartbeat_seconds: float = 15):
+    """
+    Generator of SSE text for one subscriber.
+
+    Starts with a 'snapshot' of the vehicles matching its filters, then
+    yields deltas as they arrive and a comment line as heartbeat.
+    Must run inside an app context (use stream_with_context). The
+    subscriber is registered here rather than by the caller so that a
+    response that is never iterated never leaves it in the hub.
+    """
+    fleet_stream_hub.subscribe(subscriber)
+    try:
+        fleet_index.ensure_loaded()
+        snapshot = [_delta_payload(v) for v in fleet_index.select() if subscriber.matches(v)]
+        subscriber.visible = {v['id'] for v in snapshot}
+        yield format_sse('snapshot', {'vehicles': snapshot})
+
+        while True:
+            try:
+                event, data = subscriber.queue.get(timeout=heartbeat_seconds)
+            except queue.Empty:
+                # Pick up changes committed by other worker processes
+                fleet_index.ensure_loaded()
+                yield ': heartbeat\n\n'
+                continue
+            if event == 'resync':
+                snapshot = [_delta_payload(v) for v in fleet_index.select() if subscriber.matches(v)]
+                subscriber.visible = {v['id'] for v in snapshot}
+                yield format_sse('snapshot', {'vehicles': snapshot})
+                continue
+            yield format_sse(event, data)
+    finally:
+        fleet_stream_hub.unsubscribe(subscriber)
@@ -0,0 +1,155 @@
+"""
+Geo Helpers - Geohash encoding and cell coverage for spatial prefilters
+ITS Feature: Fleet Management (indexed nearby-vehicle search)
+"""
+import math
+from typing import List, Tuple
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Precision stored on vehicles (~153m x 153m cells)
+VEHICLE_GEOHASH_PRECISION = 7
+
+# Same sphere as the haversine distance filters (R = 6371 km)
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+
+def geohash_encode(lat: float, lng: float, precision: int = VEHICLE_GEOHASH_PRECISION) -> str:
+    """
+    Encode a point as a geohash string.
+
+    Args:
+        lat, lng: Point coordinates
+        precision: Number of characters
+
+    Returns:
+        Geohash string (e.g. 'w3gv2c8')
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # Even bits encode longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """
+    Bounding box of a geohash cell.
+
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+    """
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """(lat_deg, lng_deg) size of geohash cells at a precision"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def bbox_around(lat: float, lng: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """
+    Bounding box containing a circle (great-circle radius on the haversine
+    sphere, so no point within radius_km falls outside).
+
+    Returns:
+        (min_lat, min_lng, max_lat, max_lng)
+    """
+    d_lat = radius_km / KM_PER_DEG_LAT
+    cos_lat = max(math.cos(math.radians(lat)), 0.01)
+    d_lng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / cos_lat)))
+    return lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng
+
+
+def covering_geohashes(
+    min_lat: float,
+    min_lng: float,
+    max_lat: float,
+    max_lng: float,
+    max_cells: int = 16,
+    max_precision: int = VEHICLE_GEOHASH_PRECISION
+) -> List[str]:
+    """
+    Geohash prefixes covering a bounding box.
+
+    Picks the finest precision (<= max_precision) that needs at most
+    max_cells prefixes, so each prefix becomes one index range scan.
+
+    Returns:
+        Sorted list of distinct geohash prefixes
+    """
+    for precision in range(max_precision, 0, -1):
+        cell_lat, cell_lng = geohash_cell_size(precision)
+        rows = math.floor(max_lat / cell_lat) - math.floor(min_lat / cell_lat) + 1
+        cols = math.floor(max_lng / cell_lng) - math.floor(min_lng / cell_lng) + 1
+        if rows * cols <= max_cells:
+            break
+
+    cells = set()
+    lat_start = (math.floor(min_lat / cell_lat) + 0.5) * cell_lat
+    lng_start = (math.floor(min_lng / cell_lng) + 0.5) * cell_lng
+    for r in range(rows):
+        for c in range(cols):
+            cells.add(geohash_encode(
+                min(lat_start + r * cell_lat, 90.0),
+                min(lng_start + c * cell_lng, 180.0),
+                precision
+            ))
+    return sorted(cells)
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Exclusive upper bound for a string range scan on a geohash prefix"""
+    return prefix + '~'  # '~' sorts after every base32 character
@@ -0,0 +1,278 @@
+"""
+Geofence Monitor - Per-batch geofence evaluation of incoming telemetry
+against cached per-vehicle circular fences, with debounced violation
+state and alerts on the transition into violation
+ITS Feature: Fleet Management (geofencing / theft detection)
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Tuple
+
+from app.utils.geo import EARTH_RADIUS_KM
+from app.utils.route_optimizer import haversine_distance
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def distances_km(lats, lngs, center_lats, center_lngs) -> List[float]:
+    """
+    Haversine distances between paired points, vectorized with numpy when
+    it is installed (route_optimizer.haversine_distance per pair otherwise).
+    """
+    if np is not None:
+        lat1 = np.radians(np.asarray(lats, dtype=float))
+        lat2 = np.radians(np.asarray(center_lats, dtype=float))
+        d_lat = lat2 - lat1
+        d_lng = np.radians(np.asarray(center_lngs, dtype=float) - np.asarray(lngs, dtype=float))
+        a = np.sin(d_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lng / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))).tolist()
+
+    return [haversine_distance(*pair) for pair in zip(lats, lngs, center_lats, center_lngs)]
+
+
+class GeofenceResult(NamedTuple):
+    states: Dict[int, bool]  # Debounced violation state per evaluated vehicle
+    entered: List[Dict]  # Samples at which a vehicle entered violation
+
+
+class GeofenceMonitor:
+    """
+    Fences are cached per process (vehicle id -> center, radius km) and
+    reloaded every `ttl_seconds`.
+
+    Each sample is flagged outside when its distance to the fence center
+    exceeds the radius. The per-vehicle violation state only flips after
+    `debounce_samples` consecutive samples disagree with it, and leaving a
+    violation also requires being `hysteresis` x radius back inside, so a
+    vehicle hovering at the boundary does not flap. The state is persisted
+    in vehicle_telemetry_state.geofence_violation and reloaded from there
+    for vehicles this process has not seen yet. Samples at or before a
+    vehicle's newest evaluated sample (redeliveries, late arrivals) are
+    flagged but do not count towards the debounce.
+    """
+
+    def __init__(self, ttl_seconds: float = 60, debounce_samples: int = 3, hysteresis: float = 0.05,
+                 default_radius_km: float = 50, alert_cooldown_seconds: float = 900):
+        self.ttl_seconds = ttl_seconds
+        self.debounce_samples = debounce_samples
+        self.hysteresis = hysteresis
+        self.default_radius_km = default_radius_km
+        self.alert_cooldown_seconds = alert_cooldown_seconds
+
+        self._lock = threading.Lock()
+        self._fences: Dict[int, Tuple[float, float, float]] = {}
+        self._loaded_at = 0.0
+        self._states: Dict[int, List] = {}  # vehicle_id -> [in_violation, disagreeing streak, last sample time]
+        self._last_alert: Dict[int, float] = {}
+
+        # Metrics
+        self.samples_checked = 0
+        self.transitions = 0
+        self.alerts_raised = 0
+
+    def configure(self, config) -> None:
+        self.ttl_seconds = config.get('GEOFENCE_CACHE_TTL_SECONDS', self.ttl_seconds)
+        self.debounce_samples = config.get('GEOFENCE_DEBOUNCE_SAMPLES', self.debounce_samples)
+        self.hysteresis = config.get('GEOFENCE_HYSTERESIS', self.hysteresis)
+        self.default_radius_km = config.get('DEFAULT_GEOFENCE_RADIUS', self.default_radius_km)
+        self.alert_cooldown_seconds = config.get('GEOFENCE_ALERT_COOLDOWN_SECONDS', self.alert_cooldown_seconds)
+
+    # ------------------------------------------------------------------
+    # Fence cache
+    # ------------------------------------------------------------------
+
+    def load(self) -> None:
+        """(Re)load enabled fences from the database (app context required)"""
+        from app.models import db, Vehicle
+        rows = db.session.query(
+            Vehicle.id, Vehicle.geofence_center_lat, Vehicle.geofence_center_lng, Vehicle.geofence_radius
+        ).filter(
+            Vehicle.geofence_enabled == True,
+            Vehicle.geofence_center_lat.isnot(None),
+            Vehicle.geofence_center_lng.isnot(None)
+        ).all()
+        fences = {vid: (lat, lng, radius or self.default_radius_km) for vid, lat, lng, radius in rows}
+        with self._lock:
+            self._fences = fences
+            self._loaded_at = time.monotonic()
+
+    def fences(self) -> Dict[int, Tuple[float, float, float]]:
+        if time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self.load()
+        return self._fences
+
+    def invalidate(self) -> None:
+        """Force a reload on the next batch (e.g. after a fence was edited)"""
+        self._loaded_at = 0.0
+
+    # ------------------------------------------------------------------
+    # Evaluation
+    # ------------------------------------------------------------------
+
+    def _seed_states(self, vehicle_ids) -> None:
+        """Debounced state of vehicles not seen by this process yet"""
+        missing = [vid for vid in vehicle_ids if vid not in self._states]
+        if not missing:
+            return
+        from app.models import db, VehicleTelemetryState
+        stored = {vid: (violation, timestamp) for vid, violation, timestamp in db.session.query(
+            VehicleTelemetryState.vehicle_id, VehicleTelemetryState.geofence_violation,
+            VehicleTelemetryState.timestamp
+        ).filter(VehicleTelemetryState.vehicle_id.in_(missing)).all()}
+        for vid in missing:
+            violation, timestamp = stored.get(vid, (False, None))
+            self._states[vid] = [bool(violation), 0, timestamp]
+
+    def evaluate(self, rows: List[Dict]) -> GeofenceResult:
+        """
+        Flag each sample's geofence_violation in place and update the
+        debounced state of the vehicles in the batch.
+        """
+        fences = self.fences()
+        checked = sorted(
+            (row for row in rows
+             if row['vehicle_id'] in fences and row['latitude'] is not None),
+            key=lambda r: (r['vehicle_id'], r['timestamp'])
+        )
+        if not checked:
+            return GeofenceResult({}, [])
+
+        centers = [fences[row['vehicle_id']] for row in checked]
+        distances = distances_km(
+            [row['latitude'] for row in checked], [row['longitude'] for row in checked],
+            [c[0] for c in centers], [c[1] for c in centers]
+        )
+        self.samples_checked += len(checked)
+
+        with self._lock:
+            self._seed_states({row['vehicle_id'] for row in checked})
+            entered = []
+            for row, (_, _, radius), distance in zip(checked, centers, distances):
+                outside = distance > radius
+                row['geofence_violation'] = outside
+                state = self._states[row['vehicle_id']]
+                if state[2] is not None and row['timestamp'] <= state[2]:
+                    continue  # Already counted (or older than what was)
+                state[2] = row['timestamp']
+                if state[0]:
+                    # Leaving a violation needs a margin inside the fence
+                    disagrees = distance <= radius * (1 - self.hysteresis)
+                else:
+                    disagrees = outside
+                state[1] = state[1] + 1 if disagrees else 0
+                if state[1] >= self.debounce_samples:
+                    state[0], state[1] = not state[0], 0
+                    self.transitions += 1
+                    if state[0]:
+                        entered.append(dict(row, distance_km=distance, radius_km=radius))
+            states = {vid: self._states[vid][0] for vid in {row['vehicle_id'] for row in checked}}
+        return GeofenceResult(states, entered)
+
+    def forget(self, vehicle_ids) -> None:
+        """Drop in-memory state after a rollback; it is reloaded from the database"""
+        with self._lock:
+            for vid in vehicle_ids:
+                self._states.pop(vid, None)
+
+    # ------------------------------------------------------------------
+    # Alerts
+    # ------------------------------------------------------------------
+
+    def create_alerts(self, entered: List[Dict]) -> List:
+        """
+        EmergencyAlert for each vehicle that entered violation, added to the
+        caller's transaction. A vehicle gets at most one geofence alert per
+        cooldown period (also across processes, via the alerts table).
+        """
+        if not entered:
+            return []
+        from app.models import db, EmergencyAlert, Trip
+
+        now = time.monotonic()
+        since = datetime.utcnow() - timedelta(seconds=self.alert_cooldown_seconds)
+        due = [s for s in entered if now - self._last_alert.get(s['vehicle_id'], -1e18) >= self.alert_cooldown_seconds]
+        if not due:
+            return []
+        ids = [s['vehicle_id'] for s in due]
+        recent = {vid for (vid,) in db.session.query(EmergencyAlert.vehicle_id).filter(
+            EmergencyAlert.vehicle_id.in_(ids),
+            EmergencyAlert.alert_type == 'geofence',
+            EmergencyAlert.created_at >= since
+        ).all()}
+        trips = {vid: (trip_id, user_id) for trip_id, user_id, vid in db.session.query(
+            Trip.id, Trip.user_id, Trip.vehicle_id
+        ).filter(Trip.status == 'in_progress', Trip.vehicle_id.in_(ids)).all()}
+
+        alerts = []
+        for sample in due:
+            vid = sample['vehicle_id']
+            self._last_alert[vid] = now
+            if vid in recent:
+                continue
+            trip_id, user_id = trips.get(vid, (None, None))
+            alert = EmergencyAlert(
+                alert_code=f"GEO{vid}-{sample['timestamp'].strftime('%Y%m%d%H%M%S')}",
+                user_id=user_id,
+                vehicle_id=vid,
+                trip_id=trip_id,
+                alert_type='geofence',
+                severity='high',
+                description=f"Xe ra khỏi vùng cho phép: cách tâm {sample['distance_km']:.1f} km "
+                            f"(bán kính {sample['radius_km']:.1f} km)",
+                latitude=sample['latitude'],
+                longitude=sample['longitude'],
+                status='open'
+            )
+            db.session.add(alert)
+            alerts.append(alert)
+        self.alerts_raised += len(alerts)
+        return alerts
+
+    @staticmethod
+    def notify(alerts: List) -> None:
+        """In-app notifications for committed alerts (renter and admins)"""
+        if not alerts:
+            return
+        from app.models import User
+        from app.utils.notification_helper import create_notification
+
+        admin_ids = [uid for (uid,) in User.query.with_entities(User.id).filter(User.role == 'admin').all()]
+        for alert in alerts:
+            recipients = set(admin_ids)
+            if alert.user_id:
+                recipients.add(alert.user_id)
+            for user_id in recipients:
+                create_notification(
+                    user_id=user_id,
+                    type='emergency',
+                    title='Cảnh báo: xe ra khỏi vùng cho phép',
+                    message=f'{alert.description} (xe #{alert.vehicle_id})',
+                    icon='fa-draw-polygon',
+                    color='danger',
+                    related_id=alert.id,
+                    related_type='emergency_alert',
+                    action_url='/admin/alerts' if user_id in admin_ids else '/emergency/my-alerts'
+                )
+            print(f'[Geofence] Vehicle {alert.vehicle_id} left its geofence ({alert.alert_code})')
+
+    def stats(self) -> Dict:
+        return {
+            'fences': len(self._fences),
+            'tracked_vehicles': len(self._states),
+            'samples_checked': self.samples_checked,
+            'transitions': self.transitions,
+            'alerts_raised': self.alerts_raised,
+            'vectorized': np is not None
+        }
+
+
+# Shared per-process monitor
+geofence_monitor = GeofenceMonitor()
+
+
+def init_geofence_monitor(app) -> None:
+    geofence_monitor.configure(app.config)
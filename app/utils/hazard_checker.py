@@ -88,6 +88,53 @@ def calculate_polygon_bounds(polygon: List[Tuple[float, float]]) -> Dict[str, fl
     }
 
 
+def simplify_polygon(polygon: List[Tuple[float, float]], tolerance: float) -> List[Tuple[float, float]]:
+    """
+    Simplify a polygon ring with the Douglas-Peucker algorithm.
+
+    Args:
+        polygon: List of (latitude, longitude) tuples
+        tolerance: Maximum deviation in degrees
+
+    Returns:
+        Simplified list of points (at least 3, original if it cannot be reduced)
+    """
+    points = [(p[0], p[1]) for p in polygon]
+    if len(points) > 1 and points[0] == points[-1]:
+        points = points[:-1]
+    if tolerance <= 0 or len(points) <= 3:
+        return points
+
+    def perpendicular_distance(p, a, b):
+        d_lat = b[0] - a[0]
+        d_lng = b[1] - a[1]
+        if d_lat == 0 and d_lng == 0:
+            return math.hypot(p[0] - a[0], p[1] - a[1])
+        return abs(d_lng * (p[0] - a[0]) - d_lat * (p[1] - a[1])) / math.hypot(d_lat, d_lng)
+
+    # Close the ring so the first vertex is an anchor, then simplify iteratively
+    ring = points + [points[0]]
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        max_dist = 0.0
+        index = None
+        for k in range(start + 1, end):
+            dist = perpendicular_distance(ring[k], ring[start], ring[end])
+            if dist > max_dist:
+                max_dist = dist
+                index = k
+        if index is not None and max_dist > tolerance:
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    simplified = [p for p, kept in zip(ring[:-1], keep[:-1]) if kept]
+    return simplified if len(simplified) >= 3 else points
+
+
 def check_route_hazards(route_points: List[Tuple[float, float]], hazard_zones: List[Dict]) -> List[Dict]:
     """
     Check if a route passes through any hazard zones.
@@ -131,6 +178,105 @@ def check_route_hazards(route_points: List[Tuple[float, float]], hazard_zones: L
     return detected_hazards
 
 
+def decode_polyline(encoded: str, precision: int = 5) -> List[Tuple[float, float]]:
+    """
+    Decode an encoded polyline (Google / OSRM polyline format).
+    
+    Args:
+        encoded: Encoded polyline string
+        precision: Number of decimals used when encoding (5 for Google/OSRM, 6 for polyline6)
+    
+    Returns:
+        List of (latitude, longitude) tuples
+    """
+    factor = 10 ** precision
+    points = []
+    index = lat = lng = 0
+    length = len(encoded)
+    
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1f) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        points.append((lat / factor, lng / factor))
+    
+    return points
+
+
+def check_routes_hazards_batch(
+    routes: List[List[Tuple[float, float]]],
+    hazard_zones: List[Dict],
+    interpolate_km: Optional[float] = 0.1
+) -> List[List[Dict]]:
+    """
+    Check many routes against one snapshot of hazard zones.
+    
+    Polygons are converted once for the whole batch and each route is only
+    tested against zones whose bounding box overlaps the route's bounding box.
+    
+    Args:
+        routes: List of routes, each a list of (latitude, longitude) tuples
+        hazard_zones: List of hazard zone dictionaries (same format as check_route_hazards)
+        interpolate_km: Add intermediate points every N km (None to disable)
+    
+    Returns:
+        List (same order as routes) of lists of hazard zones each route passes through
+    """
+    # Prepare zones once for the whole batch
+    prepared = []
+    for zone in hazard_zones:
+        if not zone.get('is_active', True):
+            continue
+        polygon = [(p[0], p[1]) for p in zone['polygon_coordinates']]
+        prepared.append((
+            zone,
+            polygon,
+            zone['min_latitude'],
+            zone['max_latitude'],
+            zone['min_longitude'],
+            zone['max_longitude']
+        ))
+    
+    results = []
+    for route_points in routes:
+        if len(route_points) < 2 or not prepared:
+            results.append([])
+            continue
+        
+        if interpolate_km:
+            route_points = interpolate_route_points(route_points, max_distance_km=interpolate_km)
+        
+        lats = [p[0] for p in route_points]
+        lngs = [p[1] for p in route_points]
+        r_min_lat, r_max_lat = min(lats), max(lats)
+        r_min_lng, r_max_lng = min(lngs), max(lngs)
+        
+        detected = []
+        for zone, polygon, min_lat, max_lat, min_lng, max_lng in prepared:
+            # Skip zones whose bounding box does not overlap the route
+            if max_lat < r_min_lat or min_lat > r_max_lat or max_lng < r_min_lng or min_lng > r_max_lng:
+                continue
+            for point in route_points:
+                if not (min_lat <= point[0] <= max_lat and min_lng <= point[1] <= max_lng):
+                    continue
+                if point_in_polygon(point, polygon):
+                    detected.append(zone)
+                    break
+        results.append(detected)
+    
+    return results
+
+
 def get_severity_color(severity: str) -> str:
     """
     Get color code for severity level.
@@ -0,0 +1,133 @@
+"""
+Hazard Zone Feed - Viewport-filtered GeoJSON for map clients
+ITS Feature: Traveler Information System (hazard map layer with delta sync)
+"""
+import hashlib
+import threading
+from typing import List, Dict, Tuple, Optional
+
+from app.utils.hazard_checker import simplify_polygon
+from app.utils.hazard_index import hazard_index
+
+# Zoom range accepted from clients (Leaflet/OSM tile levels)
+MIN_ZOOM = 3
+MAX_ZOOM = 20
+
+_simplified_cache: Dict[Tuple[int, str, int], List[List[float]]] = {}
+_simplified_lock = threading.Lock()
+_SIMPLIFIED_CACHE_MAX = 5000
+
+
+def tolerance_for_zoom(zoom: int) -> float:
+    """About one screen pixel (256px tiles) in degrees at a zoom level"""
+    return 360.0 / (256 * (2 ** zoom))
+
+
+def _simplified_ring(zone: Dict, revision: str, zoom: int) -> List[List[float]]:
+    """GeoJSON ring ([lng, lat], closed) of a zone simplified for a zoom level"""
+    key = (zone['id'], revision, zoom)
+    ring = _simplified_cache.get(key)
+    if ring is not None:
+        return ring
+
+    points = simplify_polygon(zone['polygon_coordinates'], tolerance_for_zoom(zoom))
+    ring = [[p[1], p[0]] for p in points]
+    ring.append(ring[0])
+
+    with _simplified_lock:
+        if len(_simplified_cache) >= _SIMPLIFIED_CACHE_MAX:
+            _simplified_cache.clear()
+        _simplified_cache[key] = ring
+    return ring
+
+
+def zone_to_feature(zone: Dict, revision: str, zoom: int) -> Dict:
+    """Convert a zone dict to a GeoJSON Feature with a simplified polygon"""
+    return {
+        'type': 'Feature',
+        'id': zone['id'],
+        'geometry': {
+            'type': 'Polygon',
+            'coordinates': [_simplified_ring(zone, revision, zoom)]
+        },
+        'properties': {
+            'id': zone['id'],
+            'zone_code': zone['zone_code'],
+            'zone_name': zone['zone_name'],
+            'hazard_type': zone['hazard_type'],
+            'severity': zone['severity'],
+            'description': zone['description'],
+            'warning_message': zone['warning_message'],
+            'color': zone['color'],
+            'start_time': zone['start_time'],
+            'end_time': zone['end_time']
+        }
+    }
+
+
+def _in_bbox(zone: Dict, bbox: Optional[Tuple[float, float, float, float]]) -> bool:
+    if bbox is None:
+        return True
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return not (zone['max_latitude'] < min_lat or zone['min_latitude'] > max_lat or
+                zone['max_longitude'] < min_lng or zone['min_longitude'] > max_lng)
+
+
+def build_hazard_feed(
+    bbox: Optional[Tuple[float, float, float, float]] = None,
+    zoom: int = 14,
+    since_version: Optional[int] = None,
+    epoch: Optional[str] = None
+) -> Dict:
+    """
+    Build the hazard zone map feed.
+
+    Args:
+        bbox: (min_lat, min_lng, max_lat, max_lng) viewport, None for everything
+        zoom: Map zoom level (controls polygon simplification)
+        since_version: Version from the client's last sync (delta response)
+        epoch: Epoch from the client's last sync; a different epoch forces a full sync
+
+    Returns:
+        Dict with GeoJSON FeatureCollection, version/epoch and removed ids.
+        'full' is False when only changes since since_version are included.
+    """
+    zoom = max(MIN_ZOOM, min(MAX_ZOOM, int(zoom)))
+
+    delta = None
+    if since_version is not None and epoch == hazard_index.epoch:
+        delta = hazard_index.changes_since(since_version)
+
+    zones = hazard_index.effective_zones()
+    revisions = hazard_index.zone_revisions()
+    version = hazard_index.version
+
+    if delta is not None:
+        version, changed_ids, removed_ids = delta
+        wanted = set(changed_ids)
+        zones = [zone for zone in zones if zone['id'] in wanted]
+    else:
+        removed_ids = []
+
+    features = [
+        zone_to_feature(zone, revisions.get(zone['id']), zoom)
+        for zone in zones if _in_bbox(zone, bbox)
+    ]
+
+    return {
+        'type': 'FeatureCollection',
+        'features': features,
+        'version': version,
+        'epoch': hazard_index.epoch,
+        'full': delta is None,
+        'removed': removed_ids,
+        'zoom': zoom
+    }
+
+
+def feed_etag(feed: Dict) -> str:
+    """Strong ETag over the feed contents that vary between responses"""
+    ids = ','.join(str(f['id']) for f in feed['features'])
+    removed = ','.join(str(i) for i in feed['removed'])
+    raw = f"{feed['epoch']}:{feed['version']}:{feed['full']}:{feed['zoom']}:{ids}:{removed}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
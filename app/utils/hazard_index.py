@@ -0,0 +1,365 @@
+"""
+Hazard Zone Index - In-memory cache of active hazard zones
+ITS Feature: Incident Management (time-windowed zone activation)
+"""
+import hashlib
+import heapq
+import json
+import math
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import List, Dict, Tuple, Optional, Iterable
+
+from app.utils.regions import regions_for_bbox
+
+
+def zone_to_dict(zone) -> Dict:
+    """
+    Convert a HazardZone model to the dict format used by hazard_checker.
+
+    Args:
+        zone: HazardZone instance
+
+    Returns:
+        Dictionary with zone info, polygon and bounding box
+    """
+    return {
+        'id': zone.id,
+        'zone_code': zone.zone_code,
+        'zone_name': zone.zone_name,
+        'hazard_type': zone.hazard_type,
+        'severity': zone.severity,
+        'description': zone.description,
+        'warning_message': zone.warning_message,
+        'polygon_coordinates': zone.polygon_coordinates,
+        'min_latitude': zone.min_latitude,
+        'max_latitude': zone.max_latitude,
+        'min_longitude': zone.min_longitude,
+        'max_longitude': zone.max_longitude,
+        'color': zone.color,
+        'region': zone.region,
+        'is_active': zone.is_active,
+        'start_time': zone.start_time.isoformat() if zone.start_time else None,
+        'end_time': zone.end_time.isoformat() if zone.end_time else None
+    }
+
+
+def zone_revision(zone_dict: Dict) -> str:
+    """
+    Digest of a zone's definition (geometry, severity, texts, window).
+    Unlike updated_at it does not move when only warning_count is bumped.
+    """
+    raw = json.dumps(zone_dict, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def is_within_window(start_time: Optional[datetime], end_time: Optional[datetime], at: datetime) -> bool:
+    """
+    Check if time `at` falls inside a zone's [start_time, end_time) window.
+    Missing bounds are treated as open-ended.
+    """
+    if start_time and at < start_time:
+        return False
+    if end_time and at >= end_time:
+        return False
+    return True
+
+
+class ZoneTransitionQueue:
+    """
+    Min-heap of upcoming zone transitions (activate / expire).
+
+    The scheduler only needs to peek at the head of the queue on each tick,
+    so the cost of an idle tick is O(1) instead of a scan over every zone.
+    """
+
+    ACTIVATE = 'activate'
+    EXPIRE = 'expire'
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, int, str]] = []
+
+    def rebuild(self, windows: Dict[int, Tuple[Optional[datetime], Optional[datetime]]], now: datetime) -> None:
+        """Rebuild the queue from {zone_id: (start_time, end_time)}"""
+        heap = []
+        for zone_id, (start_time, end_time) in windows.items():
+            if start_time and start_time > now:
+                heap.append((start_time, zone_id, self.ACTIVATE))
+            if end_time:
+                # Already-expired zones are queued as due immediately
+                heap.append((end_time, zone_id, self.EXPIRE))
+        heapq.heapify(heap)
+        self._heap = heap
+
+    def next_time(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime) -> List[Tuple[datetime, int, str]]:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+        return due
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class HazardZoneIndex:
+    """
+    Cached index of active hazard zones with a uniform lat/lng grid.
+
+    Zones are loaded once from the database and kept in memory until they are
+    invalidated (admin changes, scheduled transitions) or the TTL runs out.
+    Each grid cell maps to the ids of zones whose bounding box overlaps it,
+    so point/segment lookups only touch nearby zones.
+    """
+
+    def __init__(self, cell_deg: float = 0.01, ttl_seconds: float = 60, changelog_size: int = 256):
+        self.cell_deg = cell_deg
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        # Identifies this process' version sequence (versions restart at 0 on reboot)
+        self.epoch = uuid.uuid4().hex[:12]
+
+        self._lock = threading.Lock()
+        self._zones: Dict[int, Dict] = {}
+        self._windows: Dict[int, Tuple[Optional[datetime], Optional[datetime]]] = {}
+        self._cells: Dict[Tuple[int, int], List[int]] = {}
+        self._large_zone_ids: List[int] = []
+        self._region_ids: Dict[str, List[int]] = {}  # region -> zones whose bbox touches it
+        self._transitions = ZoneTransitionQueue()
+        self._signature: Dict[int, Tuple] = {}
+        # (version, changed zone ids, removed zone ids) for delta sync
+        self._changelog = deque(maxlen=changelog_size)
+        self._loaded_at: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def invalidate(self) -> None:
+        """Force a reload on next access (call after zones are changed)"""
+        self._loaded_at = None
+
+    def refresh(self) -> None:
+        """Reload active zones from the database and rebuild the grid"""
+        from flask import current_app
+        from app.models import HazardZone
+
+        cell_deg = current_app.config.get('HAZARD_INDEX_CELL_DEG', self.cell_deg)
+        self.ttl_seconds = current_app.config.get('HAZARD_INDEX_TTL_SECONDS', self.ttl_seconds)
+        max_cells = current_app.config.get('HAZARD_INDEX_MAX_CELLS_PER_ZONE', 10000)
+
+        zones = {}
+        windows = {}
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        large_zone_ids = []
+        region_ids: Dict[str, List[int]] = {}
+        signature = {}
+        now = datetime.now()
+
+        for zone in HazardZone.query.filter_by(is_active=True).all():
+            zones[zone.id] = zone_to_dict(zone)
+            signature[zone.id] = (zone_revision(zones[zone.id]), is_within_window(zone.start_time, zone.end_time, now))
+            windows[zone.id] = (zone.start_time, zone.end_time)
+            for region in regions_for_bbox(zone.min_latitude, zone.min_longitude,
+                                           zone.max_latitude, zone.max_longitude):
+                region_ids.setdefault(region, []).append(zone.id)
+
+            i0, j0 = self._cell_of(zone.min_latitude, zone.min_longitude, cell_deg)
+            i1, j1 = self._cell_of(zone.max_latitude, zone.max_longitude, cell_deg)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > max_cells:
+                # Very large zones are always checked instead of filling the grid
+                large_zone_ids.append(zone.id)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    cells.setdefault((i, j), []).append(zone.id)
+
+        transitions = ZoneTransitionQueue()
+        transitions.rebuild(windows, now)
+
+        with self._lock:
+            self.cell_deg = cell_deg
+            self._zones = zones
+            self._windows = windows
+            self._cells = cells
+            self._large_zone_ids = large_zone_ids
+            self._region_ids = region_ids
+            self._transitions = transitions
+            self._loaded_at = time.monotonic()
+            # Only bump the version when zone data or effectiveness changed
+            if signature != self._signature:
+                self._record_changes(self._signature, signature)
+                self._signature = signature
+
+        print(f'[HazardIndex] Loaded {len(zones)} active zones, '
+              f'{len(cells)} grid cells, {len(transitions)} pending transitions')
+
+    def _record_changes(self, old: Dict[int, Tuple], new: Dict[int, Tuple]) -> None:
+        """Bump the version and log which effective zones changed or disappeared"""
+        changed = set()
+        removed = set()
+        for zone_id, (revision, effective) in new.items():
+            if old.get(zone_id) != (revision, effective):
+                if effective:
+                    changed.add(zone_id)
+                elif old.get(zone_id, (None, False))[1]:
+                    removed.add(zone_id)
+        for zone_id, (_, effective) in old.items():
+            if zone_id not in new and effective:
+                removed.add(zone_id)
+        self.version += 1
+        self._changelog.append((self.version, frozenset(changed), frozenset(removed)))
+
+    def _ensure_fresh(self) -> None:
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds:
+            self.refresh()
+
+    def current_version(self) -> int:
+        """Version of the loaded snapshot (bumped when zone data changes)"""
+        self._ensure_fresh()
+        return self.version
+
+    def snapshot(self) -> Tuple[int, List[Dict], Dict[int, Tuple[Optional[datetime], Optional[datetime]]]]:
+        """
+        All loaded zones regardless of time window.
+
+        Returns:
+            (version, zone dicts, {zone_id: (start_time, end_time)})
+        """
+        self._ensure_fresh()
+        with self._lock:
+            return self.version, list(self._zones.values()), dict(self._windows)
+
+    def zone_revisions(self) -> Dict[int, str]:
+        """{zone_id: definition digest} of the loaded zones"""
+        self._ensure_fresh()
+        with self._lock:
+            return {zone_id: entry[0] for zone_id, entry in self._signature.items()}
+
+    def changes_since(self, since_version: int) -> Optional[Tuple[int, List[int], List[int]]]:
+        """
+        Zones changed since a client's last sync.
+
+        Args:
+            since_version: Version the client last received
+
+        Returns:
+            (current version, changed ids, removed ids), or None when the
+            changelog no longer covers since_version (client must resync)
+        """
+        self._ensure_fresh()
+        with self._lock:
+            version = self.version
+            if since_version > version:
+                return None
+            if since_version == version:
+                return version, [], []
+            entries = [entry for entry in self._changelog if entry[0] > since_version]
+            if not entries or entries[0][0] != since_version + 1:
+                return None
+
+        changed = set()
+        removed = set()
+        for _, entry_changed, entry_removed in entries:
+            changed -= entry_removed
+            removed -= entry_changed
+            changed |= entry_changed
+            removed |= entry_removed
+        return version, sorted(changed), sorted(removed)
+
+    @staticmethod
+    def _cell_of(lat: float, lng: float, cell_deg: float) -> Tuple[int, int]:
+        return (math.floor(lat / cell_deg), math.floor(lng / cell_deg))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _effective_ids(self, zone_ids, at: datetime) -> List[int]:
+        windows = self._windows
+        return [zid for zid in zone_ids if is_within_window(*windows[zid], at)]
+
+    def effective_zones(self, at: Optional[datetime] = None, regions: Optional[Iterable[str]] = None) -> List[Dict]:
+        """
+        Get zones that are active and inside their time window at time `at`.
+
+        Args:
+            at: Point in time (default: now)
+            regions: Only zones touching these regions (default: all regions)
+
+        Returns:
+            List of zone dicts (copies, safe to modify)
+        """
+        self._ensure_fresh()
+        at = at or datetime.now()
+        with self._lock:
+            zones = self._zones
+            if regions is None:
+                candidate_ids = zones.keys()
+            else:
+                candidate_ids = set()
+                for region in regions:
+                    candidate_ids.update(self._region_ids.get(region, ()))
+                candidate_ids = sorted(candidate_ids)
+            ids = self._effective_ids(candidate_ids, at)
+        return [dict(zones[zid]) for zid in ids]
+
+    def zones_in_bbox(
+        self,
+        min_lat: float,
+        min_lng: float,
+        max_lat: float,
+        max_lng: float,
+        at: Optional[datetime] = None
+    ) -> List[Dict]:
+        """
+        Get effective zones whose grid cells overlap a bounding box.
+        Returned dicts are shared with the cache and must not be modified.
+        """
+        self._ensure_fresh()
+        at = at or datetime.now()
+        with self._lock:
+            i0, j0 = self._cell_of(min_lat, min_lng, self.cell_deg)
+            i1, j1 = self._cell_of(max_lat, max_lng, self.cell_deg)
+            candidate_ids = set(self._large_zone_ids)
+            cells = self._cells
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    ids = cells.get((i, j))
+                    if ids:
+                        candidate_ids.update(ids)
+            zones = self._zones
+            ids = self._effective_ids(candidate_ids, at)
+        return [zones[zid] for zid in ids]
+
+    def zones_near(self, lat: float, lng: float, at: Optional[datetime] = None) -> List[Dict]:
+        """Get effective zones registered in the grid cell containing a point"""
+        return self.zones_in_bbox(lat, lng, lat, lng, at)
+
+    # ------------------------------------------------------------------
+    # Scheduled transitions
+    # ------------------------------------------------------------------
+
+    def next_transition_time(self) -> Optional[datetime]:
+        self._ensure_fresh()
+        with self._lock:
+            return self._transitions.next_time()
+
+    def pop_due_transitions(self, now: Optional[datetime] = None) -> List[Tuple[datetime, int, str]]:
+        self._ensure_fresh()
+        with self._lock:
+            return self._transitions.pop_due(now or datetime.now())
+
+
+# Shared per-process index
+hazard_index = HazardZoneIndex()
+
+
+def get_effective_zones(at: Optional[datetime] = None, regions: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Shortcut: effective hazard zones at time `at` (optionally per region) from the shared index"""
+    return hazard_index.effective_zones(at, regions)
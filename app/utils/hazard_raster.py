@@ -0,0 +1,274 @@
+"""
+Hazard Coverage Raster - Precomputed grid of hazard zone coverage
+ITS Feature: Incident Management (O(1) point lookups for live tracking)
+"""
+import math
+import threading
+from datetime import datetime
+from typing import Iterable, List, Dict, Set, Tuple, Optional
+
+from app.utils.hazard_checker import point_in_polygon
+from app.utils.hazard_index import hazard_index, is_within_window
+
+# Cell states
+CLEAR = 0     # No zone touches the cell
+PARTIAL = 1   # Cell crosses a zone boundary - exact test needed
+FULL = 2      # Cell lies completely inside at least one zone
+
+
+def _segment_intersects_rect(
+    p1: Tuple[float, float],
+    p2: Tuple[float, float],
+    min_lat: float,
+    max_lat: float,
+    min_lng: float,
+    max_lng: float
+) -> bool:
+    """
+    Liang-Barsky clipping: does segment p1-p2 touch the rectangle?
+    """
+    t0, t1 = 0.0, 1.0
+    d_lat = p2[0] - p1[0]
+    d_lng = p2[1] - p1[1]
+
+    for p, q in (
+        (-d_lat, p1[0] - min_lat),
+        (d_lat, max_lat - p1[0]),
+        (-d_lng, p1[1] - min_lng),
+        (d_lng, max_lng - p1[1])
+    ):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            if t > t1:
+                return False
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return False
+            t1 = min(t1, t)
+    return True
+
+
+class HazardCoverageRaster:
+    """
+    Grid raster mapping each cell to the zones that fully cover it and the
+    zones whose boundary crosses it.
+
+    Lookups are a single dict probe; exact point-in-polygon tests only run
+    for zones listed as partial in boundary cells. The raster is rebuilt
+    whenever the hazard index loads changed zone data; time windows are
+    checked at lookup time so scheduled zones need no rebuild.
+    """
+
+    def __init__(self, cell_deg: float = 0.002, max_cells_per_zone: int = 250000):
+        self.cell_deg = cell_deg
+        self.max_cells_per_zone = max_cells_per_zone
+        self._lock = threading.Lock()
+        self._cells: Dict[Tuple[int, int], Tuple[Tuple[int, ...], Tuple[int, ...]]] = {}
+        self._zones: Dict[int, Dict] = {}
+        self._polygons: Dict[int, List[Tuple[float, float]]] = {}
+        self._windows: Dict[int, Tuple] = {}
+        self._unrastered: List[int] = []
+        self._built_cell_deg = cell_deg
+        self._version: Optional[int] = None
+
+    def _cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    # ------------------------------------------------------------------
+    # Building
+    # ------------------------------------------------------------------
+
+    def _rasterize_zone(self, polygon: List[Tuple[float, float]], zone: Dict):
+        """
+        Classify the cells under one zone's bounding box.
+
+        Returns:
+            (full_cells, partial_cells) as sets of cell keys
+        """
+        cell = self.cell_deg
+        i0, j0 = self._cell_of(zone['min_latitude'], zone['min_longitude'])
+        i1, j1 = self._cell_of(zone['max_latitude'], zone['max_longitude'])
+
+        # 1. Cells crossed by a polygon edge are boundary cells
+        partial = set()
+        n = len(polygon)
+        for k in range(n):
+            p1 = polygon[k]
+            p2 = polygon[(k + 1) % n]
+            ei0, ej0 = self._cell_of(min(p1[0], p2[0]), min(p1[1], p2[1]))
+            ei1, ej1 = self._cell_of(max(p1[0], p2[0]), max(p1[1], p2[1]))
+            for i in range(ei0, ei1 + 1):
+                for j in range(ej0, ej1 + 1):
+                    if (i, j) in partial:
+                        continue
+                    if _segment_intersects_rect(p1, p2, i * cell, (i + 1) * cell, j * cell, (j + 1) * cell):
+                        partial.add((i, j))
+
+        # 2. Any other cell is either completely inside or completely outside:
+        #    its center decides
+        full = set()
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                if (i, j) in partial:
+                    continue
+                if point_in_polygon(((i + 0.5) * cell, (j + 0.5) * cell), polygon):
+                    full.add((i, j))
+
+        return full, partial
+
+    def build(self, zones: List[Dict], windows: Optional[Dict[int, Tuple]] = None) -> None:
+        """
+        Rebuild the raster from a list of zone dicts.
+
+        Args:
+            zones: Zone dicts (hazard_checker format)
+            windows: Optional {zone_id: (start_time, end_time)}, checked at lookup time
+        """
+        full_map: Dict[Tuple[int, int], List[int]] = {}
+        partial_map: Dict[Tuple[int, int], List[int]] = {}
+        zones_by_id = {}
+        polygons = {}
+        unrastered = []
+
+        for zone in zones:
+            if not zone.get('is_active', True):
+                continue
+            polygon = [(p[0], p[1]) for p in zone['polygon_coordinates']]
+            zones_by_id[zone['id']] = zone
+            polygons[zone['id']] = polygon
+
+            i0, j0 = self._cell_of(zone['min_latitude'], zone['min_longitude'])
+            i1, j1 = self._cell_of(zone['max_latitude'], zone['max_longitude'])
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > self.max_cells_per_zone:
+                # Too large to rasterize at this precision: always test exactly
+                unrastered.append(zone['id'])
+                continue
+
+            full, partial = self._rasterize_zone(polygon, zone)
+            for key in full:
+                full_map.setdefault(key, []).append(zone['id'])
+            for key in partial:
+                partial_map.setdefault(key, []).append(zone['id'])
+
+        cells = {}
+        for key in set(full_map) | set(partial_map):
+            cells[key] = (tuple(full_map.get(key, ())), tuple(partial_map.get(key, ())))
+
+        with self._lock:
+            self._cells = cells
+            self._zones = zones_by_id
+            self._polygons = polygons
+            self._windows = windows or {}
+            self._unrastered = unrastered
+            self._built_cell_deg = self.cell_deg
+
+        print(f'[HazardRaster] Built {len(cells)} cells for {len(zones_by_id)} zones '
+              f'(cell={self.cell_deg}°, unrastered={len(unrastered)})')
+
+    def ensure_current(self) -> None:
+        """Rebuild if the hazard index loaded changed zone data since the last build"""
+        if hazard_index.current_version() == self._version:
+            return
+        from flask import current_app
+        self.cell_deg = current_app.config.get('HAZARD_RASTER_CELL_DEG', self.cell_deg)
+        version, zones, windows = hazard_index.snapshot()
+        self.build(zones, windows)
+        self._version = version
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def _snapshot(self) -> Tuple:
+        """Structures of one build, read together (a rebuild swaps them all at once)"""
+        self.ensure_current()
+        with self._lock:
+            return (self._built_cell_deg, self._cells, self._zones, self._polygons,
+                    self._windows, self._unrastered)
+
+    def cell_state(self, lat: float, lng: float) -> int:
+        """CLEAR / PARTIAL / FULL state of the cell containing a point"""
+        cell_deg, cells, _, _, _, unrastered = self._snapshot()
+        entry = cells.get((math.floor(lat / cell_deg), math.floor(lng / cell_deg)))
+        if entry is None:
+            return PARTIAL if unrastered else CLEAR
+        return FULL if entry[0] else PARTIAL
+
+    @staticmethod
+    def _ids_at(snapshot: Tuple, lat: float, lng: float, at: Optional[datetime]) -> List[int]:
+        cell_deg, cells, zones, polygons, windows, unrastered = snapshot
+        point = (lat, lng)
+
+        hits = []
+        entry = cells.get((math.floor(lat / cell_deg), math.floor(lng / cell_deg)))
+        if entry is not None:
+            full_ids, partial_ids = entry
+            hits.extend(full_ids)
+            for zone_id in partial_ids:
+                if point_in_polygon(point, polygons[zone_id]):
+                    hits.append(zone_id)
+
+        for zone_id in unrastered:
+            zone = zones[zone_id]
+            if zone['min_latitude'] <= lat <= zone['max_latitude'] and \
+                    zone['min_longitude'] <= lng <= zone['max_longitude'] and \
+                    point_in_polygon(point, polygons[zone_id]):
+                hits.append(zone_id)
+
+        if hits and windows:
+            at = at or datetime.now()
+            hits = [zone_id for zone_id in hits
+                    if zone_id not in windows or is_within_window(*windows[zone_id], at)]
+
+        return hits
+
+    def zone_ids_at(self, lat: float, lng: float, at: Optional[datetime] = None) -> List[int]:
+        """
+        IDs of zones containing a point and inside their time window.
+
+        Args:
+            lat, lng: Point coordinates
+            at: Point in time (default: now)
+
+        Returns:
+            List of zone IDs (empty when the point is clear)
+        """
+        return self._ids_at(self._snapshot(), lat, lng, at)
+
+    def zones_at(self, lat: float, lng: float, at: Optional[datetime] = None) -> List[Dict]:
+        """Zone dicts containing a point (shared with the cache, do not modify)"""
+        snapshot = self._snapshot()
+        zones = snapshot[2]
+        return [zones[zone_id] for zone_id in self._ids_at(snapshot, lat, lng, at)]
+
+    def zones_along(self, points: Iterable[Tuple[float, float]],
+                    at: Optional[datetime] = None) -> Tuple[List[Dict], Set[int]]:
+        """
+        Zones touched by a sequence of points, all looked up in the same
+        build so a concurrent rebuild cannot drop a zone in between.
+
+        Returns:
+            (zone dicts touched by any point, ordered by id; ids of the zones
+            containing the last point)
+        """
+        snapshot = self._snapshot()
+        zones = snapshot[2]
+        touched: Set[int] = set()
+        last: Set[int] = set()
+        for lat, lng in points:
+            last = set(self._ids_at(snapshot, lat, lng, at))
+            touched |= last
+        return [zones[zone_id] for zone_id in sorted(touched)], last
+
+    def zone(self, zone_id: int) -> Optional[Dict]:
+        """Zone dict by ID from the last build (shared, do not modify)"""
+        return self._zones.get(zone_id)
+
+
+# Shared per-process raster
+hazard_raster = HazardCoverageRaster()
@@ -0,0 +1,214 @@
+"""
+Maintenance Planner - Nightly odometer-driven maintenance planning for the
+whole fleet: projects each vehicle's due date from its recent daily
+distance, bulk-creates Maintenance entries and takes soon-due vehicles
+out of availability with set-based SQL
+ITS Feature: Fleet Management (predictive maintenance)
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, func
+
+from app.models import db, Vehicle, Trip, Maintenance
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+OPEN_STATUSES = ('scheduled', 'in_progress')
+DEFAULT_INTERVAL_KM = 1000.0
+
+
+class Projection(NamedTuple):
+    vehicle_id: int
+    remaining_km: float
+    daily_km: float
+    due_date: Optional[datetime]
+
+
+def _config(name: str, default):
+    from flask import current_app
+    return current_app.config.get(name, default)
+
+
+def _days_to_due(remaining, daily) -> List[float]:
+    """remaining_km / daily_km per vehicle (0 when overdue, inf when idle)"""
+    if np is not None:
+        remaining = np.maximum(np.asarray(remaining, dtype=float), 0.0)
+        daily = np.asarray(daily, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = np.where(remaining <= 0, 0.0, np.where(daily > 0, remaining / daily, np.inf))
+        return days.tolist()
+    return [0.0 if r <= 0 else (r / d if d > 0 else float('inf')) for r, d in zip(remaining, daily)]
+
+
+def project_fleet(now: Optional[datetime] = None) -> List[Projection]:
+    """
+    Due date of every vehicle: when its km since the last service reach
+    maintenance_interval_km at its average daily distance over the last
+    MAINTENANCE_LOOKBACK_DAYS, and no later than MAINTENANCE_MAX_INTERVAL_DAYS
+    after the last service. Two queries for the whole fleet.
+    """
+    now = now or datetime.now()
+    lookback_days = _config('MAINTENANCE_LOOKBACK_DAYS', 30)
+    max_interval_days = _config('MAINTENANCE_MAX_INTERVAL_DAYS', 180)
+
+    distance = dict(db.session.query(Trip.vehicle_id, func.sum(Trip.distance_km)).filter(
+        Trip.status == 'completed',
+        Trip.end_time >= now - timedelta(days=lookback_days)
+    ).group_by(Trip.vehicle_id).all())
+    vehicles = db.session.query(
+        Vehicle.id, Vehicle.odometer, Vehicle.maintenance_interval_km,
+        Vehicle.last_maintenance_odometer, Vehicle.last_maintenance_date
+    ).all()
+    if not vehicles:
+        return []
+
+    remaining, daily = [], []
+    for vehicle_id, odometer, interval, last_odometer, _ in vehicles:
+        odometer = odometer or 0.0
+        interval = interval or DEFAULT_INTERVAL_KM
+        if last_odometer is None:
+            # No recorded service: assume one at the previous interval boundary
+            last_odometer = (odometer // interval) * interval
+        remaining.append(interval - (odometer - last_odometer))
+        daily.append((distance.get(vehicle_id) or 0.0) / lookback_days)
+
+    projections = []
+    for (vehicle_id, _, _, _, last_date), left, per_day, days in zip(vehicles, remaining, daily,
+                                                                    _days_to_due(remaining, daily)):
+        due = now + timedelta(days=days) if days != float('inf') else None
+        if last_date is not None:
+            deadline = last_date + timedelta(days=max_interval_days)
+            due = deadline if due is None or deadline < due else due
+        projections.append(Projection(vehicle_id, left, per_day, due))
+    return projections
+
+
+def complete_maintenance(maintenance: Maintenance, completed_at: Optional[datetime] = None) -> None:
+    """
+    Mark a Maintenance completed inside the caller's transaction. A
+    completed routine service restarts the vehicle's km counter at its
+    current odometer; repairs (e.g. the ones raised by the anomaly
+    detector) do not count as a service. A vehicle in 'maintenance' with
+    no other open entry goes back to 'available'.
+    """
+    completed_at = completed_at or datetime.now()
+    maintenance.status = 'completed'
+    maintenance.completed_date = completed_at
+
+    vehicle = maintenance.vehicle
+    if maintenance.maintenance_type == 'routine':
+        vehicle.last_maintenance_date = completed_at
+        vehicle.last_maintenance_odometer = vehicle.odometer or 0.0
+        vehicle.next_maintenance_date = None  # Projected again by the next planner run
+
+    others_open = Maintenance.query.filter(
+        Maintenance.vehicle_id == vehicle.id,
+        Maintenance.id != maintenance.id,
+        Maintenance.status.in_(OPEN_STATUSES)
+    ).count()
+    if vehicle.status == 'maintenance' and not others_open:
+        vehicle.status = 'available'
+
+
+def plan_maintenance(now: Optional[datetime] = None, dry_run: bool = False) -> Dict:
+    """
+    Nightly batch:
+
+    1. next_maintenance_date of every vehicle (one executemany UPDATE)
+    2. a 'scheduled' routine Maintenance for vehicles due within
+       MAINTENANCE_PLAN_HORIZON_DAYS that have no open one (one bulk INSERT)
+    3. vehicles due within MAINTENANCE_PULL_DAYS (or overdue) that are
+       'available' go to 'maintenance' (one UPDATE; rented or reserved
+       vehicles are left alone and picked up on a later run)
+
+    Returns:
+        Dict with vehicles, due, scheduled, pulled counts (and the ids)
+    """
+    now = now or datetime.now()
+    horizon = now + timedelta(days=_config('MAINTENANCE_PLAN_HORIZON_DAYS', 7))
+    pull_before = now + timedelta(days=_config('MAINTENANCE_PULL_DAYS', 1))
+
+    projections = project_fleet(now)
+    due = [p for p in projections if p.due_date is not None and p.due_date <= horizon]
+    open_ids = {vid for (vid,) in db.session.query(Maintenance.vehicle_id).filter(
+        Maintenance.status.in_(OPEN_STATUSES)
+    ).distinct().all()}
+    to_schedule = [p for p in due if p.vehicle_id not in open_ids]
+    to_pull = [p.vehicle_id for p in due if p.due_date <= pull_before]
+
+    result = {
+        'vehicles': len(projections),
+        'due': len(due),
+        'scheduled': len(to_schedule),
+        'scheduled_ids': [p.vehicle_id for p in to_schedule],
+        'pulled': 0,
+        'pulled_ids': []
+    }
+    if dry_run or not projections:
+        db.session.commit()
+        result['pulled'] = len(to_pull)
+        result['pulled_ids'] = to_pull
+        return result
+
+    vehicles = Vehicle.__table__
+    try:
+        db.session.execute(
+            vehicles.update().where(vehicles.c.id == bindparam('b_id'))
+            .values(next_maintenance_date=bindparam('b_due')),
+            [{'b_id': p.vehicle_id, 'b_due': p.due_date} for p in projections]
+        )
+        if to_schedule:
+            db.session.execute(Maintenance.__table__.insert(), [{
+                'maintenance_code': f"MTP{now.strftime('%Y%m%d')}-{p.vehicle_id}",
+                'vehicle_id': p.vehicle_id,
+                'maintenance_type': 'routine',
+                'description': f'Bảo dưỡng định kỳ theo km (tự động): còn {max(p.remaining_km, 0):.0f} km, '
+                               f'trung bình {p.daily_km:.1f} km/ngày',
+                'status': 'scheduled',
+                'scheduled_date': max(p.due_date, now),
+                'created_at': datetime.utcnow(),
+                'updated_at': datetime.utcnow()
+            } for p in to_schedule])
+        pulled_ids = []
+        if to_pull:
+            pulled_ids = [vid for (vid,) in db.session.query(Vehicle.id).filter(
+                Vehicle.id.in_(to_pull), Vehicle.status == 'available'
+            ).all()]
+            if pulled_ids:
+                db.session.execute(
+                    vehicles.update()
+                    .where(vehicles.c.id.in_(pulled_ids), vehicles.c.status == 'available')
+                    .values(status='maintenance', updated_at=datetime.utcnow())
+                )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Bulk UPDATEs bypass the ORM events that feed the live index
+    from app.utils.fleet_index import fleet_index
+    fleet_index.refresh_ids(pulled_ids)
+
+    result['pulled'] = len(pulled_ids)
+    result['pulled_ids'] = pulled_ids
+    print(f"[Maintenance] Planned {result['vehicles']} vehicles: {result['scheduled']} scheduled, "
+          f"{result['pulled']} taken out of service")
+    return result
+
+
+def register_cli(app) -> None:
+    """`flask plan-maintenance` command"""
+    import click
+
+    @app.cli.command('plan-maintenance')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be scheduled')
+    def plan_maintenance_command(dry_run):
+        """Project maintenance due dates and schedule due vehicles"""
+        result = plan_maintenance(dry_run=dry_run)
+        click.echo(f"{result['vehicles']} vehicles, {result['due']} due within the horizon, "
+                   f"{result['scheduled']} {'to schedule' if dry_run else 'scheduled'}, "
+                   f"{result['pulled']} {'to take' if dry_run else 'taken'} out of service")
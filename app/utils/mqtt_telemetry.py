@@ -0,0 +1,323 @@
+"""
+MQTT Telemetry Worker - Subscribes to per-vehicle telemetry topics and
+flushes them in micro-batches through telemetry_ingest
+ITS Feature: Fleet Management (vehicle telematics over MQTT)
+"""
+import json
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+# smartrent/vehicle/<vehicle_code>/telemetry (same scheme as .../<vehicle_code>/unlock)
+TOPIC_PREFIX = 'smartrent/vehicle/'
+TOPIC_SUFFIX = '/telemetry'
+TELEMETRY_TOPIC = f'{TOPIC_PREFIX}+{TOPIC_SUFFIX}'
+
+
+def vehicle_code_from_topic(topic: str) -> Optional[str]:
+    if topic.startswith(TOPIC_PREFIX) and topic.endswith(TOPIC_SUFFIX):
+        code = topic[len(TOPIC_PREFIX):-len(TOPIC_SUFFIX)]
+        if code and '/' not in code:
+            return code
+    return None
+
+
+class TelemetryBatcher:
+    """
+    Bounded buffer of MQTT messages flushed as micro-batches.
+
+    submit() blocks while the buffer is full. It runs on the MQTT network
+    thread, so a slow database stops the client from reading its socket and
+    the broker holds the remaining QoS 1 messages (backpressure instead of
+    unbounded memory). A message is acknowledged only after the batch that
+    contains it has been committed; a failed flush is retried with backoff
+    and nothing is acknowledged, so delivery is at-least-once and the
+    idempotent insert absorbs the redeliveries.
+    """
+
+    def __init__(
+        self,
+        ingest: Callable[[List[Dict]], Dict],
+        resolve_vehicle: Callable[[str], Optional[int]],
+        ack: Optional[Callable[[object], None]] = None,
+        max_buffer: int = 20000,
+        batch_size: int = 2000,
+        flush_interval: float = 0.5,
+        max_backoff: float = 30.0
+    ):
+        self.ingest = ingest
+        self.resolve_vehicle = resolve_vehicle
+        self.ack = ack
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._queue: queue.Queue = queue.Queue(maxsize=max_buffer)
+
+        # Metrics
+        self.received = 0
+        self.written = 0
+        self.rejected = 0
+        self.invalid_messages = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.blocked_seconds = 0.0
+
+    # ------------------------------------------------------------------
+    # Producer side (MQTT callback thread)
+    # ------------------------------------------------------------------
+
+    def submit(self, topic: str, payload: bytes, token=None) -> None:
+        """Queue one message; blocks while the buffer is full"""
+        self.received += 1
+        item = (topic, payload, token)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put(item)
+            self.blocked_seconds += time.monotonic() - started
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ------------------------------------------------------------------
+    # Consumer side (worker thread)
+    # ------------------------------------------------------------------
+
+    def _take_batch(self, timeout: float) -> List[Tuple[str, bytes, object]]:
+        """Up to batch_size messages, waiting at most `timeout` for the first ones"""
+        batch = []
+        deadline = time.monotonic() + timeout
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _decode(self, batch) -> List[Dict]:
+        """MQTT messages -> telemetry records (vehicle_id taken from the topic)"""
+        records = []
+        for topic, payload, _ in batch:
+            code = vehicle_code_from_topic(topic)
+            vehicle_id = self.resolve_vehicle(code) if code else None
+            try:
+                data = json.loads(payload)
+            except (TypeError, ValueError):
+                data = None
+            items = data if isinstance(data, list) else [data]
+            if vehicle_id is None or not all(isinstance(item, dict) for item in items):
+                self.invalid_messages += 1
+                continue
+            for item in items:
+                item['vehicle_id'] = vehicle_id
+                records.append(item)
+        return records
+
+    def flush_once(self, timeout: Optional[float] = None, stop: Optional[threading.Event] = None) -> int:
+        """
+        Take one micro-batch, write it (retrying until it succeeds or
+        `stop` is set) and acknowledge its messages.
+
+        Returns:
+            Number of messages in the batch
+        """
+        batch = self._take_batch(self.flush_interval if timeout is None else timeout)
+        if not batch:
+            return 0
+
+        records = self._decode(batch)
+        backoff = 0.5
+        while True:
+            try:
+                result = self.ingest(records) if records else {'accepted': 0, 'rejected': 0}
+                break
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f'[MQTT] Flush of {len(records)} records failed, retrying in {backoff:.1f}s: {e}')
+                if stop is not None and stop.wait(backoff):
+                    return 0  # Shutting down: messages stay unacknowledged and are redelivered
+                if stop is None:
+                    time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+        self.flushes += 1
+        self.written += result['accepted']
+        self.rejected += result['rejected']
+        if self.ack is not None:
+            for _, _, token in batch:
+                if token is not None:
+                    self.ack(token)
+        return len(batch)
+
+    def run(self, stop: threading.Event) -> None:
+        """Flush until `stop` is set, then drain what is already buffered"""
+        while not stop.is_set():
+            self.flush_once(stop=stop)
+        while self.pending():
+            if not self.flush_once(timeout=0, stop=stop):
+                break
+
+    def stats(self) -> Dict:
+        return {
+            'received': self.received,
+            'pending': self.pending(),
+            'written': self.written,
+            'rejected': self.rejected,
+            'invalid_messages': self.invalid_messages,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'blocked_seconds': round(self.blocked_seconds, 3)
+        }
+
+
+class VehicleCodeResolver:
+    """vehicle_code -> vehicle id, cached; unknown codes are re-checked at most once a minute"""
+
+    def __init__(self, app, negative_ttl: float = 60):
+        self.app = app
+        self.negative_ttl = negative_ttl
+        self._ids: Dict[str, int] = {}
+        self._misses: Dict[str, float] = {}
+
+    def __call__(self, code: str) -> Optional[int]:
+        vehicle_id = self._ids.get(code)
+        if vehicle_id is not None:
+            return vehicle_id
+        missed_at = self._misses.get(code)
+        if missed_at is not None and time.monotonic() - missed_at < self.negative_ttl:
+            return None
+
+        from app.models import db, Vehicle
+        with self.app.app_context():
+            self._ids = {c: vid for vid, c in db.session.query(Vehicle.id, Vehicle.vehicle_code).all()}
+        vehicle_id = self._ids.get(code)
+        if vehicle_id is None:
+            self._misses[code] = time.monotonic()
+        return vehicle_id
+
+
+class MQTTTelemetryWorker:
+    """
+    Standalone telemetry consumer (see mqtt_worker.py).
+
+    Subscribes with QoS 1 and a persistent session (clean_session=False) so
+    the broker keeps messages while the worker is down. The MQTT client is
+    injectable: anything with the paho Client interface (connect,
+    subscribe, loop_start/loop_stop, disconnect, on_connect/on_message and
+    optionally ack) works, e.g. a local broker stand-in.
+    """
+
+    def __init__(self, app, client=None):
+        self.app = app
+        config = app.config
+        self.topic = config.get('MQTT_TELEMETRY_TOPIC', TELEMETRY_TOPIC)
+        if client is None:
+            client, self.manual_ack = self._create_client(config)
+        else:
+            self.manual_ack = callable(getattr(client, 'ack', None))
+        self.client = client
+
+        self.batcher = TelemetryBatcher(
+            ingest=self._ingest,
+            resolve_vehicle=VehicleCodeResolver(app),
+            ack=self._ack if self.manual_ack else None,
+            max_buffer=config.get('MQTT_MAX_BUFFER', 20000),
+            batch_size=config.get('MQTT_BATCH_SIZE', 2000),
+            flush_interval=config.get('MQTT_FLUSH_INTERVAL_SECONDS', 0.5)
+        )
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _create_client(config):
+        """paho client for the configured broker -> (client, manual_ack)"""
+        if mqtt is None:
+            raise RuntimeError('paho-mqtt is not installed (pip install paho-mqtt)')
+        client_id = config.get('MQTT_CLIENT_ID', 'smartrent-telemetry-worker')
+        if hasattr(mqtt, 'CallbackAPIVersion'):
+            # paho-mqtt >= 2.0: acknowledge only after the batch is committed
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id,
+                                 clean_session=False, manual_ack=True)
+            manual_ack = True
+        else:
+            # paho-mqtt 1.x acks on return from on_message: messages still in
+            # the buffer at a crash are lost (shutdown drains the buffer)
+            client = mqtt.Client(client_id=client_id, clean_session=False)
+            manual_ack = False
+            print('[MQTT] paho-mqtt < 2.0: no manual ack, delivery is at-most-once for buffered messages')
+        if config.get('MQTT_USERNAME'):
+            client.username_pw_set(config['MQTT_USERNAME'], config.get('MQTT_PASSWORD') or None)
+        return client, manual_ack
+
+    # ------------------------------------------------------------------
+    # MQTT callbacks (network thread)
+    # ------------------------------------------------------------------
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            print(f'[MQTT] Connection refused (rc={rc})')
+            return
+        client.subscribe(self.topic, qos=1)
+        print(f'[MQTT] Connected, subscribed to {self.topic}')
+
+    def _on_message(self, client, userdata, message):
+        if self._stop.is_set():
+            return  # Shutting down: left unacknowledged, the broker redelivers it
+        self.batcher.submit(message.topic, message.payload, (message.mid, message.qos) if self.manual_ack else None)
+
+    def _ack(self, token) -> None:
+        mid, qos = token
+        self.client.ack(mid, qos)
+
+    # ------------------------------------------------------------------
+    # Writes (worker thread)
+    # ------------------------------------------------------------------
+
+    def _ingest(self, records: List[Dict]) -> Dict:
+        from app.utils.telemetry_ingest import ingest_batch
+        with self.app.app_context():
+            return ingest_batch(records)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, connect: bool = True) -> threading.Thread:
+        if connect:
+            config = self.app.config
+            self.client.connect(config.get('MQTT_BROKER_URL', 'localhost'),
+                                int(config.get('MQTT_BROKER_PORT', 1883)), keepalive=60)
+        self.client.loop_start()
+        thread = threading.Thread(target=self.batcher.run, args=(self._stop,), daemon=True)
+        thread.start()
+        self._thread = thread
+        return thread
+
+    def stop(self, timeout: float = 30) -> None:
+        """
+        Stop taking messages, flush what is buffered, then disconnect.
+        The network loop keeps running until the buffer is drained so that
+        the acks of the last batches still reach the broker.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.client.loop_stop()
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        print(f'[MQTT] Worker stopped: {self.batcher.stats()}')
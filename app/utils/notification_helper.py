@@ -124,6 +124,21 @@ def notify_emergency_alert(user_id, alert_type, alert_id):
     )
 
 
+def notify_hazard_zone_entered(user_id, zone, trip_id):
+    """Cảnh báo người dùng vừa đi vào vùng nguy hiểm trong chuyến đi"""
+    return create_notification(
+        user_id=user_id,
+        type='emergency',
+        title=f'Cảnh báo: {zone["zone_name"]}',
+        message=zone.get('warning_message') or f'Bạn đang đi vào vùng nguy hiểm ({zone["hazard_type"]}). Hãy di chuyển cẩn thận!',
+        icon='fa-exclamation-triangle',
+        color='danger',
+        related_id=trip_id,
+        related_type='trip',
+        action_url='/trips/active'
+    )
+
+
 def notify_system_message(user_id, title, message):
     """Thông báo hệ thống"""
     return create_notification(
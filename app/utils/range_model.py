@@ -0,0 +1,181 @@
+"""
+Range Model - Estimated remaining range (km) from battery/fuel level
+ITS Feature: Traveler Information System (vehicles able to finish the planned trip)
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from app.utils.route_optimizer import haversine_distance
+
+# Energy sources: fuel_level is used when present, battery_level otherwise
+# (motorbikes report both; their battery only powers the electronics)
+SOURCES = ('fuel', 'battery')
+
+# Prior km per 1% of tank/battery, used until enough telemetry is seen
+DEFAULT_KM_PER_PERCENT = {
+    'bike': {'fuel': 0.6, 'battery': 0.6},       # E-bike ~60 km
+    'motorbike': {'fuel': 1.5, 'battery': 0.8},  # ~150 km per tank, ~80 km electric
+    'car': {'fuel': 5.0, 'battery': 4.0},        # ~500 km per tank, ~400 km EV
+}
+FALLBACK_KM_PER_PERCENT = 1.0
+
+# Evidence needed (in % consumed) to move halfway from the prior to the data
+PRIOR_WEIGHT_PERCENT = 20.0
+
+# Consecutive IoT samples further apart than this are not paired
+MAX_SAMPLE_GAP = timedelta(minutes=30)
+
+
+def energy_level(vehicle_type: Optional[str], battery_level: Optional[float],
+                 fuel_level: Optional[float]) -> Tuple[Optional[str], Optional[float]]:
+    """(source, level %) used for range, or (None, None) without telemetry"""
+    if fuel_level is not None:
+        return 'fuel', fuel_level
+    if battery_level is not None:
+        return 'battery', battery_level
+    return None, None
+
+
+class RangeModel:
+    """
+    Per vehicle type and energy source consumption rate (km per 1%).
+
+    Rates are fitted from raw telemetry: for consecutive samples of the same
+    vehicle, the level drop is paired with the distance between the two
+    positions (charging/refuelling samples are skipped). The fitted rate
+    is shrunk towards DEFAULT_KM_PER_PERCENT, so types with little
+    telemetry keep sensible estimates.
+    """
+
+    def __init__(self, refit_seconds: float = 3600, lookback_days: int = 30, max_samples: int = 200000):
+        self.refit_seconds = refit_seconds
+        self.lookback_days = lookback_days
+        self.max_samples = max_samples
+
+        self._lock = threading.Lock()
+        self._rates: Dict[str, Dict[str, float]] = {
+            vehicle_type: dict(rates) for vehicle_type, rates in DEFAULT_KM_PER_PERCENT.items()
+        }
+        self._evidence: Dict[Tuple[str, str], Tuple[float, float]] = {}
+        self._fitted_at = 0.0
+        self._fitted = False
+        self._fitting = False  # A background fit is running (single flight per process)
+
+    def rate(self, vehicle_type: Optional[str], source: str) -> float:
+        return self._rates.get(vehicle_type, {}).get(source, FALLBACK_KM_PER_PERCENT)
+
+    def rates(self) -> Dict[str, Dict[str, float]]:
+        """Copy of {vehicle_type: {source: km per %}}"""
+        return {vehicle_type: dict(rates) for vehicle_type, rates in self._rates.items()}
+
+    def estimate_km(self, vehicle_type: Optional[str], battery_level: Optional[float],
+                    fuel_level: Optional[float]) -> Optional[float]:
+        """Estimated remaining range in km (None without battery/fuel data)"""
+        source, level = energy_level(vehicle_type, battery_level, fuel_level)
+        if source is None:
+            return None
+        return max(level, 0.0) * self.rate(vehicle_type, source)
+
+    # ------------------------------------------------------------------
+    # Fitting
+    # ------------------------------------------------------------------
+
+    def fit(self) -> Dict[str, Dict[str, float]]:
+        """
+        Refit rates from the newest `max_samples` raw samples of the last
+        `lookback_days` (call inside an app context)
+        """
+        from app.models import db, Vehicle
+        from app.utils.telemetry_store import iter_raw
+
+        since = datetime.utcnow() - timedelta(days=self.lookback_days)
+        types = dict(db.session.query(Vehicle.id, Vehicle.vehicle_type).all())
+
+        totals: Dict[Tuple[str, str], list] = {}  # (type, source) -> [km, percent]
+        # Newest first, so the cut-off keeps the most recent samples; `later`
+        # is the previously seen (i.e. next in time) sample of the vehicle
+        later_by_vehicle = {}
+        for count, row in enumerate(iter_raw(since, newest_first=True)):
+            if count >= self.max_samples:
+                break
+            vehicle_id, ts = row['vehicle_id'], row['timestamp']
+            lat, lng = row['latitude'], row['longitude']
+            vehicle_type = types.get(vehicle_id)
+            later = later_by_vehicle.get(vehicle_id)
+            if later is not None and None not in (lat, lng, later['latitude'], later['longitude']) \
+                    and timedelta(0) <= later['timestamp'] - ts <= MAX_SAMPLE_GAP:
+                source, level = energy_level(vehicle_type, row['battery_level'], row['fuel_level'])
+                later_source, later_level = energy_level(vehicle_type, later['battery_level'], later['fuel_level'])
+                if source is not None and source == later_source:
+                    drop = level - later_level
+                    if drop > 0:  # Rising level = charging/refuelling
+                        entry = totals.setdefault((vehicle_type, source), [0.0, 0.0])
+                        entry[0] += haversine_distance(lat, lng, later['latitude'], later['longitude'])
+                        entry[1] += drop
+            later_by_vehicle[vehicle_id] = row
+
+        rates = {vehicle_type: dict(r) for vehicle_type, r in DEFAULT_KM_PER_PERCENT.items()}
+        for (vehicle_type, source), (km, percent) in totals.items():
+            prior = rates.get(vehicle_type, {}).get(source, FALLBACK_KM_PER_PERCENT)
+            rates.setdefault(vehicle_type, {})[source] = \
+                (prior * PRIOR_WEIGHT_PERCENT + km) / (PRIOR_WEIGHT_PERCENT + percent)
+
+        with self._lock:
+            self._rates = rates
+            self._evidence = {key: (km, percent) for key, (km, percent) in totals.items()}
+            self._fitted = True
+            self._fitted_at = time.monotonic()
+
+        print(f'[RangeModel] Fitted from {sum(p for _, p in totals.values()):.0f}% of consumption '
+              f'across {len(totals)} type/source pairs')
+        return self.rates()
+
+    def _fit_in_background(self, app) -> None:
+        try:
+            with app.app_context():
+                self.fit()
+        except Exception as e:
+            print(f'[RangeModel] Fit failed, keeping previous rates: {e}')
+        finally:
+            with self._lock:
+                self._fitted = True
+                self._fitted_at = time.monotonic()
+                self._fitting = False
+
+    def ensure_fitted(self) -> None:
+        """
+        Fit on first use and refit periodically without blocking the
+        caller: one background thread per process does the fit while the
+        previous rates (the priors at first) keep being served. Failures
+        keep the previous rates until the next refit period.
+        """
+        if self._fitted and time.monotonic() - self._fitted_at <= self.refit_seconds:
+            return
+        with self._lock:
+            if self._fitting:
+                return
+            self._fitting = True
+        from flask import current_app
+        threading.Thread(target=self._fit_in_background, args=(current_app._get_current_object(),),
+                         daemon=True).start()
+
+    def stats(self) -> Dict:
+        return {
+            'rates_km_per_percent': self.rates(),
+            'evidence': {
+                f'{vehicle_type}/{source}': {'km': round(km, 2), 'percent': round(percent, 2)}
+                for (vehicle_type, source), (km, percent) in self._evidence.items()
+            }
+        }
+
+
+# Shared per-process model
+range_model = RangeModel()
+
+
+def init_range_model(app) -> None:
+    """Apply config (call from create_app; fitting happens lazily on first use)"""
+    range_model.refit_seconds = app.config.get('RANGE_MODEL_REFIT_SECONDS', range_model.refit_seconds)
+    range_model.lookback_days = app.config.get('RANGE_MODEL_LOOKBACK_DAYS', range_model.lookback_days)
@@ -0,0 +1,137 @@
+"""
+Regions - City partition key for fleet data (vehicles, trips, hazard zones,
+route history) and per-region caches
+ITS Feature: Multi-city operations (hot paths only touch their own city)
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# Region code -> (name, min_lat, min_lng, max_lat, max_lng)
+# Bounding boxes must not overlap; points outside all of them go to DEFAULT_REGION
+REGIONS: Dict[str, Tuple[str, float, float, float, float]] = {
+    'hcm': ('TP. Hồ Chí Minh', 10.35, 106.35, 11.20, 107.05),
+    'hn': ('Hà Nội', 20.55, 105.25, 21.40, 106.05),
+    'dn': ('Đà Nẵng', 15.90, 107.85, 16.25, 108.35),
+    'hp': ('Hải Phòng', 20.60, 106.40, 21.05, 107.05),
+    'ct': ('Cần Thơ', 9.90, 105.40, 10.30, 105.90),
+}
+DEFAULT_REGION = 'other'
+
+
+def region_for(lat: Optional[float], lng: Optional[float]) -> Optional[str]:
+    """
+    Region code of a point.
+
+    Returns:
+        Region code, DEFAULT_REGION outside all regions, None without coordinates
+    """
+    if lat is None or lng is None:
+        return None
+    for code, (_, min_lat, min_lng, max_lat, max_lng) in REGIONS.items():
+        if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+            return code
+    return DEFAULT_REGION
+
+
+def regions_for_bbox(min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> List[str]:
+    """
+    Region codes a bounding box may touch (partition pruning for area queries).
+    DEFAULT_REGION is included unless the box lies inside a single region.
+    """
+    codes = []
+    for code, (_, r_min_lat, r_min_lng, r_max_lat, r_max_lng) in REGIONS.items():
+        if min_lat <= r_max_lat and max_lat >= r_min_lat and min_lng <= r_max_lng and max_lng >= r_min_lng:
+            codes.append(code)
+            if r_min_lat <= min_lat and max_lat <= r_max_lat and r_min_lng <= min_lng and max_lng <= r_max_lng:
+                return [code]
+    codes.append(DEFAULT_REGION)
+    return codes
+
+
+def regions_for_points(points) -> List[str]:
+    """Region codes touched by a route / list of (lat, lng) points"""
+    points = list(points)
+    if not points:
+        return []
+    lats = [p[0] for p in points]
+    lngs = [p[1] for p in points]
+    return regions_for_bbox(min(lats), min(lngs), max(lats), max(lngs))
+
+
+def region_name(code: Optional[str]) -> str:
+    if code in REGIONS:
+        return REGIONS[code][0]
+    return 'Khác'
+
+
+def in_region(query, model, region: Optional[str]):
+    """
+    Restrict a query to one region (or several) - no-op when region is None.
+
+    Args:
+        query: SQLAlchemy query
+        model: Model class with a `region` column
+        region: Region code or list of codes
+    """
+    if region is None:
+        return query
+    if isinstance(region, (list, tuple, set)):
+        return query.filter(model.region.in_(list(region)))
+    return query.filter(model.region == region)
+
+
+class RegionLRUCache:
+    """
+    Small LRU caches partitioned by region.
+
+    Each region gets its own bounded OrderedDict, so a busy city can not
+    evict another city's entries, and a region's cache can be dropped on
+    its own (e.g. when its data moves to a separate database).
+    """
+
+    def __init__(self, max_entries_per_region: int = 256, ttl_seconds: float = 3600):
+        self.max_entries_per_region = max_entries_per_region
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._regions: Dict[str, OrderedDict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, region: str, key: Hashable):
+        now = time.monotonic()
+        with self._lock:
+            entries = self._regions.get(region)
+            entry = entries.get(key) if entries is not None else None
+            if entry is None or now - entry[0] > self.ttl_seconds:
+                if entry is not None:
+                    del entries[key]
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, region: str, key: Hashable, value) -> None:
+        with self._lock:
+            entries = self._regions.setdefault(region, OrderedDict())
+            entries[key] = (time.monotonic(), value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_region:
+                entries.popitem(last=False)
+
+    def clear(self, region: Optional[str] = None) -> None:
+        with self._lock:
+            if region is None:
+                self._regions.clear()
+            else:
+                self._regions.pop(region, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': {region: len(entries) for region, entries in self._regions.items()}
+            }
@@ -1,12 +1,18 @@
 from typing import List, Dict, Optional
 from datetime import datetime
 from .firebase_client import get_db
+from .firestore_cache import available_vehicles_cache
 
 class VehicleRepository:
     COLLECTION = 'vehicles'
 
     @staticmethod
     def list_available(vehicle_type: str = 'all') -> List[Dict]:
+        # Serve from the snapshot-listener cache when it is running
+        if available_vehicles_cache.is_running():
+            if vehicle_type == 'all':
+                return available_vehicles_cache.items()
+            return available_vehicles_cache.items('vehicle_type', vehicle_type)
         db = get_db()
         if db is None:
             return []
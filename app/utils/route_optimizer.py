@@ -8,6 +8,11 @@ import math
 import requests
 from typing import List, Tuple, Dict, Optional
 
+from app.utils.regions import RegionLRUCache, region_for
+
+# OSRM results per region (city), keyed by coordinates rounded to ~1 m
+osrm_route_cache = RegionLRUCache(max_entries_per_region=256, ttl_seconds=3600)
+
 
 class Node:
     """Node trong graph cho A* algorithm"""
@@ -61,6 +66,13 @@ def get_route_from_osrm(start_lat: float, start_lng: float,
     Returns:
         Dict với route coordinates và thông tin, hoặc None nếu fail
     """
+    region = region_for(start_lat, start_lng)
+    cache_key = (round(start_lat, 5), round(start_lng, 5), round(end_lat, 5), round(end_lng, 5),
+                 tuple((round(wp['lat'], 5), round(wp['lng'], 5)) for wp in waypoints or ()))
+    cached = osrm_route_cache.get(region, cache_key)
+    if cached is not None:
+        return dict(cached)
+    
     try:
         # Build coordinates string: lng,lat;lng,lat format
         coords = f"{start_lng},{start_lat}"
@@ -105,12 +117,14 @@ def get_route_from_osrm(start_lat: float, start_lng: float,
         
         print(f"[OSRM] ✅ Route found: {distance_km:.2f} km, {duration_minutes:.1f} minutes")
         
-        return {
+        result = {
             'path': path,
             'distance_km': round(distance_km, 2),
             'duration_minutes': round(duration_minutes, 1),
             'source': 'osrm'
         }
+        osrm_route_cache.put(region, cache_key, result)
+        return dict(result)
         
     except requests.Timeout:
         print("[OSRM] ⚠️ Timeout - using fallback")
@@ -372,36 +386,22 @@ def calculate_alternative_routes(start_lat: float, start_lng: float,
     Args:
         start_lat, start_lng: Tọa độ điểm bắt đầu
         end_lat, end_lng: Tọa độ điểm kết thúc
-        hazard_zones: List các HazardZone objects cần tránh
+        hazard_zones: List các HazardZone objects (hoặc zone dicts) cần tránh
         num_alternatives: Số lượng routes thay thế cần tính
     
     Returns:
         List[Dict]: Danh sách routes với risk level và metrics
     """
     from app.utils.hazard_checker import check_route_hazards, point_in_polygon
+    from app.utils.hazard_index import zone_to_dict
     
     routes = []
     
     # Convert HazardZone objects to dicts for hazard_checker
-    zones_data = []
-    if hazard_zones:
-        for zone in hazard_zones:
-            zones_data.append({
-                'id': zone.id,
-                'zone_code': zone.zone_code,
-                'zone_name': zone.zone_name,
-                'hazard_type': zone.hazard_type,
-                'severity': zone.severity,
-                'description': zone.description,
-                'warning_message': zone.warning_message,
-                'polygon_coordinates': zone.polygon_coordinates,
-                'min_latitude': zone.min_latitude,
-                'max_latitude': zone.max_latitude,
-                'min_longitude': zone.min_longitude,
-                'max_longitude': zone.max_longitude,
-                'color': zone.color,
-                'is_active': zone.is_active
-            })
+    zones_data = [
+        zone if isinstance(zone, dict) else zone_to_dict(zone)
+        for zone in (hazard_zones or [])
+    ]
     
     # Route 1: Đường thẳng (baseline - có thể đi qua hazard)
     direct_route = optimize_route(start_lat, start_lng, end_lat, end_lng)
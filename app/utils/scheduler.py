@@ -1,7 +1,12 @@
 """Background scheduler for auto-release vehicles and cleanup tasks"""
 from datetime import datetime, timedelta
-from app.models import db, Trip, Vehicle
+from app.models import db, Trip, Vehicle, HazardZone
 from app.utils.repositories import VehicleRepository
+from app.utils.hazard_index import hazard_index, ZoneTransitionQueue
+from app.utils.trip_hazard_monitor import trip_hazard_monitor
+from app.utils.telemetry_store import run_maintenance as run_telemetry_maintenance
+from app.utils.columnar_archive import export_closed_days
+from app.utils.maintenance_planner import plan_maintenance
 from flask import current_app
 import threading
 import time
@@ -53,23 +58,121 @@ def auto_release_expired_bookings():
         db.session.rollback()
 
 
+def apply_hazard_zone_transitions():
+    """Activate/expire hazard zones whose time window boundary has passed"""
+    try:
+        now = datetime.now()
+        due = hazard_index.pop_due_transitions(now)
+        if not due:
+            return
+        
+        expired_ids = [zone_id for _, zone_id, kind in due if kind == ZoneTransitionQueue.EXPIRE]
+        activated_ids = [zone_id for _, zone_id, kind in due if kind == ZoneTransitionQueue.ACTIVATE]
+        
+        if expired_ids:
+            # Single UPDATE for all zones expiring in this tick
+            HazardZone.query.filter(
+                HazardZone.id.in_(expired_ids),
+                HazardZone.is_active == True
+            ).update({'is_active': False}, synchronize_session=False)
+            db.session.commit()
+        
+        # Rebuild the index so readers and the queue see the new state
+        hazard_index.refresh()
+        
+        print(f'[Scheduler] Hazard zones: {len(activated_ids)} activated, {len(expired_ids)} expired')
+        
+    except Exception as e:
+        print(f'[Scheduler] Error in apply_hazard_zone_transitions: {e}')
+        db.session.rollback()
+
+
+def roll_up_telemetry():
+    """Roll up raw telemetry into 1m/1h tables and drop expired raw partitions"""
+    try:
+        run_telemetry_maintenance()
+    except Exception as e:
+        print(f'[Scheduler] Error in roll_up_telemetry: {e}')
+        db.session.rollback()
+
+
+def export_archive():
+    """Export closed days of telemetry and trips to the columnar archive"""
+    try:
+        export_closed_days()
+    except Exception as e:
+        print(f'[Scheduler] Error in export_archive: {e}')
+        db.session.rollback()
+
+
+def run_maintenance_planner():
+    """Nightly maintenance planning for the whole fleet"""
+    try:
+        plan_maintenance()
+    except Exception as e:
+        print(f'[Scheduler] Error in run_maintenance_planner: {e}')
+        db.session.rollback()
+
+
+def seconds_until_next_tick(max_interval=60):
+    """Sleep until the next hazard zone transition, but at most max_interval seconds"""
+    try:
+        next_time = hazard_index.next_transition_time()
+    except Exception:
+        return max_interval
+    if next_time is None:
+        return max_interval
+    wait = (next_time - datetime.now()).total_seconds()
+    return min(max_interval, max(1, wait))
+
+
 def run_scheduler():
-    """Run background scheduler every 60 seconds"""
+    """Run background scheduler (every 60 seconds, earlier if a hazard zone transition is due)"""
+    auto_release = current_app.config.get('ENABLE_AUTO_RELEASE', True)
+    hazard_schedule = current_app.config.get('ENABLE_HAZARD_SCHEDULER', True)
+    telemetry_rollups = current_app.config.get('ENABLE_TELEMETRY_ROLLUPS', True)
+    archive_export = current_app.config.get('ENABLE_ARCHIVE_EXPORT', False)
+    archive_interval = current_app.config.get('ARCHIVE_CHECK_SECONDS', 600)
+    maintenance_planner = current_app.config.get('ENABLE_MAINTENANCE_PLANNER', True)
+    planner_hour = current_app.config.get('MAINTENANCE_PLANNER_HOUR', 2)
+    last_rollup = 0.0
+    last_archive = 0.0
+    last_plan_day = None
+    
     while True:
         try:
             with current_app.app_context():
-                auto_release_expired_bookings()
+                if auto_release:
+                    auto_release_expired_bookings()
+                if hazard_schedule:
+                    apply_hazard_zone_transitions()
+                    trip_hazard_monitor.prune_idle()
+                if telemetry_rollups and time.monotonic() - last_rollup >= 60:
+                    roll_up_telemetry()
+                    last_rollup = time.monotonic()
+                if archive_export and time.monotonic() - last_archive >= archive_interval:
+                    export_archive()
+                    last_archive = time.monotonic()
+                today = datetime.now().date()
+                if maintenance_planner and datetime.now().hour >= planner_hour and last_plan_day != today:
+                    run_maintenance_planner()
+                    last_plan_day = today
         except Exception as e:
             print(f'[Scheduler] Error: {e}')
         
-        # Run every 60 seconds
-        time.sleep(60)
+        time.sleep(seconds_until_next_tick() if hazard_schedule else 60)
 
 
 def start_scheduler(app):
     """Start the background scheduler thread"""
-    if not app.config.get('ENABLE_AUTO_RELEASE', True):
-        print('[Scheduler] Auto-release disabled in config')
+    auto_release = app.config.get('ENABLE_AUTO_RELEASE', True)
+    hazard_schedule = app.config.get('ENABLE_HAZARD_SCHEDULER', True)
+    telemetry_rollups = app.config.get('ENABLE_TELEMETRY_ROLLUPS', True)
+    archive_export = app.config.get('ENABLE_ARCHIVE_EXPORT', False)
+    maintenance_planner = app.config.get('ENABLE_MAINTENANCE_PLANNER', True)
+    
+    if not any((auto_release, hazard_schedule, telemetry_rollups, archive_export, maintenance_planner)):
+        print('[Scheduler] Auto-release, hazard, telemetry, archive and maintenance schedulers disabled in config')
         return
     
     def run_with_context():
@@ -78,4 +181,7 @@ def start_scheduler(app):
     
     thread = threading.Thread(target=run_with_context, daemon=True)
     thread.start()
-    print('[Scheduler] Background auto-release scheduler started (checking every 60s)')
+    print(f'[Scheduler] Background scheduler started '
+          f'(auto-release: {auto_release}, hazard zones: {hazard_schedule}, '
+          f'telemetry rollups: {telemetry_rollups}, archive export: {archive_export}, '
+          f'maintenance planner: {maintenance_planner})')
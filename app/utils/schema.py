@@ -0,0 +1,151 @@
+"""
+Schema Upgrade Helpers - Add new columns/indexes to existing databases
+(db.create_all() only creates missing tables, not missing columns)
+"""
+from sqlalchemy import inspect, text
+
+
+def ensure_column(engine, table: str, column: str, ddl_type: str) -> bool:
+    """
+    Add a column to an existing table if it is missing.
+
+    Args:
+        engine: SQLAlchemy engine
+        table: Table name
+        column: Column name
+        ddl_type: Column type in DDL (e.g. 'VARCHAR(12)')
+
+    Returns:
+        True if the column was added
+    """
+    columns = {c['name'] for c in inspect(engine).get_columns(table)}
+    if column in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+    print(f'[Schema] Added column {table}.{column}')
+    return True
+
+
+def ensure_index(engine, index) -> bool:
+    """Create a model-declared Index if it does not exist yet"""
+    existing = {i['name'] for i in inspect(engine).get_indexes(index.table.name)}
+    if index.name in existing:
+        return False
+    index.create(bind=engine)
+    print(f'[Schema] Created index {index.name}')
+    return True
+
+
+def backfill_vehicle_geo_cells(db, batch_size: int = 1000) -> int:
+    """Compute geo_cell for vehicles stored before the column existed"""
+    from app.models import Vehicle
+    from app.utils.geo import geohash_encode
+
+    total = 0
+    while True:
+        rows = db.session.query(Vehicle.id, Vehicle.latitude, Vehicle.longitude).filter(
+            Vehicle.geo_cell.is_(None),
+            Vehicle.latitude.isnot(None),
+            Vehicle.longitude.isnot(None)
+        ).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.bulk_update_mappings(Vehicle, [
+            {'id': row.id, 'geo_cell': geohash_encode(row.latitude, row.longitude)}
+            for row in rows
+        ])
+        db.session.commit()
+        total += len(rows)
+
+    if total:
+        print(f'[Schema] Backfilled geo_cell for {total} vehicles')
+    return total
+
+
+def backfill_regions(db, batch_size: int = 1000) -> int:
+    """Assign the region partition key to rows stored before the column existed"""
+    from app.models import Vehicle, Trip, HazardZone, RouteHistory
+    from app.utils.regions import region_for, DEFAULT_REGION
+
+    sources = (
+        (Vehicle, lambda r: region_for(r.latitude, r.longitude),
+         (Vehicle.latitude, Vehicle.longitude)),
+        (Trip, lambda r: region_for(r.start_latitude, r.start_longitude) or region_for(r.end_latitude, r.end_longitude),
+         (Trip.start_latitude, Trip.start_longitude, Trip.end_latitude, Trip.end_longitude)),
+        (HazardZone, lambda r: region_for((r.min_latitude + r.max_latitude) / 2, (r.min_longitude + r.max_longitude) / 2),
+         (HazardZone.min_latitude, HazardZone.max_latitude, HazardZone.min_longitude, HazardZone.max_longitude)),
+        (RouteHistory, lambda r: region_for(r.start_lat, r.start_lng),
+         (RouteHistory.start_lat, RouteHistory.start_lng)),
+    )
+
+    total = 0
+    for model, assign, columns in sources:
+        last_id = 0
+        while True:
+            rows = db.session.query(model.id, *columns).filter(
+                model.region.is_(None),
+                model.id > last_id
+            ).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            db.session.bulk_update_mappings(model, [
+                {'id': row.id, 'region': assign(row) or DEFAULT_REGION}
+                for row in rows
+            ])
+            db.session.commit()
+            last_id = rows[-1].id
+            total += len(rows)
+
+    if total:
+        print(f'[Schema] Backfilled region for {total} rows')
+    return total
+
+
+def backfill_vehicle_stats(db) -> int:
+    """Build vehicle_stats once for databases that predate the table"""
+    from app.models import Vehicle, VehicleStats
+    from app.utils.vehicle_stats import rebuild_vehicle_stats
+
+    if db.session.query(VehicleStats.vehicle_id).first() is not None:
+        return 0
+    if db.session.query(Vehicle.id).first() is None:
+        return 0
+    return rebuild_vehicle_stats()
+
+
+def backfill_telemetry_state(db) -> int:
+    """Build vehicle_telemetry_state once for databases that predate the table"""
+    from app.models import VehicleTelemetryState
+    from app.utils.telemetry_state import rebuild_telemetry_state
+    from app.utils.telemetry_store import has_raw_data
+
+    if db.session.query(VehicleTelemetryState.vehicle_id).first() is not None:
+        return 0
+    if not has_raw_data():
+        return 0
+    return rebuild_telemetry_state()
+
+
+def upgrade_schema(db) -> None:
+    """Bring an existing database up to the current models (run after create_all)"""
+    from app.models import Vehicle, Trip, HazardZone, RouteHistory, IoTLog
+
+    engine = db.engine
+    ensure_column(engine, 'vehicles', 'geo_cell', 'VARCHAR(12)')
+    ensure_column(engine, 'vehicles', 'last_maintenance_odometer', 'FLOAT')
+    ensure_column(engine, 'trips', 'route_trace', 'BYTEA' if engine.dialect.name == 'postgresql' else 'BLOB')
+    for model in (Vehicle, Trip, HazardZone, RouteHistory):
+        ensure_column(engine, model.__tablename__, 'region', 'VARCHAR(20)')
+        for index in model.__table__.indexes:
+            ensure_index(engine, index)
+    for index in IoTLog.__table__.indexes:
+        try:
+            ensure_index(engine, index)
+        except Exception as e:
+            # Existing duplicate (vehicle_id, timestamp) rows block the unique index
+            print(f'[Schema] Could not create index {index.name}: {e}')
+    backfill_vehicle_geo_cells(db)
+    backfill_regions(db)
+    backfill_vehicle_stats(db)
+    backfill_telemetry_state(db)
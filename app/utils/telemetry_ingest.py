@@ -0,0 +1,302 @@
+"""
+Telemetry Ingestion - Batched IoT telemetry writes (raw partitions + latest vehicle state)
+ITS Feature: Fleet Management (vehicle telematics)
+"""
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, exists, func, select
+
+from app.models import db, Vehicle, Trip, VehicleTelemetryState
+from app.utils.anomaly_detector import anomaly_detector
+from app.utils.geo import geohash_encode, VEHICLE_GEOHASH_PRECISION
+from app.utils.geofence import geofence_monitor
+from app.utils.regions import region_for
+from app.utils.telemetry_state import upsert_latest
+from app.utils.telemetry_store import write_raw, forget_created_partitions
+
+# Numeric fields and their accepted range
+NUMERIC_FIELDS = (
+    ('battery_level', 0.0, 100.0),
+    ('fuel_level', 0.0, 100.0),
+    ('tire_pressure', 0.0, 150.0),
+    ('speed', 0.0, 300.0),
+    ('temperature', -50.0, 150.0),
+)
+ENGINE_STATUSES = ('on', 'off')
+
+# Returned error details are capped (a broken device can send thousands)
+MAX_ERRORS_REPORTED = 20
+
+# Timestamps further in the future than this are rejected (device clock drift)
+MAX_FUTURE_SECONDS = 300
+
+
+def _parse_timestamp(value, now: datetime) -> Optional[datetime]:
+    """ISO 8601 string or epoch seconds/milliseconds (UTC); None = now"""
+    if value is None:
+        return now
+    if isinstance(value, bool):
+        raise ValueError('timestamp')
+    if isinstance(value, (int, float)):
+        seconds = value / 1000.0 if value > 1e11 else float(value)
+        return datetime.utcfromtimestamp(seconds)
+    if isinstance(value, str):
+        text = value[:-1] if value.endswith('Z') else value
+        ts = datetime.fromisoformat(text)
+        if ts.tzinfo is not None:
+            ts = datetime.utcfromtimestamp(ts.timestamp())
+        return ts
+    raise ValueError('timestamp')
+
+
+def parse_record(raw, now: datetime) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Validate one telemetry record.
+
+    Args:
+        raw: Dict from the device (vehicle_id required, other fields optional)
+        now: Ingestion time (UTC), default timestamp
+
+    Returns:
+        (raw telemetry row dict, None) or (None, error message)
+    """
+    if not isinstance(raw, dict):
+        return None, 'record must be an object'
+
+    vehicle_id = raw.get('vehicle_id')
+    if isinstance(vehicle_id, bool):
+        return None, 'invalid vehicle_id'
+    if not isinstance(vehicle_id, int):
+        try:
+            vehicle_id = int(vehicle_id)
+        except (TypeError, ValueError):
+            return None, 'invalid vehicle_id'
+    if vehicle_id <= 0:
+        return None, 'invalid vehicle_id'
+
+    try:
+        timestamp = _parse_timestamp(raw.get('timestamp'), now)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None, 'invalid timestamp'
+    if (timestamp - now).total_seconds() > MAX_FUTURE_SECONDS:
+        return None, 'timestamp in the future'
+
+    row = {'vehicle_id': vehicle_id, 'timestamp': timestamp}
+    for field, low, high in NUMERIC_FIELDS:
+        value = raw.get(field)
+        if value is not None:
+            if isinstance(value, bool):
+                return None, f'invalid {field}'
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None, f'invalid {field}'
+            if not low <= value <= high:
+                return None, f'{field} out of range'
+        row[field] = value
+
+    lat = raw.get('latitude')
+    lng = raw.get('longitude')
+    if (lat is None) != (lng is None):
+        return None, 'latitude and longitude must be sent together'
+    if lat is not None:
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (TypeError, ValueError):
+            return None, 'invalid coordinates'
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+            return None, 'coordinates out of range'
+    row['latitude'] = lat
+    row['longitude'] = lng
+
+    engine_status = raw.get('engine_status')
+    if engine_status is not None and engine_status not in ENGINE_STATUSES:
+        return None, 'invalid engine_status'
+    row['engine_status'] = engine_status
+    row['geofence_violation'] = False  # Set by geofence_monitor.evaluate()
+    return row, None
+
+
+def _latest_per_vehicle(rows: List[Dict]) -> Dict[int, Dict]:
+    latest: Dict[int, Dict] = {}
+    for row in rows:
+        current = latest.get(row['vehicle_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[row['vehicle_id']] = row
+    return latest
+
+
+def _fresh(latest: Dict[int, Dict]) -> Dict[int, Dict]:
+    """
+    The samples not older than the vehicle's stored state (one indexed
+    read). A late or redelivered batch must not move vehicles back in time.
+    """
+    stored = dict(db.session.query(VehicleTelemetryState.vehicle_id, VehicleTelemetryState.timestamp).filter(
+        VehicleTelemetryState.vehicle_id.in_(list(latest))
+    ).all())
+    return {vid: row for vid, row in latest.items()
+            if stored.get(vid) is None or row['timestamp'] >= stored[vid]}
+
+
+def _update_vehicles(latest: Dict[int, Dict], now: datetime) -> None:
+    """
+    One executemany UPDATE with the newest sample of each vehicle.
+    Missing fields keep their stored value (COALESCE); geo_cell/region are
+    computed here because bulk UPDATEs bypass the ORM listeners. Run
+    before upsert_latest(): a vehicle whose state already holds a newer
+    sample (written concurrently) is left alone.
+    """
+    table = Vehicle.__table__
+    c = table.c
+    state = VehicleTelemetryState.__table__
+    params = []
+    for vehicle_id, row in latest.items():
+        lat, lng = row['latitude'], row['longitude']
+        params.append({
+            'b_id': vehicle_id,
+            'b_timestamp': row['timestamp'],
+            'b_lat': lat,
+            'b_lng': lng,
+            'b_geo_cell': geohash_encode(lat, lng, VEHICLE_GEOHASH_PRECISION) if lat is not None else None,
+            'b_region': region_for(lat, lng),
+            'b_battery': row['battery_level'],
+            'b_fuel': row['fuel_level'],
+            'b_tire': row['tire_pressure']
+        })
+    db.session.execute(
+        table.update()
+        .where(c.id == bindparam('b_id'))
+        .where(~exists(select(state.c.vehicle_id).where(
+            state.c.vehicle_id == c.id,
+            state.c.timestamp > bindparam('b_timestamp')
+        )))
+        .values(
+            latitude=func.coalesce(bindparam('b_lat'), c.latitude),
+            longitude=func.coalesce(bindparam('b_lng'), c.longitude),
+            geo_cell=func.coalesce(bindparam('b_geo_cell'), c.geo_cell),
+            region=func.coalesce(bindparam('b_region'), c.region),
+            battery_level=func.coalesce(bindparam('b_battery'), c.battery_level),
+            fuel_level=func.coalesce(bindparam('b_fuel'), c.fuel_level),
+            tire_pressure=func.coalesce(bindparam('b_tire'), c.tire_pressure),
+            updated_at=now
+        ),
+        params
+    )
+
+
+def _after_commit(latest: Dict[int, Dict]) -> None:
+    """Push the new state into the in-memory indexes and live trip monitoring"""
+    from app.utils.fleet_index import fleet_index
+    from app.utils.trip_hazard_monitor import trip_hazard_monitor
+
+    if fleet_index._loaded:
+        for vehicle_id, row in latest.items():
+            fleet_index.update_telemetry(vehicle_id, row['latitude'], row['longitude'],
+                                         row['battery_level'], row['fuel_level'])
+
+    # Vehicle positions double as rider positions during a trip
+    moving = {vid: row for vid, row in latest.items() if row['latitude'] is not None}
+    if not moving:
+        return
+    trips = db.session.query(Trip.id, Trip.user_id, Trip.vehicle_id).filter(
+        Trip.status == 'in_progress',
+        Trip.vehicle_id.in_(list(moving))
+    ).all()
+    for trip_id, user_id, vehicle_id in trips:
+        row = moving[vehicle_id]
+        try:
+            trip_hazard_monitor.update_position(trip_id, user_id, row['latitude'], row['longitude'])
+        except Exception as e:
+            print(f'[Telemetry] Hazard monitor error for trip {trip_id}: {e}')
+
+
+def ingest_batch(records: Iterable, now: Optional[datetime] = None) -> Dict:
+    """
+    Validate and store a batch of telemetry records.
+
+    All valid records are written with one bulk INSERT per day into the
+    daily raw partitions (samples already stored for the same vehicle and
+    timestamp are skipped),
+    the newest sample per vehicle updates vehicles (one executemany UPDATE,
+    skipped when the stored state is newer) and is upserted into
+    vehicle_telemetry_state, and everything commits
+    in one transaction. Samples are checked against the vehicles'
+    geofences first; vehicles entering violation get an EmergencyAlert in
+    the same transaction.
+    The in-memory anomaly detector checks the same samples; anomalies it
+    reports become Maintenance / EmergencyAlert rows after the commit.
+    Invalid records (or unknown vehicles) are skipped and reported.
+
+    Args:
+        records: Iterable of telemetry dicts
+        now: Ingestion time (UTC, default: now)
+
+    Returns:
+        Dict with accepted, rejected, vehicles, errors [(index, message)]
+        and elapsed_ms
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    rows = []
+    indexes = []
+    errors = []
+    rejected = 0
+    for index, raw in enumerate(records):
+        row, error = parse_record(raw, now)
+        if error is not None:
+            rejected += 1
+            if len(errors) < MAX_ERRORS_REPORTED:
+                errors.append((index, error))
+            continue
+        rows.append(row)
+        indexes.append(index)
+
+    if rows:
+        # Drop records of vehicles that do not exist (one indexed lookup per batch)
+        vehicle_ids = {row['vehicle_id'] for row in rows}
+        known = {vid for (vid,) in db.session.query(Vehicle.id).filter(Vehicle.id.in_(vehicle_ids)).all()}
+        if len(known) != len(vehicle_ids):
+            kept = []
+            for index, row in zip(indexes, rows):
+                if row['vehicle_id'] in known:
+                    kept.append(row)
+                else:
+                    rejected += 1
+                    if len(errors) < MAX_ERRORS_REPORTED:
+                        errors.append((index, 'unknown vehicle_id'))
+            rows = kept
+
+    latest = _latest_per_vehicle(rows)
+    if rows:
+        # Flags each sample in place; `states` is the debounced per-vehicle state
+        geofence = geofence_monitor.evaluate(rows)
+        anomalies = anomaly_detector.evaluate(rows)
+        try:
+            write_raw(rows)
+            fresh = _fresh(latest)
+            if fresh:
+                _update_vehicles(fresh, now)
+            upsert_latest([dict(row, geofence_violation=geofence.states.get(vid, False))
+                           for vid, row in latest.items()], now)
+            alerts = geofence_monitor.create_alerts(geofence.entered)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            forget_created_partitions()
+            geofence_monitor.forget(geofence.states)
+            anomaly_detector.forget(latest)
+            raise
+        _after_commit(fresh)
+        geofence_monitor.notify(alerts)
+        anomaly_detector.create_records(anomalies)
+
+    return {
+        'accepted': len(rows),
+        'rejected': rejected,
+        'vehicles': len(latest),
+        'errors': errors,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
@@ -0,0 +1,174 @@
+"""
+Telemetry State - Latest telemetry per vehicle (vehicle_telemetry_state),
+upserted during ingestion so readers never scan iot_logs
+ITS Feature: Fleet Management (vehicle telematics)
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import bindparam, func, select
+
+from app.models import db, VehicleTelemetryState
+from app.utils.telemetry_store import raw_tables
+
+# Fields carried over from each sample; a field missing from a newer sample
+# keeps its last known value (a GPS-only packet does not erase the battery)
+STATE_FIELDS = ('battery_level', 'fuel_level', 'tire_pressure', 'speed', 'latitude', 'longitude',
+                'engine_status', 'temperature', 'geofence_violation')
+
+# Vehicles silent for longer than this are shown as offline
+DEFAULT_STALE_SECONDS = 300
+
+
+def _state_row(sample: Dict, now: datetime) -> Dict:
+    row = {'vehicle_id': sample['vehicle_id'], 'timestamp': sample['timestamp'], 'updated_at': now}
+    for field in STATE_FIELDS:
+        row[field] = sample.get(field)
+    return row
+
+
+def _native_upsert(table):
+    """
+    INSERT ... ON CONFLICT (vehicle_id) DO UPDATE, applied only when the
+    incoming sample is not older than the stored one. None for dialects
+    without ON CONFLICT.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+
+    stmt = insert(table)
+    excluded = stmt.excluded
+    values = {field: func.coalesce(excluded[field], table.c[field]) for field in STATE_FIELDS}
+    values['timestamp'] = excluded.timestamp
+    values['updated_at'] = excluded.updated_at
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.vehicle_id],
+        set_=values,
+        where=table.c.timestamp <= excluded.timestamp
+    )
+
+
+def upsert_latest(samples: Iterable[Dict], now: Optional[datetime] = None) -> None:
+    """
+    Store the newest sample of each vehicle inside the caller's transaction.
+
+    Samples older than the stored one are ignored, so out-of-order delivery
+    never moves the state backwards.
+
+    Args:
+        samples: IoTLog row dicts (at most one per vehicle)
+        now: Write time (UTC, default: now)
+    """
+    now = now or datetime.utcnow()
+    rows = [_state_row(s, now) for s in samples]
+    if not rows:
+        return
+
+    table = VehicleTelemetryState.__table__
+    stmt = _native_upsert(table)
+    if stmt is not None:
+        db.session.execute(stmt, rows)
+        return
+
+    # Portable path: INSERT the vehicles without a row, executemany UPDATE the rest
+    existing = {vid for (vid,) in db.session.query(VehicleTelemetryState.vehicle_id).filter(
+        VehicleTelemetryState.vehicle_id.in_([r['vehicle_id'] for r in rows])
+    ).all()}
+    missing = [r for r in rows if r['vehicle_id'] not in existing]
+    if missing:
+        db.session.execute(table.insert(), missing)
+    present = [r for r in rows if r['vehicle_id'] in existing]
+    if present:
+        c = table.c
+        values = {field: func.coalesce(bindparam(f'b_{field}'), c[field]) for field in STATE_FIELDS}
+        db.session.execute(
+            table.update()
+            .where(c.vehicle_id == bindparam('b_vehicle_id'))
+            .where(c.timestamp <= bindparam('b_timestamp'))
+            .values(timestamp=bindparam('b_timestamp'), updated_at=now, **values),
+            [{f'b_{key}': value for key, value in r.items() if key != 'updated_at'} for r in present]
+        )
+
+
+def state_to_dict(state: Optional[VehicleTelemetryState], stale_seconds: int = DEFAULT_STALE_SECONDS,
+                  now: Optional[datetime] = None) -> Optional[Dict]:
+    if state is None:
+        return None
+    now = now or datetime.utcnow()
+    data = {field: getattr(state, field) for field in STATE_FIELDS}
+    data['vehicle_id'] = state.vehicle_id
+    data['timestamp'] = state.timestamp
+    data['age_seconds'] = max(0, int((now - state.timestamp).total_seconds()))
+    data['online'] = data['age_seconds'] <= stale_seconds
+    return data
+
+
+def get_latest(vehicle_id: int, stale_seconds: int = DEFAULT_STALE_SECONDS) -> Optional[Dict]:
+    """Latest telemetry of one vehicle (single primary-key read), None if never reported"""
+    return state_to_dict(db.session.get(VehicleTelemetryState, vehicle_id), stale_seconds)
+
+
+def latest_by_vehicle(vehicle_ids: Optional[Iterable[int]] = None,
+                      stale_seconds: int = DEFAULT_STALE_SECONDS) -> Dict[int, Dict]:
+    """
+    Latest telemetry of many vehicles, keyed by vehicle id.
+
+    Args:
+        vehicle_ids: Only these vehicles (default: the whole fleet)
+    """
+    query = VehicleTelemetryState.query
+    if vehicle_ids is not None:
+        ids = list(vehicle_ids)
+        if not ids:
+            return {}
+        query = query.filter(VehicleTelemetryState.vehicle_id.in_(ids))
+    now = datetime.utcnow()
+    return {state.vehicle_id: state_to_dict(state, stale_seconds, now) for state in query.all()}
+
+
+def rebuild_telemetry_state() -> int:
+    """
+    Recompute the state table from raw telemetry (backfill / repair): the
+    newest sample of each vehicle, reading the raw tables newest first.
+
+    Returns:
+        Number of vehicles written
+    """
+    now = datetime.utcnow()
+    mappings = {}
+    for _, table in reversed(raw_tables()):
+        latest = select(table.c.vehicle_id, func.max(table.c.timestamp).label('ts'))\
+            .group_by(table.c.vehicle_id).subquery()
+        rows = db.session.execute(select(table).join(
+            latest, (table.c.vehicle_id == latest.c.vehicle_id) & (table.c.timestamp == latest.c.ts)
+        )).mappings()
+        for row in rows:
+            if row['vehicle_id'] not in mappings:
+                mappings[row['vehicle_id']] = _state_row(row, now)
+
+    try:
+        VehicleTelemetryState.query.delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(VehicleTelemetryState, list(mappings.values()))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    print(f'[TelemetryState] Rebuilt latest telemetry for {len(mappings)} vehicles')
+    return len(mappings)
+
+
+def register_cli(app) -> None:
+    """`flask rebuild-telemetry-state` command"""
+    import click
+
+    @app.cli.command('rebuild-telemetry-state')
+    def rebuild_telemetry_state_command():
+        """Recompute the latest telemetry of every vehicle from raw telemetry"""
+        count = rebuild_telemetry_state()
+        click.echo(f'Rebuilt telemetry state for {count} vehicles')
@@ -0,0 +1,543 @@
+"""
+Telemetry Store - Time-partitioned raw telemetry with retention, 1-minute
+and 1-hour rollups per vehicle, and a query router over the three levels
+ITS Feature: Fleet Management (vehicle telematics)
+
+Raw samples go to one table per UTC day (iot_logs_pYYYYMMDD), created on
+demand. Retention drops whole partitions instead of deleting rows, which
+works the same on SQLite (table rotation) and PostgreSQL. The original
+iot_logs table stays readable as the oldest raw source and is trimmed
+with batched DELETEs.
+"""
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, func, inspect, select
+
+from app.models import db, IoTLog, IoTRollup1m, IoTRollup1h
+
+PARTITION_PREFIX = 'iot_logs_p'
+PARTITION_DATE_FORMAT = '%Y%m%d'
+
+# Levels from coarsest to finest: name -> bucket seconds (0 = raw samples)
+LEVELS = (('1h', 3600), ('1m', 60), ('raw', 0))
+LEVEL_SECONDS = dict(LEVELS)
+ROLLUP_MODELS = {'1m': IoTRollup1m, '1h': IoTRollup1h}
+SOURCE_LEVEL = {'1m': 'raw', '1h': '1m'}
+
+# Work per rollup pass is bounded; the scheduler catches up over several passes
+MAX_ROLLUP_WINDOW = {'1m': timedelta(hours=1), '1h': timedelta(hours=24)}
+DELETE_BATCH_SIZE = 10000
+
+EPOCH = datetime(1970, 1, 1)
+
+# Partitions live outside db.metadata so create_all()/drop_all() ignore them
+_metadata = MetaData()
+_tables: Dict[str, Table] = {}
+_created = set()
+_lock = threading.Lock()
+
+
+def _config(name: str, default):
+    from flask import current_app
+    return current_app.config.get(name, default)
+
+
+def floor_time(ts: datetime, seconds: int) -> datetime:
+    """Start of the `seconds`-long bucket containing ts"""
+    offset = int((ts - EPOCH).total_seconds() // seconds) * seconds
+    return EPOCH + timedelta(seconds=offset)
+
+
+# ----------------------------------------------------------------------
+# Raw partitions
+# ----------------------------------------------------------------------
+
+def partition_name(day: date) -> str:
+    return PARTITION_PREFIX + day.strftime(PARTITION_DATE_FORMAT)
+
+
+def partition_day(name: str) -> Optional[date]:
+    if not name.startswith(PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(PARTITION_PREFIX):], PARTITION_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def _partition_table(name: str) -> Table:
+    """Table object of one daily partition (same columns as iot_logs)"""
+    with _lock:
+        table = _tables.get(name)
+        if table is None:
+            table = Table(
+                name, _metadata,
+                Column('id', Integer, primary_key=True),
+                # No foreign key: rows are checked against vehicles at ingestion
+                Column('vehicle_id', Integer, nullable=False),
+                Column('battery_level', Float),
+                Column('fuel_level', Float),
+                Column('tire_pressure', Float),
+                Column('speed', Float),
+                Column('latitude', Float),
+                Column('longitude', Float),
+                Column('engine_status', String(20)),
+                Column('temperature', Float),
+                Column('geofence_violation', Boolean, default=False),
+                Column('timestamp', DateTime, nullable=False),
+                Index(f'uq_{name}_vehicle_timestamp', 'vehicle_id', 'timestamp', unique=True),
+                Index(f'ix_{name}_timestamp', 'timestamp')
+            )
+            _tables[name] = table
+        return table
+
+
+def _ensure_partition(day: date) -> Table:
+    """Partition for `day`, created inside the current transaction if missing"""
+    name = partition_name(day)
+    table = _partition_table(name)
+    if name not in _created:
+        table.create(db.session.connection(), checkfirst=True)
+        _created.add(name)
+    return table
+
+
+def forget_created_partitions() -> None:
+    """Call after a rollback: partitions created in that transaction are gone"""
+    _created.clear()
+
+
+def raw_tables(start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Tuple[Optional[date], Table]]:
+    """
+    Raw sources oldest first: iot_logs (day None), then the daily partitions
+    overlapping [start, end).
+    """
+    names = inspect(db.session.connection()).get_table_names()
+    days = sorted(day for day in (partition_day(name) for name in names) if day is not None)
+    tables: List[Tuple[Optional[date], Table]] = [(None, IoTLog.__table__)]
+    for day in days:
+        if start is not None and day < start.date():
+            continue
+        if end is not None and day > (end - timedelta(microseconds=1)).date():
+            continue
+        tables.append((day, _partition_table(partition_name(day))))
+    return tables
+
+
+def _insert_ignoring_duplicates(table):
+    """
+    INSERT that skips rows violating the (vehicle_id, timestamp) unique
+    index, so redelivered telemetry (at-least-once transports) is idempotent.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+
+def write_raw(rows: List[Dict]) -> None:
+    """Insert samples into their daily partitions (one executemany per day)"""
+    by_day: Dict[date, List[Dict]] = {}
+    for row in rows:
+        by_day.setdefault(row['timestamp'].date(), []).append(row)
+    for day, day_rows in sorted(by_day.items()):
+        db.session.execute(_insert_ignoring_duplicates(_ensure_partition(day)), day_rows)
+
+
+def iter_raw(start: Optional[datetime] = None, end: Optional[datetime] = None,
+             vehicle_ids: Optional[Iterable[int]] = None, newest_first: bool = False) -> Iterator[Dict]:
+    """
+    Raw samples in [start, end), table by table (oldest first), each table
+    ordered by vehicle_id, timestamp. With newest_first, tables come newest
+    first and each is ordered by timestamp descending, so the whole stream
+    runs backwards in time.
+    """
+    ids = list(vehicle_ids) if vehicle_ids is not None else None
+    tables = raw_tables(start, end)
+    for _, table in (reversed(tables) if newest_first else tables):
+        c = table.c
+        stmt = select(table)
+        if start is not None:
+            stmt = stmt.where(c.timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(c.timestamp < end)
+        if ids is not None:
+            stmt = stmt.where(c.vehicle_id.in_(ids))
+        order = (c.timestamp.desc(),) if newest_first else (c.vehicle_id, c.timestamp)
+        stmt = stmt.order_by(*order).execution_options(yield_per=5000)
+        for row in db.session.execute(stmt).mappings():
+            yield dict(row)
+
+
+def count_raw() -> int:
+    return sum(db.session.execute(select(func.count()).select_from(table)).scalar() or 0
+               for _, table in raw_tables())
+
+
+def has_raw_data() -> bool:
+    return any(db.session.execute(select(table.c.id).limit(1)).first() is not None
+               for _, table in raw_tables())
+
+
+def oldest_raw(after: Optional[datetime] = None) -> Optional[datetime]:
+    """Earliest raw timestamp (>= after), using each table's timestamp index"""
+    oldest = None
+    for _, table in raw_tables(after):
+        stmt = select(func.min(table.c.timestamp))
+        if after is not None:
+            stmt = stmt.where(table.c.timestamp >= after)
+        ts = db.session.execute(stmt).scalar()
+        if ts is not None and (oldest is None or ts < oldest):
+            oldest = ts
+    return oldest
+
+
+# ----------------------------------------------------------------------
+# Rollups
+# ----------------------------------------------------------------------
+
+class _Bucket:
+    """Running aggregate of one vehicle and time bucket"""
+
+    __slots__ = ('samples', 'first_at', 'last_at', 'sums', 'battery_min', 'fuel_min', 'speed_max',
+                 'temperature_max', 'battery_last', 'fuel_last', 'latitude_last', 'longitude_last',
+                 'geofence_violations')
+
+    def __init__(self):
+        self.samples = 0
+        self.first_at = None
+        self.last_at = None
+        self.sums = {'battery': [0.0, 0], 'fuel': [0.0, 0], 'speed': [0.0, 0]}  # [sum, weight]
+        self.battery_min = None
+        self.fuel_min = None
+        self.speed_max = None
+        self.temperature_max = None
+        self.battery_last = None
+        self.fuel_last = None
+        self.latitude_last = None
+        self.longitude_last = None
+        self.geofence_violations = 0
+
+    @staticmethod
+    def _min(a, b):
+        return b if a is None or (b is not None and b < a) else a
+
+    @staticmethod
+    def _max(a, b):
+        return b if a is None or (b is not None and b > a) else a
+
+    def _add(self, samples: int, first_at, last_at, battery, fuel, speed, battery_min, fuel_min,
+             speed_max, temperature_max, battery_last, fuel_last, lat, lng, violations) -> None:
+        for key, value in (('battery', battery), ('fuel', fuel), ('speed', speed)):
+            if value is not None:
+                self.sums[key][0] += value * samples
+                self.sums[key][1] += samples
+        self.battery_min = self._min(self.battery_min, battery_min)
+        self.fuel_min = self._min(self.fuel_min, fuel_min)
+        self.speed_max = self._max(self.speed_max, speed_max)
+        self.temperature_max = self._max(self.temperature_max, temperature_max)
+        self.first_at = self._min(self.first_at, first_at)
+        if self.last_at is None or last_at >= self.last_at:
+            self.last_at = last_at
+            self.battery_last = battery_last if battery_last is not None else self.battery_last
+            self.fuel_last = fuel_last if fuel_last is not None else self.fuel_last
+            if lat is not None:
+                self.latitude_last, self.longitude_last = lat, lng
+        self.samples += samples
+        self.geofence_violations += violations
+
+    def add_sample(self, row: Dict) -> None:
+        ts = row['timestamp']
+        self._add(1, ts, ts, row['battery_level'], row['fuel_level'], row['speed'],
+                  row['battery_level'], row['fuel_level'], row['speed'], row['temperature'],
+                  row['battery_level'], row['fuel_level'], row['latitude'], row['longitude'],
+                  1 if row['geofence_violation'] else 0)
+
+    def add_rollup(self, row: Dict) -> None:
+        self._add(row['samples'], row['first_at'], row['last_at'], row['battery_avg'], row['fuel_avg'],
+                  row['speed_avg'], row['battery_min'], row['fuel_min'], row['speed_max'],
+                  row['temperature_max'], row['battery_last'], row['fuel_last'],
+                  row['latitude_last'], row['longitude_last'], row['geofence_violations'])
+
+    def _avg(self, key: str) -> Optional[float]:
+        total, weight = self.sums[key]
+        return total / weight if weight else None
+
+    def to_row(self, vehicle_id: int, bucket: datetime) -> Dict:
+        return {
+            'vehicle_id': vehicle_id,
+            'bucket': bucket,
+            'samples': self.samples,
+            'first_at': self.first_at,
+            'last_at': self.last_at,
+            'battery_avg': self._avg('battery'),
+            'battery_min': self.battery_min,
+            'battery_last': self.battery_last,
+            'fuel_avg': self._avg('fuel'),
+            'fuel_min': self.fuel_min,
+            'fuel_last': self.fuel_last,
+            'speed_avg': self._avg('speed'),
+            'speed_max': self.speed_max,
+            'temperature_max': self.temperature_max,
+            'latitude_last': self.latitude_last,
+            'longitude_last': self.longitude_last,
+            'geofence_violations': self.geofence_violations
+        }
+
+
+def aggregate(rows: Iterable[Dict], seconds: int, from_rollups: bool = False) -> List[Dict]:
+    """Raw samples (or finer rollup rows) -> rollup rows of `seconds`-long buckets"""
+    buckets: Dict[Tuple[int, datetime], _Bucket] = {}
+    for row in rows:
+        ts = row['bucket'] if from_rollups else row['timestamp']
+        key = (row['vehicle_id'], floor_time(ts, seconds))
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _Bucket()
+        if from_rollups:
+            bucket.add_rollup(row)
+        else:
+            bucket.add_sample(row)
+    return [bucket.to_row(vehicle_id, start) for (vehicle_id, start), bucket in sorted(buckets.items())]
+
+
+def watermark(level: str) -> Optional[datetime]:
+    """End of the last rolled-up bucket of a level (None before the first rollup)"""
+    model = ROLLUP_MODELS[level]
+    last = db.session.query(func.max(model.bucket)).scalar()
+    return last + timedelta(seconds=LEVEL_SECONDS[level]) if last is not None else None
+
+
+def _oldest(level: str, after: Optional[datetime] = None) -> Optional[datetime]:
+    if level == 'raw':
+        return oldest_raw(after)
+    model = ROLLUP_MODELS[level]
+    query = db.session.query(func.min(model.bucket))
+    if after is not None:
+        query = query.filter(model.bucket >= after)
+    return query.scalar()
+
+
+def _read_rollups(level: str, start: datetime, end: datetime,
+                  vehicle_ids: Optional[List[int]] = None) -> List[Dict]:
+    model = ROLLUP_MODELS[level]
+    table = model.__table__
+    stmt = select(table).where(table.c.bucket >= start, table.c.bucket < end)
+    if vehicle_ids is not None:
+        stmt = stmt.where(table.c.vehicle_id.in_(vehicle_ids))
+    stmt = stmt.order_by(table.c.vehicle_id, table.c.bucket)
+    return [dict(row) for row in db.session.execute(stmt).mappings()]
+
+
+def _rollup_level(level: str, now: datetime) -> int:
+    """
+    Roll up one window of `level` from its source level.
+
+    The window starts at the first source data past the level's watermark
+    (so gaps without telemetry are skipped and the window is never empty)
+    and ends before buckets that can still receive samples: for 1m,
+    IOT_ROLLUP_LATE_SECONDS before now; for 1h, the 1m watermark. Rows of
+    the window are replaced, so a re-run is idempotent. Samples arriving
+    after their bucket was rolled up stay in the raw partitions only.
+
+    Returns:
+        Number of rollup rows written
+    """
+    seconds = LEVEL_SECONDS[level]
+    source = SOURCE_LEVEL[level]
+    if level == '1m':
+        cutoff = floor_time(now - timedelta(seconds=_config('IOT_ROLLUP_LATE_SECONDS', 120)), seconds)
+    else:
+        source_mark = watermark(source)
+        if source_mark is None:
+            return 0
+        cutoff = floor_time(source_mark, seconds)
+
+    first = _oldest(source, watermark(level))
+    if first is None:
+        return 0
+    start = floor_time(first, seconds)
+    if start >= cutoff:
+        return 0
+    end = min(cutoff, start + MAX_ROLLUP_WINDOW[level])
+
+    if source == 'raw':
+        rows = aggregate(iter_raw(start, end), seconds)
+    else:
+        rows = aggregate(_read_rollups(source, start, end), seconds, from_rollups=True)
+
+    model = ROLLUP_MODELS[level]
+    try:
+        model.query.filter(model.bucket >= start, model.bucket < end).delete(synchronize_session=False)
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(rows)
+
+
+def run_rollups(now: Optional[datetime] = None, max_windows: int = 24) -> Dict[str, int]:
+    """Roll up raw -> 1m -> 1h until caught up (at most `max_windows` windows per level)"""
+    now = now or datetime.utcnow()
+    written = {}
+    for level in ('1m', '1h'):
+        written[level] = 0
+        for _ in range(max_windows):
+            count = _rollup_level(level, now)
+            if not count:
+                break
+            written[level] += count
+    return written
+
+
+def apply_retention(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Drop raw partitions older than IOT_RAW_RETENTION_DAYS and 1m rollups
+    older than IOT_ROLLUP_1M_RETENTION_DAYS (1h rollups: IOT_ROLLUP_1H_RETENTION_DAYS,
+    0 = keep forever). Data is only removed once the next level has
+    rolled it up, and raw data is only removed once archived when
+    ENABLE_ARCHIVE_EXPORT is set.
+    """
+    now = now or datetime.utcnow()
+    removed = {'partitions': 0, 'raw_rows': 0, '1m': 0, '1h': 0}
+
+    raw_mark = watermark('1m')
+    if raw_mark is not None:
+        safe = min(now - timedelta(days=_config('IOT_RAW_RETENTION_DAYS', 7)), raw_mark)
+        if _config('ENABLE_ARCHIVE_EXPORT', False):
+            from app.utils.columnar_archive import archived_until
+            archived = archived_until('iot')
+            safe = min(safe, archived) if archived is not None else datetime.min
+
+        for day, table in raw_tables():
+            if day is None or datetime.combine(day + timedelta(days=1), datetime.min.time()) > safe:
+                continue
+            try:
+                table.drop(db.session.connection(), checkfirst=True)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            _created.discard(table.name)
+            removed['partitions'] += 1
+            print(f'[TelemetryStore] Dropped raw partition {table.name}')
+
+        # Rows written before partitioning: batched DELETEs keep transactions short
+        while True:
+            ids = [row[0] for row in db.session.query(IoTLog.id).filter(IoTLog.timestamp < safe)
+                   .limit(DELETE_BATCH_SIZE).all()]
+            if not ids:
+                break
+            IoTLog.query.filter(IoTLog.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+            removed['raw_rows'] += len(ids)
+
+    minute_mark = watermark('1h')
+    if minute_mark is not None:
+        safe = min(now - timedelta(days=_config('IOT_ROLLUP_1M_RETENTION_DAYS', 90)), minute_mark)
+        removed['1m'] = IoTRollup1m.query.filter(IoTRollup1m.bucket < safe).delete(synchronize_session=False)
+        db.session.commit()
+
+    hour_days = _config('IOT_ROLLUP_1H_RETENTION_DAYS', 0)
+    if hour_days:
+        removed['1h'] = IoTRollup1h.query.filter(
+            IoTRollup1h.bucket < now - timedelta(days=hour_days)
+        ).delete(synchronize_session=False)
+        db.session.commit()
+
+    return removed
+
+
+def run_maintenance(now: Optional[datetime] = None) -> Dict:
+    """Rollups then retention (scheduler tick / CLI)"""
+    written = run_rollups(now)
+    removed = apply_retention(now)
+    if any(written.values()) or any(removed.values()):
+        print(f'[TelemetryStore] Rolled up {written}, removed {removed}')
+    return {'rolled_up': written, 'removed': removed}
+
+
+# ----------------------------------------------------------------------
+# Query router
+# ----------------------------------------------------------------------
+
+def choose_level(start: datetime, resolution_seconds: int = 0) -> str:
+    """
+    Coarsest level whose buckets are not wider than the requested
+    resolution. If that level no longer holds `start` (retention), the
+    finest coarser level that still does is used instead.
+    """
+    names = [name for name, _ in LEVELS]
+    index = next(i for i, (_, seconds) in enumerate(LEVELS) if seconds <= resolution_seconds)
+    oldest = _oldest(names[index])
+    if oldest is not None and oldest <= start:
+        return names[index]
+    for name in reversed(names[:index]):
+        candidate = _oldest(name)
+        if candidate is not None and candidate <= start:
+            return name
+    return names[index]
+
+
+def _read_level(level: str, start: datetime, end: datetime, vehicle_ids: Optional[List[int]]) -> List[Dict]:
+    """Points of `level` in [start, end); the part past its watermark is built from finer data"""
+    if level == 'raw':
+        return sorted(iter_raw(start, end, vehicle_ids), key=lambda r: (r['vehicle_id'], r['timestamp']))
+
+    seconds = LEVEL_SECONDS[level]
+    mark = watermark(level)
+    points = _read_rollups(level, start, min(end, mark), vehicle_ids) if mark is not None and mark > start else []
+    tail_start = max(start, mark) if mark is not None else start
+    if tail_start < end:
+        source = SOURCE_LEVEL[level]
+        finer = _read_level(source, tail_start, end, vehicle_ids)
+        points += aggregate(finer, seconds, from_rollups=source != 'raw')
+        points.sort(key=lambda r: (r['vehicle_id'], r['bucket']))
+    return points
+
+
+def query_telemetry(vehicle_ids: Iterable[int], start: datetime, end: datetime,
+                    resolution_seconds: int = 0, max_points: Optional[int] = None) -> Dict:
+    """
+    Telemetry of some vehicles in [start, end) from the coarsest table that
+    answers the request.
+
+    Args:
+        vehicle_ids: Vehicles to read
+        start, end: UTC range
+        resolution_seconds: Widest acceptable bucket (0 = raw samples)
+        max_points: Alternatively, points per vehicle the caller can use;
+            the resolution is derived from the range
+
+    Returns:
+        Dict with level ('raw', '1m', '1h'), bucket_seconds and points
+        (raw samples or rollup rows, ordered by vehicle and time)
+    """
+    if max_points:
+        resolution_seconds = max(resolution_seconds, int((end - start).total_seconds() // max_points))
+    level = choose_level(start, resolution_seconds)
+    return {
+        'level': level,
+        'bucket_seconds': LEVEL_SECONDS[level],
+        'points': _read_level(level, start, end, list(vehicle_ids))
+    }
+
+
+def register_cli(app) -> None:
+    """`flask telemetry-maintenance` command"""
+    import click
+
+    @app.cli.command('telemetry-maintenance')
+    def telemetry_maintenance_command():
+        """Roll up raw telemetry into 1m/1h tables and apply retention"""
+        result = run_maintenance()
+        click.echo(f"Rolled up {result['rolled_up']}, removed {result['removed']}")
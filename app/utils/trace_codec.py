@@ -0,0 +1,200 @@
+"""
+Trace Codec - Compact binary storage of GPS breadcrumb traces
+ITS Feature: Trip replay (route traces built from vehicle telemetry)
+
+A trace is a header followed by one record per point. Each record holds
+the deltas to the previous point (the first one to zero) of
+
+    timestamp   - integer milliseconds since the epoch (UTC)
+    latitude    - integer micro-degrees (~0.1 m)
+    longitude   - integer micro-degrees
+
+each zigzag-mapped and written as a LEB128 varint, so a sample taken a
+few seconds and a few metres after the previous one takes 5-7 bytes
+instead of a telemetry row or ~40 bytes of JSON.
+"""
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Union
+
+MAGIC = b'GT'
+VERSION = 1
+HEADER = MAGIC + bytes([VERSION])
+EPOCH = datetime(1970, 1, 1)
+MICRO = 1_000_000
+
+
+class TracePoint(NamedTuple):
+    timestamp: datetime  # UTC
+    latitude: float
+    longitude: float
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+class TraceEncoder:
+    """Appends points to a trace; to_bytes() returns the encoded blob"""
+
+    def __init__(self):
+        self._buffer = bytearray(HEADER)
+        self._prev = (0, 0, 0)
+        self.points = 0
+
+    def add(self, timestamp: datetime, latitude: float, longitude: float) -> None:
+        current = (
+            round((timestamp - EPOCH).total_seconds() * 1000),
+            round(latitude * MICRO),
+            round(longitude * MICRO)
+        )
+        for value, prev in zip(current, self._prev):
+            _write_varint(self._buffer, _zigzag(value - prev))
+        self._prev = current
+        self.points += 1
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._buffer)
+
+
+class TraceDecoder:
+    """
+    Incremental decoder: feed() accepts the blob in arbitrary chunks and
+    returns the points completed so far, so a replay can start before the
+    whole trace has been read.
+    """
+
+    def __init__(self):
+        self._header = bytearray()
+        self._values: List[int] = []
+        self._varint = 0
+        self._shift = 0
+        self._prev = [0, 0, 0]
+
+    def feed(self, data: bytes) -> List[TracePoint]:
+        points = []
+        view = memoryview(data)
+        if len(self._header) < len(HEADER):
+            missing = len(HEADER) - len(self._header)
+            self._header += view[:missing]
+            view = view[missing:]
+            if len(self._header) == len(HEADER) and bytes(self._header) != HEADER:
+                raise ValueError('Not a trace (bad header or unsupported version)')
+
+        for byte in view:
+            self._varint |= (byte & 0x7F) << self._shift
+            if byte & 0x80:
+                self._shift += 7
+                continue
+            self._values.append(_unzigzag(self._varint))
+            self._varint = self._shift = 0
+            if len(self._values) == 3:
+                for i, delta in enumerate(self._values):
+                    self._prev[i] += delta
+                self._values.clear()
+                ms, lat, lng = self._prev
+                points.append(TracePoint(EPOCH + timedelta(milliseconds=ms), lat / MICRO, lng / MICRO))
+        return points
+
+    def close(self) -> None:
+        """Raise if the data ended in the middle of a point"""
+        if self._values or self._shift or 0 < len(self._header) < len(HEADER):
+            raise ValueError('Truncated trace')
+
+
+def encode_trace(points: Iterable) -> bytes:
+    """Encode (timestamp, latitude, longitude) points, oldest first"""
+    encoder = TraceEncoder()
+    for timestamp, latitude, longitude in points:
+        encoder.add(timestamp, latitude, longitude)
+    return encoder.to_bytes()
+
+
+def iter_trace(source: Union[bytes, Iterable[bytes]]) -> Iterator[TracePoint]:
+    """Stream the points of a blob, or of an iterable of chunks of one"""
+    chunks = [source] if isinstance(source, (bytes, bytearray, memoryview)) else source
+    decoder = TraceDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.close()
+
+
+def decode_trace(blob: bytes) -> List[TracePoint]:
+    return list(iter_trace(blob))
+
+
+# ----------------------------------------------------------------------
+# Trip traces from telemetry (app context required)
+# ----------------------------------------------------------------------
+
+def _utc_offset() -> timedelta:
+    """Local time minus UTC (trips store local time, telemetry UTC)"""
+    return timedelta(minutes=round((datetime.now() - datetime.utcnow()).total_seconds() / 60))
+
+
+def build_trip_trace(trip, end: Optional[datetime] = None) -> Optional[bytes]:
+    """
+    Encode the raw telemetry positions of the trip's vehicle between the
+    trip's start and end (or `end`, local time, for a trip in progress).
+    Returns None when the trip has no position samples.
+    """
+    from app.utils.telemetry_store import iter_raw
+
+    if trip.start_time is None:
+        return None
+    offset = _utc_offset()
+    start = trip.start_time - offset
+    stop = (end or trip.end_time or datetime.now()) - offset
+
+    encoder = TraceEncoder()
+    last = None
+    for row in iter_raw(start, stop, [trip.vehicle_id]):
+        if row['latitude'] is None or row['longitude'] is None:
+            continue
+        position = (row['latitude'], row['longitude'])
+        if position == last:
+            continue  # Parked: keep the first sample only
+        encoder.add(row['timestamp'], *position)
+        last = position
+    return encoder.to_bytes() if encoder.points else None
+
+
+def trip_trace_points(trip) -> Iterator[TracePoint]:
+    """Stored trace of a completed trip, otherwise built from telemetry"""
+    blob = trip.route_trace or build_trip_trace(trip)
+    return iter_trace(blob) if blob else iter([])
+
+
+def register_cli(app) -> None:
+    """`flask build-trip-traces` command"""
+    import click
+
+    @app.cli.command('build-trip-traces')
+    @click.option('--rebuild', is_flag=True, help='Also rebuild trips that already have a trace')
+    def build_trip_traces_command(rebuild):
+        """Store route traces of completed trips from telemetry"""
+        from app.models import db, Trip
+
+        query = Trip.query.filter(Trip.status == 'completed', Trip.start_time.isnot(None))
+        if not rebuild:
+            query = query.filter(Trip.route_trace.is_(None))
+        built = 0
+        for trip in query.order_by(Trip.id).all():
+            blob = build_trip_trace(trip)
+            if blob:
+                trip.route_trace = blob
+                built += 1
+                if built % 100 == 0:
+                    db.session.commit()
+        db.session.commit()
+        click.echo(f'Built {built} trip traces')
@@ -0,0 +1,138 @@
+"""
+Live Trip Hazard Monitor - Incremental hazard checks on streaming GPS points
+ITS Feature: Incident Management & Traveler Information System
+"""
+import threading
+import time
+from typing import List, Dict, Tuple, Optional, Set
+
+from app.utils.hazard_checker import distance_between_points
+from app.utils.hazard_raster import hazard_raster
+
+
+class TripHazardState:
+    """Per-trip state kept between two position updates"""
+    __slots__ = ('trip_id', 'user_id', 'last_point', 'inside', 'alerted', 'updated_at')
+
+    def __init__(self, trip_id: int, user_id: int):
+        self.trip_id = trip_id
+        self.user_id = user_id
+        self.last_point: Optional[Tuple[float, float]] = None
+        self.inside: Set[int] = set()     # Zones containing the last point
+        self.alerted: Set[int] = set()    # Zones already warned on this trip
+        self.updated_at = time.monotonic()
+
+
+class LiveTripHazardMonitor:
+    """
+    Streaming hazard checker for in-progress trips.
+
+    Each update only samples the segment between the previous and the new
+    position and looks each sample up in the hazard coverage raster, so the
+    cost does not depend on trip length or on the total zone count.
+    """
+
+    def __init__(self, sample_step_km: float = 0.1, max_samples: int = 20, idle_ttl_seconds: float = 6 * 3600):
+        self.sample_step_km = sample_step_km
+        self.max_samples = max_samples
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._lock = threading.Lock()
+        self._trips: Dict[int, TripHazardState] = {}
+
+    def start_trip(self, trip_id: int, user_id: int) -> TripHazardState:
+        with self._lock:
+            state = self._trips.get(trip_id)
+            if state is None:
+                state = TripHazardState(trip_id, user_id)
+                self._trips[trip_id] = state
+            return state
+
+    def end_trip(self, trip_id: int) -> None:
+        with self._lock:
+            self._trips.pop(trip_id, None)
+
+    def is_tracking(self, trip_id: int) -> bool:
+        return trip_id in self._trips
+
+    def _segment_samples(self, p1: Optional[Tuple[float, float]], p2: Tuple[float, float]) -> List[Tuple[float, float]]:
+        """Points to test on segment p1 -> p2 (bounded count, always includes p2)"""
+        if p1 is None:
+            return [p2]
+        distance = distance_between_points(p1, p2)
+        steps = min(self.max_samples, int(distance / self.sample_step_km) + 1)
+        samples = [
+            (p1[0] + (p2[0] - p1[0]) * k / steps, p1[1] + (p2[1] - p1[1]) * k / steps)
+            for k in range(1, steps)
+        ]
+        samples.append(p2)
+        return samples
+
+    def update_position(self, trip_id: int, user_id: int, lat: float, lng: float, notify: bool = True) -> Dict:
+        """
+        Process one new GPS/IoT position of a trip.
+
+        Args:
+            trip_id: In-progress trip ID
+            user_id: Rider to warn
+            lat, lng: New position
+            notify: Send a notification when a zone is entered
+
+        Returns:
+            Dict with 'entered' (zones newly entered) and 'inside' (zone ids containing the point)
+        """
+        state = self.start_trip(trip_id, user_id)
+        point = (lat, lng)
+        samples = self._segment_samples(state.last_point, point)
+
+        # Raster lookups: O(1) per sample, exact tests only on zone boundaries
+        # (one raster build for all samples; samples end with the new point)
+        touched, inside_now = hazard_raster.zones_along(samples)
+
+        entered = []
+        with self._lock:
+            for zone in touched:
+                if zone['id'] not in state.alerted:
+                    state.alerted.add(zone['id'])
+                    entered.append(zone)
+            state.inside = inside_now
+            state.last_point = point
+            state.updated_at = time.monotonic()
+
+        if entered and notify:
+            self._emit_warnings(state, entered)
+
+        return {'entered': entered, 'inside': sorted(inside_now)}
+
+    def _emit_warnings(self, state: TripHazardState, zones: List[Dict]) -> None:
+        from app.models import db, HazardZone
+        from app.utils.notification_helper import notify_hazard_zone_entered
+
+        for zone in zones:
+            try:
+                notify_hazard_zone_entered(state.user_id, zone, state.trip_id)
+            except Exception as e:
+                print(f'[TripHazardMonitor] Notification error: {e}')
+
+        try:
+            HazardZone.query.filter(HazardZone.id.in_([z['id'] for z in zones])).update(
+                {'warning_count': HazardZone.warning_count + 1}, synchronize_session=False
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f'[TripHazardMonitor] Error updating warning count: {e}')
+
+        print(f'[TripHazardMonitor] Trip {state.trip_id} entered {len(zones)} hazard zone(s)')
+
+    def prune_idle(self) -> int:
+        """Drop state of trips that have not reported for idle_ttl_seconds"""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        with self._lock:
+            stale = [tid for tid, s in self._trips.items() if s.updated_at < cutoff]
+            for tid in stale:
+                del self._trips[tid]
+        return len(stale)
+
+
+# Shared per-process monitor
+trip_hazard_monitor = LiveTripHazardMonitor()
@@ -0,0 +1,213 @@
+"""
+Vehicle Search Index - In-memory n-gram index over brand/model/plate/code
+ITS Feature: Traveler Information System (instant vehicle search & typeahead)
+"""
+import threading
+from typing import List, Dict, Optional, Set
+
+from app.utils.fleet_index import fleet_index
+
+# Searchable fields, in ranking priority order
+SEARCH_FIELDS = ('vehicle_code', 'license_plate', 'brand', 'model')
+
+# Grams of length 1..MAX_GRAM are indexed; longer queries intersect trigrams
+MAX_GRAM = 3
+
+
+def _grams(text: str, n: int) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _all_grams(text: str) -> Set[str]:
+    grams = set()
+    for n in range(1, MAX_GRAM + 1):
+        grams |= _grams(text, n)
+    return grams
+
+
+class VehicleSearchIndex:
+    """
+    Case-insensitive substring search equivalent to ilike('%q%') on
+    SEARCH_FIELDS, backed by an inverted index of 1- to 3-grams.
+
+    A query is answered by intersecting the posting sets of its trigrams
+    (or its whole text when shorter than 3 characters) and verifying the
+    few remaining candidates. The index follows the live fleet index, so
+    it stays in sync with every committed Vehicle change.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[int]] = {}
+        self._docs: Dict[int, Dict] = {}  # vehicle_id -> {field: lowercase text} + display fields
+        self._built = False
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def _add(self, vehicle: Dict) -> None:
+        vehicle_id = vehicle['id']
+        fields = {f: (vehicle.get(f) or '').lower() for f in SEARCH_FIELDS}
+        grams = set()
+        for text in fields.values():
+            grams |= _all_grams(text)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(vehicle_id)
+        self._docs[vehicle_id] = {'fields': fields, 'grams': grams, 'vehicle': vehicle}
+
+    def _remove(self, vehicle_id: int) -> None:
+        doc = self._docs.pop(vehicle_id, None)
+        if doc is None:
+            return
+        for gram in doc['grams']:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(vehicle_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def rebuild(self, vehicles: List[Dict]) -> None:
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            for vehicle in vehicles:
+                self._add(vehicle)
+            self._built = True
+        print(f'[VehicleSearch] Indexed {len(self._docs)} vehicles, {len(self._postings)} grams')
+
+    def on_fleet_change(self, kind: str, payload) -> None:
+        """Fleet index listener"""
+        if kind == 'reload':
+            self.rebuild(fleet_index.select())
+            return
+        if not self._built:
+            return
+        with self._lock:
+            if kind == 'upsert':
+                doc = self._docs.get(payload['id'])
+                if doc is not None and all(
+                    doc['fields'][f] == (payload.get(f) or '').lower() for f in SEARCH_FIELDS
+                ):
+                    doc['vehicle'] = payload  # Only status/position changed
+                    return
+                self._remove(payload['id'])
+                self._add(payload)
+            elif kind == 'remove':
+                self._remove(payload)
+
+    def ensure_ready(self) -> None:
+        """Load the fleet index (which builds this index) on first use"""
+        fleet_index.ensure_loaded()
+        if not self._built:
+            self.rebuild(fleet_index.select())
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _candidates(self, query: str) -> Set[int]:
+        postings = self._postings
+        if len(query) <= MAX_GRAM:
+            return set(postings.get(query, ()))
+        sets = []
+        for gram in _grams(query, MAX_GRAM):
+            ids = postings.get(gram)
+            if not ids:
+                return set()
+            sets.append(ids)
+        sets.sort(key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            result &= ids
+            if not result:
+                break
+        return result
+
+    def search_ids(self, query: str, status: Optional[str] = None,
+                   vehicle_type: Optional[str] = None) -> Set[int]:
+        """
+        IDs of vehicles whose code, plate, brand or model contains query.
+
+        Args:
+            query: Search text (case-insensitive)
+            status, vehicle_type: Optional exact filters
+
+        Returns:
+            Set of vehicle IDs
+        """
+        query = query.strip().lower()
+        if not query:
+            return set()
+        self.ensure_ready()
+        with self._lock:
+            docs = self._docs
+            result = set()
+            for vehicle_id in self._candidates(query):
+                doc = docs[vehicle_id]
+                vehicle = doc['vehicle']
+                if status is not None and vehicle.get('status') != status:
+                    continue
+                if vehicle_type is not None and vehicle.get('vehicle_type') != vehicle_type:
+                    continue
+                if any(query in text for text in doc['fields'].values()):
+                    result.add(vehicle_id)
+            return result
+
+    def suggest(self, query: str, limit: int = 10, vehicle_type: Optional[str] = None) -> List[Dict]:
+        """
+        Ranked typeahead matches.
+
+        Ranking: exact field match, then prefix match, then substring;
+        ties broken by field priority (code, plate, brand, model) and
+        shorter field text.
+
+        Returns:
+            List of vehicle dicts with 'matched_field'
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        self.ensure_ready()
+
+        ranked = []
+        with self._lock:
+            docs = self._docs
+            for vehicle_id in self._candidates(query):
+                doc = docs[vehicle_id]
+                vehicle = doc['vehicle']
+                if vehicle_type and vehicle.get('vehicle_type') != vehicle_type:
+                    continue
+                best = None
+                for priority, field in enumerate(SEARCH_FIELDS):
+                    text = doc['fields'][field]
+                    pos = text.find(query)
+                    if pos < 0:
+                        continue
+                    kind = 0 if text == query else (1 if pos == 0 else 2)
+                    key = (kind, priority, len(text), vehicle_id)
+                    if best is None or key < best[0]:
+                        best = (key, field)
+                if best is not None:
+                    ranked.append((best[0], best[1], vehicle))
+
+        ranked.sort(key=lambda item: item[0])
+        return [dict(vehicle, matched_field=field) for _, field, vehicle in ranked[:limit]]
+
+
+# Shared per-process search index
+vehicle_search = VehicleSearchIndex()
+
+
+def init_vehicle_search(app) -> None:
+    """Keep the search index in sync with the fleet index (call from create_app)"""
+    if 'fleet_index' not in app.extensions:
+        return
+    if vehicle_search.on_fleet_change not in fleet_index._listeners:
+        fleet_index.add_listener(vehicle_search.on_fleet_change)
+    app.extensions['vehicle_search'] = vehicle_search
+
+
+def vehicle_search_enabled() -> bool:
+    from flask import current_app
+    return 'vehicle_search' in current_app.extensions
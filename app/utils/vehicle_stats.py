@@ -0,0 +1,139 @@
+"""
+Vehicle Stats - Materialized per-vehicle trip aggregates (trips, distance,
+revenue) maintained incrementally, with a full rebuild
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, Vehicle, Trip, VehicleStats
+
+
+def _apply(vehicle_id: int, values: Dict) -> None:
+    """
+    UPDATE the stats row of one vehicle inside the caller's transaction,
+    creating it first if it does not exist yet.
+
+    Increments are written as SQL expressions (col = col + x), so
+    concurrent writers never lose updates.
+    """
+    query = VehicleStats.query.filter(VehicleStats.vehicle_id == vehicle_id)
+    if query.update(values, synchronize_session=False):
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(VehicleStats(
+                vehicle_id=vehicle_id,
+                completed_trips=0,
+                total_distance_km=0.0,
+                total_revenue=0.0
+            ))
+    except IntegrityError:
+        pass  # Created concurrently by another writer
+    query.update(values, synchronize_session=False)
+
+
+def record_trip_completed(vehicle_id: int, distance_km: Optional[float], revenue: Optional[float],
+                          ended_at: Optional[datetime] = None) -> None:
+    """
+    Add one completed trip to the vehicle's stats.
+
+    Call before committing the trip so both land in the same transaction.
+    """
+    _apply(vehicle_id, {
+        VehicleStats.completed_trips: VehicleStats.completed_trips + 1,
+        VehicleStats.total_distance_km: VehicleStats.total_distance_km + (distance_km or 0),
+        VehicleStats.total_revenue: VehicleStats.total_revenue + (revenue or 0),
+        VehicleStats.last_trip_at: ended_at or datetime.now(),
+        VehicleStats.updated_at: datetime.utcnow()
+    })
+
+
+def get_vehicle_stats(vehicle_id: int) -> Dict:
+    """Stats of one vehicle (single primary-key read; zeros if none yet)"""
+    stats = db.session.get(VehicleStats, vehicle_id)
+    if stats is None:
+        return {
+            'completed_trips': 0,
+            'total_distance_km': 0.0,
+            'total_revenue': 0.0,
+            'last_trip_at': None
+        }
+    return {
+        'completed_trips': stats.completed_trips,
+        'total_distance_km': round(stats.total_distance_km or 0, 2),
+        'total_revenue': stats.total_revenue or 0,
+        'last_trip_at': stats.last_trip_at
+    }
+
+
+def rebuild_vehicle_stats(vehicle_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute stats from Trip (backfill / repair).
+
+    Args:
+        vehicle_ids: Only these vehicles (default: all)
+
+    Returns:
+        Number of stats rows written
+    """
+    ids = list(vehicle_ids) if vehicle_ids is not None else None
+
+    trips = db.session.query(
+        Trip.vehicle_id,
+        func.count(Trip.id),
+        func.sum(Trip.distance_km),
+        func.sum(Trip.total_cost),
+        func.max(Trip.end_time)
+    ).filter(Trip.status == 'completed')
+    if ids is not None:
+        trips = trips.filter(Trip.vehicle_id.in_(ids))
+    trip_rows = {row[0]: row[1:] for row in trips.group_by(Trip.vehicle_id).all()}
+
+    vehicles = db.session.query(Vehicle.id)
+    if ids is not None:
+        vehicles = vehicles.filter(Vehicle.id.in_(ids))
+    vehicle_ids_all = [row.id for row in vehicles.all()]
+
+    now = datetime.utcnow()
+    mappings = []
+    for vehicle_id in vehicle_ids_all:
+        count, distance, revenue, last_trip = trip_rows.get(vehicle_id, (0, 0, 0, None))
+        mappings.append({
+            'vehicle_id': vehicle_id,
+            'completed_trips': count or 0,
+            'total_distance_km': distance or 0.0,
+            'total_revenue': revenue or 0.0,
+            'last_trip_at': last_trip,
+            'updated_at': now
+        })
+
+    try:
+        stale = VehicleStats.query
+        if ids is not None:
+            stale = stale.filter(VehicleStats.vehicle_id.in_(ids))
+        stale.delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(VehicleStats, mappings)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    print(f'[VehicleStats] Rebuilt stats for {len(mappings)} vehicles')
+    return len(mappings)
+
+
+def register_cli(app) -> None:
+    """`flask rebuild-vehicle-stats` command"""
+    import click
+
+    @app.cli.command('rebuild-vehicle-stats')
+    @click.option('--vehicle-id', 'vehicle_ids', type=int, multiple=True,
+                  help='Only rebuild these vehicles (repeatable)')
+    def rebuild_vehicle_stats_command(vehicle_ids):
+        """Recompute materialized per-vehicle stats from trips"""
+        count = rebuild_vehicle_stats(vehicle_ids or None)
+        click.echo(f'Rebuilt stats for {count} vehicles')
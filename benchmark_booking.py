@@ -0,0 +1,143 @@
+"""
+Benchmark đặt xe đồng thời - kiểm tra không có double booking
+Chạy: python benchmark_booking.py [--threads 32] [--requests 2000] [--vehicles 20]
+
+Dùng một database SQLite tạm (không đụng tới database thật), tắt Firebase
+và các scheduler nền. Nhiều thread cùng bắn POST /vehicles/<id>/book vào
+một nhóm nhỏ xe "nóng"; sau khi chạy xong, mỗi xe phải có tối đa 1 chuyến
+đi 'pending'.
+"""
+import argparse
+import atexit
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Cấu hình môi trường trước khi import app
+_db_dir = tempfile.mkdtemp(prefix='smartrent_bench_')
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ['FIREBASE_ENABLED'] = 'false'
+os.environ['ENABLE_AUTO_RELEASE'] = 'false'
+os.environ['ENABLE_HAZARD_SCHEDULER'] = 'false'
+os.environ['ENABLE_TELEMETRY_ROLLUPS'] = 'false'
+os.environ['ENABLE_MAINTENANCE_PLANNER'] = 'false'
+
+from config import config  # noqa: E402
+
+# SQLite: chờ khóa thay vì lỗi "database is locked" ngay
+config['development'].SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30, 'check_same_thread': False}}
+
+from app import create_app  # noqa: E402
+from app.models import db, User, Vehicle, Trip  # noqa: E402
+
+
+def seed(app, users, vehicles):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for i in range(users):
+            user = User(
+                username=f'bench{i}',
+                email=f'bench{i}@smartrent.test',
+                full_name=f'Bench User {i}',
+                wallet_balance=10_000_000,
+                is_verified=True,
+                password_hash='!'  # Không đăng nhập bằng mật khẩu (hash thật quá chậm cho hàng nghìn user)
+            )
+            db.session.add(user)
+        for i in range(vehicles):
+            db.session.add(Vehicle(
+                vehicle_code=f'BENCH{i:04d}',
+                vehicle_type='motorbike',
+                brand='Honda',
+                model='Vision',
+                license_plate=f'59X-{i:05d}',
+                latitude=10.8231 + random.uniform(-0.01, 0.01),
+                longitude=106.6297 + random.uniform(-0.01, 0.01),
+                status='available',
+                price_per_minute=2000,
+                qr_code=f'QR-BENCH-{i:04d}'
+            ))
+        db.session.commit()
+        user_ids = [u.id for u in User.query.all()]
+        vehicle_ids = [v.id for v in Vehicle.query.all()]
+    return user_ids, vehicle_ids
+
+
+def run(args):
+    app = create_app('development')
+    user_ids, vehicle_ids = seed(app, args.requests, args.vehicles)
+
+    # Mỗi request là một user khác nhau đặt một xe ngẫu nhiên trong nhóm nóng
+    jobs = [(user_ids[i], random.choice(vehicle_ids)) for i in range(args.requests)]
+    jobs_lock = threading.Lock()
+    results = []
+    results_lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        client = app.test_client()
+        local = []
+        barrier.wait()
+        while True:
+            with jobs_lock:
+                if not jobs:
+                    break
+                user_id, vehicle_id = jobs.pop()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(user_id)
+                sess['_fresh'] = True
+            started = time.perf_counter()
+            response = client.post(f'/vehicles/{vehicle_id}/book')
+            local.append((response.status_code, time.perf_counter() - started))
+        with results_lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        pending_per_vehicle = dict(
+            db.session.query(Trip.vehicle_id, db.func.count(Trip.id))
+            .filter(Trip.status == 'pending')
+            .group_by(Trip.vehicle_id)
+            .all()
+        )
+        reserved = Vehicle.query.filter_by(status='reserved').count()
+
+    codes = {}
+    for code, _ in results:
+        codes[code] = codes.get(code, 0) + 1
+    latencies = sorted(latency for _, latency in results)
+    double_booked = {vid: n for vid, n in pending_per_vehicle.items() if n > 1}
+
+    print('=' * 60)
+    print(f'Requests:        {len(results)} ({args.threads} threads, {args.vehicles} vehicles)')
+    print(f'Elapsed:         {elapsed:.2f}s  ({len(results) / elapsed:.0f} req/s)')
+    print(f'Latency p50/p99: {statistics.median(latencies) * 1000:.1f} / '
+          f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms')
+    print(f'Status codes:    {dict(sorted(codes.items()))}')
+    print(f'Bookings:        {sum(pending_per_vehicle.values())} pending trips, {reserved} reserved vehicles')
+    print(f'Double bookings: {len(double_booked)}')
+    print('=' * 60)
+
+    return 1 if double_booked or codes.get(200, 0) != reserved else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Concurrent booking benchmark')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--vehicles', type=int, default=20)
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,143 @@
+"""
+Benchmark nhận telemetry theo lô - đo số record/giây trên một node
+Chạy: python benchmark_telemetry.py [--vehicles 2000] [--records 200000] [--batch 2000]
+
+Dùng một database SQLite tạm (không đụng tới database thật), tắt Firebase
+và các scheduler nền. Đo ba mức: chỉ validate, ingest_batch() trực tiếp
+và qua HTTP (POST /iot/api/telemetry); sau đó kiểm tra số dòng telemetry thô và
+trạng thái mới nhất của xe.
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Cấu hình môi trường trước khi import app
+_db_dir = tempfile.mkdtemp(prefix='smartrent_bench_')
+atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ['FIREBASE_ENABLED'] = 'false'
+os.environ['ENABLE_AUTO_RELEASE'] = 'false'
+os.environ['ENABLE_HAZARD_SCHEDULER'] = 'false'
+os.environ['ENABLE_TELEMETRY_ROLLUPS'] = 'false'
+os.environ['ENABLE_MAINTENANCE_PLANNER'] = 'false'
+# Mức pin/xăng ngẫu nhiên từng record: phát hiện bất thường chỉ tạo Maintenance giả
+os.environ['ANOMALY_DETECTION_ENABLED'] = 'false'
+os.environ['IOT_DEVICE_KEY'] = 'bench-device-key'
+os.environ['IOT_INGEST_MAX_BATCH'] = '100000'
+
+from app import create_app  # noqa: E402
+from app.models import db, Vehicle, VehicleTelemetryState  # noqa: E402
+from app.utils.telemetry_ingest import ingest_batch, parse_record  # noqa: E402
+from app.utils.telemetry_store import count_raw  # noqa: E402
+
+
+def seed(app, vehicles):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Vehicle.__table__.insert(), [{
+            'vehicle_code': f'TEL{i:05d}',
+            'vehicle_type': random.choice(['bike', 'motorbike', 'car']),
+            'brand': 'Bench',
+            'model': 'Telemetry',
+            'license_plate': f'59T-{i:05d}',
+            'latitude': 10.8231,
+            'longitude': 106.6297,
+            'status': 'available',
+            'price_per_minute': 2000,
+            'qr_code': f'QR-TEL-{i:05d}'
+        } for i in range(vehicles)])
+        db.session.commit()
+        return [vid for (vid,) in db.session.query(Vehicle.id).all()]
+
+
+def make_records(vehicle_ids, count, start):
+    records = []
+    for i in range(count):
+        records.append({
+            'vehicle_id': random.choice(vehicle_ids),
+            'timestamp': (start + timedelta(milliseconds=i)).isoformat() + 'Z',
+            'battery_level': round(random.uniform(5, 100), 1),
+            'fuel_level': round(random.uniform(5, 100), 1),
+            'tire_pressure': round(random.uniform(28, 36), 1),
+            'speed': round(random.uniform(0, 60), 1),
+            'latitude': 10.8231 + random.uniform(-0.05, 0.05),
+            'longitude': 106.6297 + random.uniform(-0.05, 0.05),
+            'engine_status': random.choice(['on', 'off']),
+            'temperature': round(random.uniform(25, 60), 1)
+        })
+    return records
+
+
+def rate(count, seconds):
+    return f'{count / seconds:,.0f} records/s' if seconds > 0 else 'n/a'
+
+
+def run(args):
+    app = create_app('development')
+    vehicle_ids = seed(app, args.vehicles)
+    start = datetime.utcnow() - timedelta(hours=1)
+    records = make_records(vehicle_ids, args.records, start)
+    batches = [records[i:i + args.batch] for i in range(0, len(records), args.batch)]
+
+    # 1. Validation only
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    for raw in records:
+        parse_record(raw, now)
+    parse_seconds = time.perf_counter() - started
+
+    # 2. ingest_batch() directly (validation + bulk writes + commit)
+    with app.app_context():
+        started = time.perf_counter()
+        accepted = 0
+        for batch in batches:
+            accepted += ingest_batch(batch)['accepted']
+        direct_seconds = time.perf_counter() - started
+
+    # 3. Over HTTP (JSON encode/decode + Flask), a second copy of the data
+    http_records = make_records(vehicle_ids, args.records, start + timedelta(minutes=10))
+    http_bodies = [json.dumps({'records': http_records[i:i + args.batch]})
+                   for i in range(0, len(http_records), args.batch)]
+    client = app.test_client()
+    started = time.perf_counter()
+    http_accepted = 0
+    statuses = {}
+    for body in http_bodies:
+        response = client.post('/iot/api/telemetry', data=body, content_type='application/json',
+                               headers={'X-Device-Key': os.environ['IOT_DEVICE_KEY']})
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if response.status_code == 200:
+            http_accepted += response.get_json()['accepted']
+    http_seconds = time.perf_counter() - started
+
+    with app.app_context():
+        stored = count_raw()
+        updated = db.session.query(db.func.count(VehicleTelemetryState.vehicle_id)).scalar()
+
+    expected = accepted + http_accepted
+    print('=' * 60)
+    print(f'Records:         {args.records} x 2 ({args.vehicles} vehicles, batch {args.batch})')
+    print(f'Validate only:   {rate(len(records), parse_seconds)}')
+    print(f'ingest_batch():  {rate(accepted, direct_seconds)}  ({accepted} accepted)')
+    print(f'HTTP endpoint:   {rate(http_accepted, http_seconds)}  ({http_accepted} accepted, status {statuses})')
+    print(f'Raw rows:        {stored} (expected {expected})')
+    print(f'Vehicles with latest state: {updated}')
+    print('=' * 60)
+
+    return 0 if stored == expected and accepted == len(records) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Telemetry ingestion benchmark')
+    parser.add_argument('--vehicles', type=int, default=2000)
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--batch', type=int, default=2000)
+    sys.exit(run(parser.parse_args()))
@@ -38,12 +38,40 @@ class Config:
     FIREBASE_ENABLED = os.environ.get('FIREBASE_ENABLED', 'true').lower() == 'true'
     FIREBASE_PROJECT_ID = os.environ.get('FIREBASE_PROJECT_ID', 'smartrent-6eadb')
     FIREBASE_CREDENTIALS_PATH = os.environ.get('FIREBASE_CREDENTIALS_PATH', 'smartrent-firebase-credentials.json')
+    # Snapshot-listener cache for available vehicles (reads served from memory)
+    FIRESTORE_CACHE_ENABLED = os.environ.get('FIRESTORE_CACHE_ENABLED', 'true').lower() == 'true'
+    FIRESTORE_CACHE_MAX_STALENESS_SECONDS = int(os.environ.get('FIRESTORE_CACHE_MAX_STALENESS_SECONDS', 300))
+    FIRESTORE_CACHE_RETRY_SECONDS = int(os.environ.get('FIRESTORE_CACHE_RETRY_SECONDS', 30))
     
     # MQTT Broker (for IoT devices)
     MQTT_BROKER_URL = os.environ.get('MQTT_BROKER_URL', 'localhost')
     MQTT_BROKER_PORT = int(os.environ.get('MQTT_BROKER_PORT', 1883))
     MQTT_USERNAME = os.environ.get('MQTT_USERNAME', '')
     MQTT_PASSWORD = os.environ.get('MQTT_PASSWORD', '')
+    MQTT_CLIENT_ID = os.environ.get('MQTT_CLIENT_ID', 'smartrent-telemetry-worker')
+    MQTT_BATCH_SIZE = int(os.environ.get('MQTT_BATCH_SIZE', 2000))  # Records per flush (mqtt_worker.py)
+    MQTT_FLUSH_INTERVAL_SECONDS = float(os.environ.get('MQTT_FLUSH_INTERVAL_SECONDS', 0.5))
+    MQTT_MAX_BUFFER = int(os.environ.get('MQTT_MAX_BUFFER', 20000))  # Messages buffered before backpressure
+    
+    # Telemetry ingestion (POST /iot/api/telemetry, header X-Device-Key)
+    IOT_DEVICE_KEY = os.environ.get('IOT_DEVICE_KEY', '')
+    IOT_INGEST_MAX_BATCH = int(os.environ.get('IOT_INGEST_MAX_BATCH', 5000))
+    IOT_TELEMETRY_STALE_SECONDS = int(os.environ.get('IOT_TELEMETRY_STALE_SECONDS', 300))  # Vehicles silent longer are shown offline
+    
+    # Telemetry storage: daily raw partitions, 1m/1h rollups per vehicle (scheduler)
+    ENABLE_TELEMETRY_ROLLUPS = os.environ.get('ENABLE_TELEMETRY_ROLLUPS', 'true').lower() == 'true'
+    IOT_RAW_RETENTION_DAYS = int(os.environ.get('IOT_RAW_RETENTION_DAYS', 7))
+    IOT_ROLLUP_1M_RETENTION_DAYS = int(os.environ.get('IOT_ROLLUP_1M_RETENTION_DAYS', 90))
+    IOT_ROLLUP_1H_RETENTION_DAYS = int(os.environ.get('IOT_ROLLUP_1H_RETENTION_DAYS', 0))  # 0 = keep forever
+    IOT_ROLLUP_LATE_SECONDS = 120  # Minute buckets are rolled up once this old
+    
+    # Columnar archive of closed days (raw telemetry + completed trips) for analytics
+    ENABLE_ARCHIVE_EXPORT = os.environ.get('ENABLE_ARCHIVE_EXPORT', 'false').lower() == 'true'
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    ARCHIVE_COMPRESSION_LEVEL = int(os.environ.get('ARCHIVE_COMPRESSION_LEVEL', 0))  # zlib level, 0 = memory-mappable
+    ARCHIVE_CLOSE_DELAY_HOURS = 2  # A day is exported once it ended this long ago
+    ARCHIVE_MAX_DAYS_PER_RUN = 7
+    ARCHIVE_CHECK_SECONDS = 600
     
     # Email config (for notifications)
     MAIL_SERVER = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
@@ -54,11 +82,58 @@ class Config:
     
     # Geofencing
     DEFAULT_GEOFENCE_RADIUS = 50  # km
+    GEOFENCE_CACHE_TTL_SECONDS = 60  # Per-process fence cache used during telemetry ingestion
+    GEOFENCE_DEBOUNCE_SAMPLES = 3  # Consecutive samples needed to enter/leave a violation
+    GEOFENCE_HYSTERESIS = 0.05  # Leaving a violation needs radius x (1 - hysteresis)
+    GEOFENCE_ALERT_COOLDOWN_SECONDS = 900  # At most one geofence alert per vehicle per period
+    
+    # Online anomaly detection on ingested telemetry (per-vehicle EWMA statistics in memory)
+    ANOMALY_DETECTION_ENABLED = os.environ.get('ANOMALY_DETECTION_ENABLED', 'true').lower() == 'true'
+    ANOMALY_EWMA_ALPHA = 0.1
+    ANOMALY_Z_THRESHOLD = 4.0  # Standard deviations from the rolling mean
+    ANOMALY_WARMUP_SAMPLES = 10  # Samples per vehicle before statistical checks start
+    ANOMALY_MIN_DRAIN_PER_MINUTE = 1.0  # Battery %/minute
+    ANOMALY_DRAIN_WINDOW_SECONDS = 300  # Drain rate measured over at least this long...
+    ANOMALY_MIN_DRAIN_STEP = 5.0  # ...or a drop of at least this many % (levels are quantized)
+    ANOMALY_MAX_TEMPERATURE = 90.0  # °C (EWMA)
+    ANOMALY_MIN_PRESSURE_DROP = 5.0  # Tire pressure units below the rolling mean
+    ANOMALY_MAX_SPEED_KMH = 250.0  # Faster implied movement between samples = GPS jump
+    ANOMALY_MAX_GAP_SECONDS = 600  # Longer silences reset the drain baseline
+    ANOMALY_COOLDOWN_SECONDS = 1800  # Per vehicle and anomaly kind
     
     # Auto-release expired bookings
     ENABLE_AUTO_RELEASE = os.environ.get('ENABLE_AUTO_RELEASE', 'true').lower() == 'true'
     AUTO_RELEASE_TIMEOUT_MINUTES = int(os.environ.get('AUTO_RELEASE_TIMEOUT_MINUTES', 5))
     
+    # Hazard zones: scheduled activation/expiry + in-memory index
+    ENABLE_HAZARD_SCHEDULER = os.environ.get('ENABLE_HAZARD_SCHEDULER', 'true').lower() == 'true'
+    HAZARD_INDEX_TTL_SECONDS = int(os.environ.get('HAZARD_INDEX_TTL_SECONDS', 60))
+    HAZARD_INDEX_CELL_DEG = 0.01  # ~1.1 km grid cells
+    HAZARD_BATCH_MAX_ROUTES = int(os.environ.get('HAZARD_BATCH_MAX_ROUTES', 200))
+    HAZARD_RASTER_CELL_DEG = 0.002  # ~220 m coverage raster cells
+    
+    # Nightly odometer-driven maintenance planning (scheduler, or `flask plan-maintenance`)
+    ENABLE_MAINTENANCE_PLANNER = os.environ.get('ENABLE_MAINTENANCE_PLANNER', 'true').lower() == 'true'
+    MAINTENANCE_PLANNER_HOUR = int(os.environ.get('MAINTENANCE_PLANNER_HOUR', 2))  # Local time
+    MAINTENANCE_LOOKBACK_DAYS = 30  # Average daily distance over this window
+    MAINTENANCE_MAX_INTERVAL_DAYS = 180  # Service at least this often, whatever the distance
+    MAINTENANCE_PLAN_HORIZON_DAYS = 7  # Schedule vehicles due within this many days
+    MAINTENANCE_PULL_DAYS = 1  # Take available vehicles due this soon out of service
+    
+    # Live fleet index (in-memory vehicle positions/status, per process)
+    FLEET_INDEX_ENABLED = os.environ.get('FLEET_INDEX_ENABLED', 'true').lower() == 'true'
+    FLEET_INDEX_RESYNC_SECONDS = int(os.environ.get('FLEET_INDEX_RESYNC_SECONDS', 30))
+    FLEET_INDEX_CELL_DEG = 0.01  # ~1.1 km grid cells
+    NEARBY_MAX_LIMIT = 200  # Max k for /vehicles/api/nearby?limit=
+    FLEET_STREAM_HEARTBEAT_SECONDS = 15  # SSE keep-alive for /vehicles/api/stream
+    FLEET_STREAM_MAX_QUEUE = 500  # Pending events per SSE client before a resync
+    
+    # Battery/fuel range estimates for nearby search (?trip_distance_km=)
+    RANGE_SAFETY_FACTOR = 1.2  # Required range = trip distance x factor
+    RANGE_DETOUR_FACTOR = 1.3  # Road distance / straight line when only a destination is given
+    RANGE_MODEL_REFIT_SECONDS = 3600  # Refit km-per-% from IoT logs
+    RANGE_MODEL_LOOKBACK_DAYS = 30
+    
     # Vehicle pricing (VND per minute)
     BIKE_PRICE_PER_MINUTE = 500
     MOTORBIKE_PRICE_PER_MINUTE = 2000
@@ -0,0 +1,48 @@
+"""
+MQTT telemetry worker - tiến trình riêng nhận telemetry từ broker MQTT
+Chạy: python mqtt_worker.py
+
+Subscribe smartrent/vehicle/<vehicle_code>/telemetry (QoS 1), gom message
+thành micro-batch và ghi vào iot_logs / vehicles qua telemetry_ingest.
+Dùng MQTT_BROKER_URL, MQTT_BROKER_PORT, MQTT_USERNAME, MQTT_PASSWORD.
+"""
+import os
+import signal
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Worker không cần scheduler nền của web app
+os.environ.setdefault('ENABLE_AUTO_RELEASE', 'false')
+os.environ.setdefault('ENABLE_HAZARD_SCHEDULER', 'false')
+os.environ.setdefault('ENABLE_TELEMETRY_ROLLUPS', 'false')
+os.environ.setdefault('ENABLE_MAINTENANCE_PLANNER', 'false')
+
+from app import create_app  # noqa: E402
+from app.utils.mqtt_telemetry import MQTTTelemetryWorker  # noqa: E402
+
+
+def main():
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    worker = MQTTTelemetryWorker(app)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    worker.start()
+    print(f"[MQTT] Worker running ({app.config['MQTT_BROKER_URL']}:{app.config['MQTT_BROKER_PORT']}), Ctrl+C to stop")
+    stats_interval = app.config.get('MQTT_STATS_INTERVAL_SECONDS', 60)
+    last_stats = time.monotonic()
+    while not stop.wait(1):
+        if time.monotonic() - last_stats >= stats_interval:
+            print(f'[MQTT] {worker.batcher.stats()}')
+            last_stats = time.monotonic()
+    worker.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""
+Load generator telemetry - tạo (hoặc phát lại từ file) luồng telemetry của
+N xe chạy quanh TP.HCM và đẩy qua đường nhận telemetry với tốc độ cấu hình
+Chạy: python telemetry_loadgen.py [--vehicles 500] [--records 100000] [--rate 0]
+                                  [--target http|direct|mqtt] [--batch 500]
+                                  [--replay file.jsonl] [--record file.jsonl]
+                                  [--url http://host:5000 --device-key ...]
+                                  [--database-url postgresql://... --reset]
+
+Mặc định dùng một database SQLite tạm (không đụng tới database thật, xóa khi
+thoát), tắt Firebase và các scheduler nền. --database-url chạy trên database
+khác (vd. PostgreSQL để đo như production); database đó bị xóa sạch (kể cả
+các partition iot_logs_pYYYYMMDD) và seed lại, nên chỉ dùng database nháp và
+phải xác nhận bằng --reset nếu database đã có xe. Xe xuất phát quanh tâm 10.8231, 106.6297 như
+init_data.py, chạy ngẫu nhiên trong bán kính ~9 km (geofence 10 km như dữ liệu
+mẫu), mỗi xe gửi một mẫu mỗi --interval giây (thời gian mô phỏng).
+
+Target:
+    http   - POST /iot/api/telemetry (Flask test client, hoặc server thật với --url)
+    direct - ingest_batch() trực tiếp
+    mqtt   - MQTTTelemetryWorker với client loopback trong tiến trình (mỗi
+             message một mẫu, độ trễ = publish -> ack sau commit)
+
+Báo cáo: throughput duy trì, độ trễ ingest p50/p99 (mỗi request/batch, với
+mqtt là mỗi message) và write amplification của database (số dòng ghi /
+record, byte database / byte payload JSON).
+"""
+import argparse
+import atexit
+import itertools
+import json
+import math
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+# Cấu hình môi trường trước khi import app (config đọc DATABASE_URL lúc import)
+_pre_parser = argparse.ArgumentParser(add_help=False)
+_pre_parser.add_argument('--database-url')
+_database_url = _pre_parser.parse_known_args()[0].database_url
+if _database_url:
+    _db_path = None
+    os.environ['DATABASE_URL'] = _database_url
+else:
+    _db_dir = tempfile.mkdtemp(prefix='smartrent_loadgen_')
+    atexit.register(shutil.rmtree, _db_dir, ignore_errors=True)
+    _db_path = os.path.join(_db_dir, 'loadgen.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+os.environ['FIREBASE_ENABLED'] = 'false'
+os.environ['ENABLE_AUTO_RELEASE'] = 'false'
+os.environ['ENABLE_HAZARD_SCHEDULER'] = 'false'
+os.environ['ENABLE_TELEMETRY_ROLLUPS'] = 'false'
+os.environ['ENABLE_ARCHIVE_EXPORT'] = 'false'
+os.environ['ENABLE_MAINTENANCE_PLANNER'] = 'false'
+os.environ['IOT_DEVICE_KEY'] = 'loadgen-device-key'
+os.environ['IOT_INGEST_MAX_BATCH'] = '100000'
+
+from sqlalchemy import event, inspect  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.models import db, Vehicle  # noqa: E402
+from app.utils.telemetry_ingest import ingest_batch  # noqa: E402
+from app.utils.telemetry_store import count_raw, forget_created_partitions, raw_tables  # noqa: E402
+
+# Tâm và bán kính như init_data.py
+CENTER_LAT = 10.8231
+CENTER_LNG = 106.6297
+ROAM_RADIUS_KM = 9.0
+KM_PER_DEG_LAT = 111.32
+
+
+# ----------------------------------------------------------------------
+# Nguồn dữ liệu
+# ----------------------------------------------------------------------
+
+class SimulatedVehicle:
+    """Xe chạy ngẫu nhiên: đổi hướng dần, quay về tâm khi ra xa, dừng đèn đỏ"""
+
+    def __init__(self, vehicle_id, rng):
+        self.vehicle_id = vehicle_id
+        self.rng = rng
+        distance = rng.uniform(0, ROAM_RADIUS_KM * 0.7)
+        angle = rng.uniform(0, 2 * math.pi)
+        self.lat = CENTER_LAT + distance * math.cos(angle) / KM_PER_DEG_LAT
+        self.lng = CENTER_LNG + distance * math.sin(angle) / (KM_PER_DEG_LAT * math.cos(math.radians(CENTER_LAT)))
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.speed = rng.uniform(0, 40)
+        self.battery = rng.uniform(40, 100)
+        self.fuel = rng.uniform(40, 100)
+        self.tire = rng.uniform(30, 34)
+        self.temperature = rng.uniform(28, 35)
+
+    def step(self, seconds):
+        rng = self.rng
+        self.speed = min(60.0, max(0.0, self.speed + rng.gauss(0, 5)))
+        if rng.random() < 0.05:
+            self.speed = 0.0  # Đèn đỏ / kẹt xe
+        self.heading += rng.gauss(0, 0.3)
+
+        d_lat_km = (self.lat - CENTER_LAT) * KM_PER_DEG_LAT
+        d_lng_km = (self.lng - CENTER_LNG) * KM_PER_DEG_LAT * math.cos(math.radians(CENTER_LAT))
+        if math.hypot(d_lat_km, d_lng_km) > ROAM_RADIUS_KM:
+            self.heading = math.atan2(-d_lng_km, -d_lat_km)
+
+        km = self.speed * seconds / 3600
+        self.lat += km * math.cos(self.heading) / KM_PER_DEG_LAT
+        self.lng += km * math.sin(self.heading) / (KM_PER_DEG_LAT * math.cos(math.radians(self.lat)))
+        self.battery = max(5.0, self.battery - km * 0.4)
+        self.fuel = max(5.0, self.fuel - km * 0.2)
+        self.temperature = min(60.0, max(25.0, self.temperature + rng.gauss(0, 0.2) + self.speed * 0.001))
+
+    def record(self, timestamp):
+        return {
+            'vehicle_id': self.vehicle_id,
+            'timestamp': timestamp.isoformat() + 'Z',
+            'battery_level': round(self.battery, 1),
+            'fuel_level': round(self.fuel, 1),
+            'tire_pressure': round(self.tire + self.rng.uniform(-0.2, 0.2), 1),
+            'speed': round(self.speed, 1),
+            'latitude': round(self.lat, 6),
+            'longitude': round(self.lng, 6),
+            'engine_status': 'on' if self.speed > 0 else self.rng.choice(['on', 'off']),
+            'temperature': round(self.temperature, 1)
+        }
+
+
+def synthesize(vehicle_ids, count, interval, seed):
+    """`count` mẫu theo thứ tự thời gian; mỗi tick mọi xe gửi một mẫu"""
+    rng = random.Random(seed)
+    vehicles = [SimulatedVehicle(vid, rng) for vid in vehicle_ids]
+    ticks = math.ceil(count / len(vehicles))
+    # Kết thúc ở hiện tại: timestamp tương lai bị từ chối
+    start = datetime.utcnow() - timedelta(seconds=ticks * interval + 60)
+    produced = 0
+    for tick in range(ticks):
+        timestamp = start + timedelta(seconds=tick * interval)
+        for vehicle in vehicles:
+            if produced >= count:
+                return
+            vehicle.step(interval)
+            yield vehicle.record(timestamp + timedelta(milliseconds=rng.randint(0, 999)))
+            produced += 1
+
+
+def replay(path, vehicle_ids, count):
+    """
+    Record từ file JSON Lines (một record mỗi dòng, hoặc một mảng record
+    mỗi dòng). vehicle_id trong file được ánh xạ lần lượt sang xe đã tạo;
+    timestamp được dời để bản ghi cuối cùng rơi vào hiện tại, giữ nguyên
+    khoảng cách giữa các mẫu.
+    """
+    records = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                records.extend(item if isinstance(item, list) else [item])
+    if count:
+        records = records[:count]
+
+    def parse(value):
+        return datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+
+    stamps = [parse(r['timestamp']) for r in records if isinstance(r.get('timestamp'), str)]
+    shift = datetime.utcnow() - timedelta(seconds=60) - max(stamps) if stamps else timedelta(0)
+    mapping = {}
+    for record in records:
+        source = record.get('vehicle_id')
+        if source not in mapping:
+            mapping[source] = vehicle_ids[len(mapping) % len(vehicle_ids)]
+        record = dict(record, vehicle_id=mapping[source])
+        if isinstance(record.get('timestamp'), str):
+            record['timestamp'] = (parse(record['timestamp']) + shift).isoformat() + 'Z'
+        yield record
+
+
+def batched(records, size):
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+# ----------------------------------------------------------------------
+# Đo đạc
+# ----------------------------------------------------------------------
+
+class WriteCounter:
+    """Số câu lệnh và số dòng INSERT/UPDATE/DELETE mà engine thực thi"""
+
+    def __init__(self, engine):
+        self.statements = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+        if verb in ('INSERT', 'UPDATE', 'DELETE'):
+            with self._lock:
+                self.statements += 1
+                self.rows += max(cursor.rowcount, 0)
+
+
+class Pacer:
+    """Giữ tốc độ gửi trung bình `rate` record/giây (0 = không giới hạn)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.started = time.perf_counter()
+        self.sent = 0
+
+    def wait(self, count):
+        if self.rate > 0:
+            delay = self.started + self.sent / self.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.sent += count
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[max(0, math.ceil(len(sorted_values) * fraction) - 1)]
+
+
+# ----------------------------------------------------------------------
+# Target
+# ----------------------------------------------------------------------
+
+def run_direct(app, batches, pacer, latencies):
+    accepted = 0
+    with app.app_context():
+        for batch in batches:
+            pacer.wait(len(batch))
+            started = time.perf_counter()
+            accepted += ingest_batch(batch)['accepted']
+            latencies.append(time.perf_counter() - started)
+    return accepted
+
+
+def run_http(app, batches, pacer, latencies, url=None, device_key=None):
+    client = app.test_client() if url is None else None
+    key = device_key or os.environ['IOT_DEVICE_KEY']
+    accepted = 0
+    statuses = {}
+    for batch in batches:
+        body = json.dumps({'records': batch}).encode('utf-8')
+        pacer.wait(len(batch))
+        started = time.perf_counter()
+        if client is not None:
+            response = client.post('/iot/api/telemetry', data=body, content_type='application/json',
+                                   headers={'X-Device-Key': key})
+            status, result = response.status_code, response.get_json()
+        else:
+            request = urllib.request.Request(url.rstrip('/') + '/iot/api/telemetry', data=body, method='POST',
+                                             headers={'Content-Type': 'application/json', 'X-Device-Key': key})
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    status, result = response.status, json.loads(response.read())
+            except urllib.error.HTTPError as e:
+                status, result = e.code, None
+        latencies.append(time.perf_counter() - started)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            accepted += result['accepted']
+    if set(statuses) != {200}:
+        print(f'HTTP status codes: {statuses}')
+    return accepted
+
+
+class LoopbackClient:
+    """
+    Client MQTT trong tiến trình (interface paho mà MQTTTelemetryWorker cần):
+    publish() giao message thẳng vào on_message, ack() ghi nhận độ trễ.
+    """
+
+    class Message:
+        __slots__ = ('topic', 'payload', 'mid', 'qos')
+
+        def __init__(self, topic, payload, mid):
+            self.topic, self.payload, self.mid, self.qos = topic, payload, mid, 1
+
+    def __init__(self, latencies):
+        self.on_connect = None
+        self.on_message = None
+        self.latencies = latencies
+        self._published = {}
+        self._mid = 0
+        self._lock = threading.Lock()
+        self.acked = threading.Semaphore(0)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+            self._published[mid] = time.perf_counter()
+        self.on_message(self, None, self.Message(topic, payload, mid))
+
+    def ack(self, mid, qos):
+        with self._lock:
+            started = self._published.pop(mid)
+        self.latencies.append(time.perf_counter() - started)
+        self.acked.release()
+
+
+def run_mqtt(app, batches, pacer, latencies, codes):
+    from app.utils.mqtt_telemetry import MQTTTelemetryWorker, TOPIC_PREFIX, TOPIC_SUFFIX
+
+    client = LoopbackClient(latencies)
+    worker = MQTTTelemetryWorker(app, client=client)
+    worker.start(connect=False)
+    published = 0
+    for batch in batches:
+        pacer.wait(len(batch))
+        for record in batch:
+            topic = f'{TOPIC_PREFIX}{codes[record["vehicle_id"]]}{TOPIC_SUFFIX}'
+            payload = {k: v for k, v in record.items() if k != 'vehicle_id'}
+            client.publish(topic, json.dumps(payload).encode('utf-8'))
+            published += 1
+    for _ in range(published):
+        client.acked.acquire()
+    worker.stop()
+    return worker.batcher.written
+
+
+# ----------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------
+
+def has_vehicles(app):
+    with app.app_context():
+        if not inspect(db.engine).has_table(Vehicle.__tablename__):
+            return False
+        return db.session.query(Vehicle.id).first() is not None
+
+
+def seed(app, vehicles):
+    with app.app_context():
+        # Partition iot_logs_pYYYYMMDD nằm ngoài db.metadata: drop_all() không xóa
+        for day, table in raw_tables():
+            if day is not None:
+                table.drop(db.session.connection(), checkfirst=True)
+        db.session.commit()
+        forget_created_partitions()
+        db.drop_all()
+        db.create_all()
+        db.session.execute(Vehicle.__table__.insert(), [{
+            'vehicle_code': f'LOAD{i:05d}',
+            'vehicle_type': random.choice(['bike', 'motorbike', 'car']),
+            'brand': 'Loadgen',
+            'model': 'Telemetry',
+            'license_plate': f'59L-{i:05d}',
+            'latitude': CENTER_LAT,
+            'longitude': CENTER_LNG,
+            'address': 'TP. Hồ Chí Minh',
+            'status': 'available',
+            'price_per_minute': 2000,
+            'qr_code': f'QR-LOAD-{i:05d}',
+            'geofence_enabled': True,
+            'geofence_center_lat': CENTER_LAT,
+            'geofence_center_lng': CENTER_LNG,
+            'geofence_radius': 10
+        } for i in range(vehicles)])
+        db.session.commit()
+        return dict(db.session.query(Vehicle.id, Vehicle.vehicle_code).order_by(Vehicle.id).all())
+
+
+def run(args):
+    if args.url and args.target != 'http':
+        print('--url chỉ dùng với --target http')
+        return 2
+
+    app = create_app('development')
+    if _database_url and not args.url and not args.reset and has_vehicles(app):
+        print(f'{_database_url} đã có dữ liệu xe; loadgen sẽ xóa sạch database này. '
+              f'Thêm --reset để xác nhận (chỉ dùng database nháp).')
+        return 2
+    if args.url:
+        codes = {i: None for i in range(1, args.vehicles + 1)}  # Xe 1..N phải tồn tại trên server
+    else:
+        codes = seed(app, args.vehicles)
+    vehicle_ids = list(codes)
+
+    if args.replay:
+        records = list(replay(args.replay, vehicle_ids, args.records))
+    else:
+        records = list(synthesize(vehicle_ids, args.records, args.interval, args.seed))
+    if args.record:
+        with open(args.record, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+    payload_bytes = sum(len(json.dumps(record)) for record in records)
+
+    counter = None
+    db_bytes_before = 0
+    if not args.url:
+        with app.app_context():
+            counter = WriteCounter(db.engine)
+        if _db_path:
+            db_bytes_before = os.path.getsize(_db_path)
+
+    latencies = []
+    pacer = Pacer(args.rate)
+    batches = batched(records, args.batch)
+    started = time.perf_counter()
+    if args.target == 'direct':
+        accepted = run_direct(app, batches, pacer, latencies)
+    elif args.target == 'mqtt':
+        accepted = run_mqtt(app, batches, pacer, latencies, codes)
+    else:
+        accepted = run_http(app, batches, pacer, latencies, args.url, args.device_key)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    unit = 'message' if args.target == 'mqtt' else 'batch'
+    print('=' * 60)
+    print(f'Source:          {"replay " + args.replay if args.replay else "synthetic"} '
+          f'({len(records)} records, {len(vehicle_ids)} vehicles)')
+    print(f'Target:          {args.target}{" " + args.url if args.url else ""} '
+          f'(batch {args.batch}, rate {args.rate or "unlimited"} records/s)')
+    print(f'Accepted:        {accepted}')
+    print(f'Throughput:      {accepted / elapsed:,.0f} records/s sustained over {elapsed:.2f}s')
+    if latencies:
+        print(f'Latency p50/p99: {statistics.median(latencies) * 1000:.1f} / '
+              f'{percentile(latencies, 0.99) * 1000:.1f} ms per {unit}')
+    if counter is not None and accepted:
+        with app.app_context():
+            stored = count_raw()
+        print(f'Raw rows:        {stored}')
+        print(f'DB writes:       {counter.rows} rows in {counter.statements} statements '
+              f'({counter.rows / accepted:.2f} rows/record)')
+        if _db_path:
+            db_bytes = os.path.getsize(_db_path) - db_bytes_before
+            print(f'DB growth:       {db_bytes:,} bytes ({db_bytes / payload_bytes:.2f} x JSON payload of '
+                  f'{payload_bytes:,} bytes)')
+    print('=' * 60)
+
+    return 0 if accepted == len(records) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Telemetry load generator / ingestion benchmark')
+    parser.add_argument('--vehicles', type=int, default=500)
+    parser.add_argument('--records', type=int, default=100000, help='Records to send (replay: max, 0 = whole file)')
+    parser.add_argument('--interval', type=float, default=5.0, help='Simulated seconds between samples of a vehicle')
+    parser.add_argument('--rate', type=float, default=0, help='Records per second (0 = as fast as possible)')
+    parser.add_argument('--batch', type=int, default=500, help='Records per request / ingest_batch() call')
+    parser.add_argument('--target', choices=['http', 'direct', 'mqtt'], default='http')
+    parser.add_argument('--replay', help='JSON Lines file of recorded telemetry to replay')
+    parser.add_argument('--record', help='Also write the generated stream to this JSON Lines file')
+    parser.add_argument('--url', help='Send to a running server instead of an in-process app')
+    parser.add_argument('--device-key', help='X-Device-Key for --url')
+    parser.add_argument('--database-url', help='Use this (scratch!) database instead of a temporary SQLite '
+                                               'file; it is dropped and re-seeded')
+    parser.add_argument('--reset', action='store_true',
+                        help='Confirm dropping a --database-url database that already has vehicles')
+    parser.add_argument('--seed', type=int, default=42)
+    sys.exit(run(parser.parse_args()))
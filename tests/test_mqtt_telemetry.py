@@ -0,0 +1,240 @@
+"""
+MQTT telemetry worker tests with an in-memory broker client and store
+(no broker, database or app context needed)
+"""
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from app.utils import mqtt_telemetry
+from app.utils.mqtt_telemetry import MQTTTelemetryWorker, TelemetryBatcher
+
+TOPIC = 'smartrent/vehicle/{}/telemetry'
+VEHICLE_IDS = {'BIKE001': 1, 'BIKE002': 2}
+
+
+class FakeClient:
+    """paho Client stand-in: deliver() plays the broker, acks are recorded"""
+
+    def __init__(self):
+        self.on_connect = None
+        self.on_message = None
+        self.looping = False
+        self.connected = False
+        self.subscriptions = []
+        self.acks = []
+        self.acks_after_loop_stop = []
+        self._lock = threading.Lock()
+
+    def connect(self, host, port, keepalive=60):
+        self.connected = True
+        self.on_connect(self, None, {}, 0)
+
+    def subscribe(self, topic, qos=0):
+        self.subscriptions.append((topic, qos))
+
+    def loop_start(self):
+        self.looping = True
+
+    def loop_stop(self):
+        self.looping = False
+
+    def disconnect(self):
+        self.connected = False
+
+    def deliver(self, topic, payload, mid):
+        message = SimpleNamespace(topic=topic, payload=payload, mid=mid, qos=1)
+        self.on_message(self, None, message)
+
+    def ack(self, mid, qos):
+        with self._lock:
+            self.acks.append(mid)
+            if not self.looping:
+                self.acks_after_loop_stop.append(mid)
+
+
+class FakeStore:
+    """
+    ingest() stand-in with the idempotency of ingest_batch: a sample is
+    keyed by (vehicle_id, timestamp) and inserted at most once. `fail`
+    makes the next calls raise before anything is committed.
+    """
+
+    def __init__(self, fail=0, delay=0.0):
+        self.rows = {}
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self.commits = []  # Number of acks seen when each batch committed
+        self.client = None
+
+    def ingest(self, records):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError('database unavailable')
+        accepted = 0
+        for record in records:
+            key = (record['vehicle_id'], record['timestamp'])
+            if key not in self.rows:
+                self.rows[key] = record
+                accepted += 1
+        self.commits.append(len(self.client.acks) if self.client else 0)
+        return {'accepted': accepted, 'rejected': 0}
+
+
+def payload(second, battery=80):
+    return json.dumps({
+        'timestamp': f'2026-01-01T00:00:{second:02d}Z',
+        'latitude': 10.8231,
+        'longitude': 106.6297,
+        'battery_level': battery
+    }).encode('utf-8')
+
+
+def make_batcher(store, client, **kwargs):
+    kwargs.setdefault('flush_interval', 0.01)
+    return TelemetryBatcher(
+        ingest=store.ingest,
+        resolve_vehicle=VEHICLE_IDS.get,
+        ack=lambda token: client.ack(*token),
+        **kwargs
+    )
+
+
+def make_worker(store, client):
+    app = SimpleNamespace(config={'MQTT_FLUSH_INTERVAL_SECONDS': 0.01})
+    worker = MQTTTelemetryWorker(app, client=client)
+    worker.batcher.ingest = store.ingest
+    worker.batcher.resolve_vehicle = VEHICLE_IDS.get
+    store.client = client
+    return worker
+
+
+def test_acks_only_after_commit():
+    client, store = FakeClient(), FakeStore()
+    store.client = client
+    batcher = make_batcher(store, client)
+    for mid in range(1, 4):
+        batcher.submit(TOPIC.format('BIKE001'), payload(mid), (mid, 1))
+
+    assert client.acks == []
+    assert batcher.flush_once(timeout=0) == 3
+    assert store.commits == [0]  # Nothing was acknowledged before the commit
+    assert client.acks == [1, 2, 3]
+    assert batcher.written == 3
+
+
+def test_invalid_messages_are_acknowledged_but_not_written():
+    client, store = FakeClient(), FakeStore()
+    batcher = make_batcher(store, client)
+    batcher.submit(TOPIC.format('UNKNOWN'), payload(1), (1, 1))
+    batcher.submit(TOPIC.format('BIKE001'), b'not json', (2, 1))
+
+    assert batcher.flush_once(timeout=0) == 2
+    assert store.calls == 0
+    assert batcher.invalid_messages == 2
+    assert client.acks == [1, 2]
+
+
+def test_failed_flush_is_retried_with_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(mqtt_telemetry.time, 'sleep', sleeps.append)
+    client, store = FakeClient(), FakeStore(fail=5)
+    store.client = client
+    batcher = make_batcher(store, client, max_backoff=4.0)
+    batcher.submit(TOPIC.format('BIKE001'), payload(1), (1, 1))
+
+    assert batcher.flush_once(timeout=0) == 1
+    assert sleeps == [0.5, 1.0, 2.0, 4.0, 4.0]
+    assert store.calls == 6
+    assert store.commits == [0]
+    assert client.acks == [1]
+    assert batcher.failed_flushes == 5
+
+
+def test_failed_flush_is_not_acknowledged_on_shutdown():
+    client, store = FakeClient(), FakeStore(fail=100)
+    batcher = make_batcher(store, client)
+    batcher.submit(TOPIC.format('BIKE001'), payload(1), (1, 1))
+    stop = threading.Event()
+    stop.set()
+
+    assert batcher.flush_once(timeout=0, stop=stop) == 0
+    assert client.acks == []
+    assert store.rows == {}
+
+
+def test_full_buffer_blocks_the_network_thread():
+    client, store = FakeClient(), FakeStore()
+    batcher = make_batcher(store, client, max_buffer=2, batch_size=10)
+    batcher.submit(TOPIC.format('BIKE001'), payload(1), (1, 1))
+    batcher.submit(TOPIC.format('BIKE001'), payload(2), (2, 1))
+
+    producer = threading.Thread(target=batcher.submit, args=(TOPIC.format('BIKE001'), payload(3), (3, 1)))
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()  # Blocked: the client stops reading its socket
+    assert batcher.pending() == 2
+
+    assert batcher.flush_once(timeout=0) == 2
+    producer.join(1)
+    assert not producer.is_alive()
+    assert batcher.pending() == 1
+    assert batcher.blocked_seconds > 0
+    assert batcher.flush_once(timeout=0) == 1
+    assert client.acks == [1, 2, 3]
+
+
+def test_redelivered_messages_are_written_once():
+    client, store = FakeClient(), FakeStore()
+    batcher = make_batcher(store, client)
+    batcher.submit(TOPIC.format('BIKE001'), payload(1), (1, 1))
+    batcher.submit(TOPIC.format('BIKE002'), payload(1), (2, 1))
+    batcher.flush_once(timeout=0)
+
+    # The worker died before its acks reached the broker: both come again,
+    # with new message ids, next to a new sample
+    batcher.submit(TOPIC.format('BIKE001'), payload(1), (3, 1))
+    batcher.submit(TOPIC.format('BIKE002'), payload(1), (4, 1))
+    batcher.submit(TOPIC.format('BIKE001'), payload(2, battery=79), (5, 1))
+    batcher.flush_once(timeout=0)
+
+    assert len(store.rows) == 3
+    assert batcher.written == 3
+    assert client.acks == [1, 2, 3, 4, 5]
+
+
+def test_worker_subscribes_with_qos1_and_manual_ack():
+    client, store = FakeClient(), FakeStore()
+    worker = make_worker(store, client)
+    worker.start()
+    try:
+        assert worker.manual_ack
+        assert client.subscriptions == [(mqtt_telemetry.TELEMETRY_TOPIC, 1)]
+    finally:
+        worker.stop()
+
+
+def test_stop_drains_before_stopping_the_network_loop():
+    client, store = FakeClient(), FakeStore(delay=0.05)
+    worker = make_worker(store, client)
+    worker.batcher.batch_size = 5
+    worker.start(connect=False)
+    for mid in range(1, 21):
+        client.deliver(TOPIC.format('BIKE001'), payload(mid), mid)
+
+    worker.stop()
+    assert len(store.rows) == 20
+    assert sorted(client.acks) == list(range(1, 21))
+    assert client.acks_after_loop_stop == []
+    assert not client.looping and not client.connected
+
+    # Messages arriving during shutdown are left to the broker
+    client.deliver(TOPIC.format('BIKE001'), payload(30), 30)
+    assert worker.batcher.pending() == 0
+    assert 30 not in client.acks
+